@@ -9,5 +9,6 @@ from __future__ import absolute_import, unicode_literals
 from kp_scrapers.cli.commands.export import export  # noqa
 from kp_scrapers.cli.commands.manage import create, delete  # noqa
 from kp_scrapers.cli.commands.misc import browse, check  # noqa
+from kp_scrapers.cli.commands.runner import batch_crawl  # noqa
 from kp_scrapers.cli.commands.schedule import batch_retire, batch_schedule, schedule, scrape  # noqa
 from kp_scrapers.cli.commands.tags import manage_tags  # noqa
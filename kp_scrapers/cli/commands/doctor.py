@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import click
 
 from kp_scrapers.cli.ui import fail, hr, info, success
@@ -17,8 +19,37 @@ def load_jobs(jobs_path, blacklist=None):
             yield job
 
 
+def index_by(dataset, key):
+    """Collect values of `key` across the dataset, for O(1) membership tests.
+
+    Examples:
+        >>> sorted(index_by([{'spider': 'Foo'}, {'spider': 'Bar'}, {'name': 'Buzz'}], 'spider'))
+        ['Bar', 'Foo']
+
+    """
+    return {item[key] for item in dataset if item.get(key) is not None}
+
+
 def lookup(dataset, value, key):
-    return value in list(map(lambda x: x.get(key), dataset))
+    # NOTE prefer `index_by` when looking up several values in the same dataset
+    return value in index_by(dataset, key)
+
+
+def load_periodic_jobs(project_id):
+    """Split Scrapinghub periodic jobs spiders into enabled and disabled ones.
+
+    Returns:
+        Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+
+    """
+    enabled_jobs, disabled_jobs = [], []
+    for job in shub.periodic_jobs(project_id).json().get('results', []):
+        if not job['disabled']:
+            enabled_jobs.extend(job.get('spiders'))
+        else:
+            disabled_jobs.extend(job.get('spiders'))
+
+    return enabled_jobs, disabled_jobs
 
 
 def _should_run(step, checks):
@@ -55,44 +86,52 @@ def _should_run(step, checks):
 def doctor(project_id, jobs_path, ignore, checks, filters):
     """Register several periodic jobs from a yaml conf."""
     info("loading local jobs path={}".format(jobs_path))
-    local_jobs = list(load_jobs(jobs_path, blacklist=['settings.yml']))
-
-    # TODO merge `sensible` table
-    info("loading airtable base table={}".format('Overview'))
-    records = list(kp_airtable.retrieve_all_records('Data Sourcing', 'Overview'))
-
-    info("loading Scrapinghub periodic jobs project={}".format(project_id))
-    shub_jobs = []
-    disabled_jobs = []
-    for job in shub.periodic_jobs(project_id).json().get('results', []):
-        if not job['disabled']:
-            shub_jobs.extend(job.get('spiders'))
-        else:
-            disabled_jobs.extend(job.get('spiders'))
+    scheduled = index_by(load_jobs(jobs_path, blacklist=['settings.yml']), 'spider')
 
     filteropts = ''
     for _filter in filters:
         filteropts += '--filter {} '.format(_filter)
     info("filtering spiders by attributes: {}".format(filters))
 
-    for spider in run_scrapy_command('describe', '{} --silent'.format(filteropts)):
+    # remote sources are independent, fetch them in the background while spiders are described
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        records, periodic_jobs = None, None
+        if _should_run('airtable', checks):
+            # TODO merge `sensible` table
+            info("loading airtable base table={}".format('Overview'))
+            records = pool.submit(
+                lambda: list(kp_airtable.retrieve_all_records('Data Sourcing', 'Overview'))
+            )
+        if _should_run('scrapinghub', checks):
+            info("loading Scrapinghub periodic jobs project={}".format(project_id))
+            periodic_jobs = pool.submit(load_periodic_jobs, project_id)
+
+        # NOTE scrapy installs signal handlers, it must run in the main thread
+        spiders = run_scrapy_command('describe', '{} --silent'.format(filteropts))
+
+        documented = index_by(records.result(), 'Name') if records else set()
+        shub_jobs, disabled_jobs = periodic_jobs.result() if periodic_jobs else ([], [])
+        shub_scheduled = index_by(shub_jobs, 'name')
+        shub_disabled = index_by(disabled_jobs, 'name')
+
+    for spider in spiders:
         if spider['name'] in ignore:
             info("ignoring spider {}".format(spider['name']))
             continue
 
         if _should_run('scheduling', checks):
-            if not lookup(local_jobs, value=spider['name'], key='spider'):
+            if spider['name'] not in scheduled:
                 fail("spider {name} is not scheduled locally".format(**spider))
 
         if _should_run('scrapinghub', checks):
-            if lookup(disabled_jobs, value=spider['name'], key='name'):
+            if spider['name'] in shub_disabled:
                 info("spider {name} is disabled on Scrapinghub".format(**spider))
-            elif not lookup(shub_jobs, value=spider['name'], key='name'):
+            elif spider['name'] not in shub_scheduled:
                 fail("spider {name} is not scheduled on Scrapinghub".format(**spider))
 
         if _should_run('airtable', checks) and spider.get('provider'):
             # TODO compare records['State'] with last job run
-            if not lookup(records, value=spider['provider'], key='Name'):
+            if spider['provider'] not in documented:
                 fail("spider {name} is not documented on Airtable".format(**spider))
 
         if _should_run('spider', checks):
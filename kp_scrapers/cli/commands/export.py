@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, unicode_literals
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 import csv
+import itertools
 import json
+import os
 
 import click
 
+from kp_scrapers.cli.sinks import open_sink
 from kp_scrapers.cli.ui import fail, info, success
 from kp_scrapers.cli.utils import fetch_jobs, has_scraped_data, search_opts
 from kp_scrapers.lib.services import shub
@@ -82,96 +87,178 @@ TRANSFORMERS = {
 }
 
 
-def csv_export(data, fd):
-    header = list(data[0].keys())
-    writer = csv.DictWriter(fd, fieldnames=header, delimiter=';')
-    writer.writeheader()
-    for row in data:
-        # writer.writerow({k: str(v) for k, v in row.items()})
-        writer.writerow(row)
+class Checkpoint(object):
+    """Track exported jobs so that an interrupted session resumes where it stopped.
 
+    Each line records a job whose rows were all written, the dedup keys it
+    contributed, and where the output sink stood after it.
 
-def jl_export(data, fd):
-    for row in data:
-        fd.write(json.dumps(row) + '\n')
+    """
+
+    def __init__(self, session_id, output):
+        self.path = os.path.join(
+            os.path.dirname(os.path.abspath(output)), '.{}.checkpoint.jl'.format(session_id)
+        )
+        self.done = set()
+        self.seen = set()
+        self.sink_state = None
+        self._fd = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, 'r') as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # interrupted while writing the last entry
+                    break
+                self.done.add(entry['job'])
+                self.seen.update(entry['keys'])
+                self.sink_state = entry['sink']
+
+    def save(self, job_key, keys, sink_state):
+        if self._fd is None:
+            self._fd = open(self.path, 'a')
+        self._fd.write(json.dumps({'job': job_key, 'keys': keys, 'sink': sink_state}) + '\n')
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+
+
+def download_job(job, markers):
+    """Fetch all items of a job, meant to run in a worker thread.
+
+    Returns:
+        Tuple[scrapinghub.client.jobs.Job, List[Dict]]: items are None if the job is useless
+
+    """
+    if not has_scraped_data(job):
+        return job, None
+
+    # tag it to remmeber we processed it (ETL style)
+    shub.update_tags(job, add=markers)
+    info("processing job {}".format(job.key))
+    return job, list(job.items.iter())
+
+
+def bounded_map(func, iterable, workers):
+    """Like `executor.map`, with at most `workers` tasks in flight.
+
+    `executor.map` would consume the whole (lazy, network backed) iterable
+    upfront. Futures are yielded in submission order, so that results are
+    processed in the order of the iterable whatever the one they complete in.
+
+    Yields:
+        concurrent.futures.Future:
+
+    """
+    iterator = iter(iterable)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(func, arg) for arg in itertools.islice(iterator, workers))
+        while pending:
+            oldest = pending.popleft()
+            wait([oldest])
+            for arg in itertools.islice(iterator, 1):
+                pending.append(pool.submit(func, arg))
+            yield oldest
 
 
 @click.command()
 @search_opts
 @click.option('-t', '--transform', type=click.Choice(TRANSFORMERS.keys()), default=None)
-@click.option('-o', '--output', default='export.csv', help='dump data into FILE')
+@click.option(
+    '-o', '--output', default='export.csv', help='dump data into FILE (csv, jl, sqlite, parquet)'
+)
 @click.option('-m', '--marker', 'markers', multiple=True, help="list of tags to add to the job")
 @click.option('-D', '--deduplicate-on', help="odler job limit to process")
 @click.option('-F', '--filter-file', help="only process item present in this csv")
 @click.option('-S', '--session-id', default=default_session_id())
 @click.option('-r', '--retry', help="resume session with the given id")
+@click.option('-w', '--workers', default=4, help="number of jobs fetched concurrently")
 def export(
-    spider, transform, output, markers, deduplicate_on, filter_file, session_id, retry, **opts
+    spider,
+    transform,
+    output,
+    markers,
+    deduplicate_on,
+    filter_file,
+    session_id,
+    retry,
+    workers,
+    **opts,
 ):
     """Export Scrapinghub items."""
+    checkpoint = Checkpoint(retry or session_id, output)
     if retry:
-        # TODO append to session file?
         info("resuming session `{}`".format(retry))
         session_id = retry
-        opts['skip_tags'].append(session_id)
+        if checkpoint.exists():
+            checkpoint.load()
+            info("skipping {} jobs already exported".format(len(checkpoint.done)))
+        else:
+            # no checkpoint to resume from, jobs tagged by the session are considered done
+            opts['skip_tags'] = list(opts['skip_tags']) + [session_id]
     else:
         info('starting session `{}`'.format(session_id))
 
     transform = TRANSFORMERS.get(transform) or noop
     markers = list(markers + DEFAULT_MARKERS + (session_id,))
-    raw_data = []
-    unique_keys = []
+    unique_keys = checkpoint.seen
     fails = 0
+    rows_count = 0
 
-    constraint_keys = []
+    constraint_keys = set()
     if filter_file:
         info("loading constraints file {}".format(filter_file))
         with open(filter_file) as csvfile:
             reader = csv.DictReader(csvfile)
-            constraint_keys = [row[deduplicate_on] for row in reader]
+            constraint_keys = {row[deduplicate_on] for row in reader}
 
     opts['spider'] = spider
-    for job in filter(has_scraped_data, fetch_jobs(**opts)):
-        try:
-            # tag it to remmeber we processed it (ETL style)
-            shub.update_tags(job, add=markers)
-
-            info("processing job {}".format(job.key))
-            for item in job.items.iter():
+    jobs = (job for job in fetch_jobs(**opts) if job.key not in checkpoint.done)
+
+    sink = open_sink(output, resume_from=checkpoint.sink_state)
+    complete = False
+    try:
+        for future in bounded_map(lambda job: download_job(job, markers), jobs, workers):
+            try:
+                job, items = future.result()
+            except Exception as e:
+                fail('fetching jobs crashed: {}, going on'.format(e))
+                # one might be able to resume execution with `--retry`
+                fails += 1
+                continue
+
+            job_keys = []
+            for item in items or []:
                 if deduplicate_on:
-                    if item[deduplicate_on] not in unique_keys:
-                        if constraint_keys:
-                            if item[deduplicate_on] in constraint_keys:
-                                # indivual items can be nested and store multiple types
-                                # so `transform` is a generic generator we consume here
-                                raw_data.extend([partial for partial in transform(item)])
-                                unique_keys.append(item[deduplicate_on])
-                        else:
-                            raw_data.extend([partial for partial in transform(item)])
-                            unique_keys.append(item[deduplicate_on])
-                else:
-                    raw_data.extend([partial for partial in transform(item)])
-        except Exception as e:
-            fail('fetching jobs crashed: {}, going on'.format(e))
-            # dumping the data we got so far
-            # one might be able to resume execution
-            # NOTE could dump data so far in output = '/tmp/' + session_id + '.' + output
-            fails += 1
-
-    success("done ({} exceptions), exporting data".format(fails))
-
-    if raw_data:
-        output_format = output.split('.')[-1]
-        success('exporting data raw={} to {}'.format(len(raw_data), output))
-
-        # TODO support sqlite
-        # TODO support stdout
-        # TODO support gdrive export - might be better to wait for anbother PR bringing
-        #      kp-gdrive and its high-level interface
-        with open(output, 'w') as fd:
-            if output_format == 'csv':
-                csv_export(raw_data, fd)
-            elif output_format == 'jl':
-                jl_export(raw_data, fd)
+                    key = item[deduplicate_on]
+                    if key in unique_keys or (constraint_keys and key not in constraint_keys):
+                        continue
+                    unique_keys.add(key)
+                    job_keys.append(key)
+
+                # indivual items can be nested and store multiple types
+                # so `transform` is a generic generator we consume here
+                for partial in transform(item):
+                    sink.write(partial)
+                    rows_count += 1
+
+            checkpoint.save(job.key, job_keys, sink.commit())
+
+        complete = True
+    finally:
+        sink.close(complete=complete)
+        checkpoint.close()
+
+    success("done ({} exceptions)".format(fails))
+    if rows_count:
+        success('exported data raw={} to {}'.format(rows_count, output))
     else:
         fail("no data was fetched")
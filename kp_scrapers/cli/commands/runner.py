@@ -0,0 +1,399 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Run the spiders of scheduling files concurrently, outside Scrapinghub.
+
+Every job crawls in its own process, so that a spider crashing, leaking
+memory or hanging cannot take the batch down, and so that every job gets a
+fresh Twisted reactor. Project settings and spider modules are loaded once in
+the parent: on platforms supporting `fork`, jobs start from this warmed-up
+process instead of paying interpreter and settings startup each time.
+
+Limits are enforced twice:
+
+- softly, by Scrapy itself with `MEMUSAGE_LIMIT_MB` and `CLOSESPIDER_TIMEOUT`,
+  so that the spider closes cleanly and its stats are collected
+- hard, by the runner killing jobs that use `HARD_LIMIT_FACTOR` times more
+  memory or still run `GRACE_PERIOD` seconds after their timeout
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+from collections import deque, namedtuple
+import datetime as dt
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import click
+
+from kp_scrapers.cli.commands.schedule import render_args
+from kp_scrapers.cli.ui import fail, info, success
+from kp_scrapers.cli.utils import walk_configs
+
+
+# default limits of a job
+MEMORY_MB = 1024
+TIMEOUT = 3600
+
+# jobs are killed past their soft limits by that much
+HARD_LIMIT_FACTOR = 1.5
+GRACE_PERIOD = 120
+
+# seconds between two checks of running jobs
+POLL_INTERVAL = 0.5
+
+Job = namedtuple('Job', ('spider', 'args', 'settings'))
+
+
+def load_batch(configs, spiders=None):
+    """Expand scheduling configurations into jobs, one per argument combination.
+
+    Examples:
+        >>> conf = {'global_settings': {'KP_ENV': 'test'}, 'jobs': [
+        ...     {'spider': 'Foo', 'args': {'a': 1}, 'dynamic_args': {'b': '[1, 2]'}},
+        ...     {'spider': 'Bar', 'disabled': True},
+        ...     {'spider': 'Buzz', 'settings': {'CRAWLERA_ENABLED': True}}]}
+        >>> [(job.spider, job.args) for job in load_batch([conf])]
+        [('Foo', {'b': 1, 'a': 1}), ('Foo', {'b': 2, 'a': 1}), ('Buzz', {})]
+        >>> load_batch([conf], spiders=['Buzz'])[0].settings
+        {'CRAWLERA_ENABLED': True, 'KP_ENV': 'test'}
+
+    """
+    jobs = []
+    for specs in configs:
+        g_settings = specs.get('global_settings', {})
+        for job_spec in specs['jobs']:
+            if spiders and job_spec['spider'] not in spiders:
+                continue
+            if job_spec.get('disabled'):
+                continue
+
+            settings = {**job_spec.get('settings', {}), **g_settings}
+            for combination in render_args(job_spec.get('dynamic_args', {})):
+                combination.update(job_spec.get('args', {}))
+                jobs.append(Job(job_spec['spider'], combination, settings))
+
+    return jobs
+
+
+def available_memory_mb():
+    """Memory available for new processes, None if unknown."""
+    try:
+        with open('/proc/meminfo') as fd:
+            for line in fd:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, OSError):
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def pool_size(memory_mb, cpus=None, available_mb=None):
+    """Run as many jobs as CPUs, as long as their memory limits fit in memory.
+
+    Examples:
+        >>> pool_size(1024, cpus=8, available_mb=4096)
+        4
+        >>> pool_size(1024, cpus=2, available_mb=None)
+        2
+        >>> pool_size(4096, cpus=2, available_mb=1024)
+        1
+
+    """
+    cpus = cpus or os.cpu_count() or 1
+    if not available_mb:
+        return cpus
+    return max(1, min(cpus, available_mb // memory_mb))
+
+
+def rss_mb(pid):
+    """Resident memory of a process, None if unknown (only supported on Linux)."""
+    try:
+        with open('/proc/{}/status'.format(pid)) as fd:
+            for line in fd:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) // 1024
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _jsonable(stats):
+    # leave out objects that cannot be pickled or dumped, like `spider_attribute_stats`
+    return {
+        key: value.isoformat() if isinstance(value, dt.datetime) else value
+        for key, value in stats.items()
+        if isinstance(value, (bool, int, float, str, dt.datetime))
+    }
+
+
+def _resolve(settings):
+    resolved = {}
+    for key, value in settings.items():
+        if isinstance(value, dict) and 'secret' in value:
+            # same convention as `batch-schedule`
+            from kp_scrapers import vault  # noqa
+
+            value = eval(value['secret'])
+        resolved[key] = value
+    return resolved
+
+
+def crawl(job, settings, conn):
+    """Crawl a job in the current process and send its outcome, the entrypoint of jobs."""
+    result = {'reason': None, 'stats': {}}
+    try:
+        from scrapy.crawler import CrawlerProcess
+        from scrapy.utils.project import get_project_settings
+
+        project_settings = get_project_settings()
+        project_settings.setdict(_resolve(job.settings), priority='cmdline')
+        project_settings.setdict(settings, priority='cmdline')
+
+        process = CrawlerProcess(project_settings)
+        crawler = process.create_crawler(job.spider)
+        # errors while setting the crawler up only show on the deferred
+        process.crawl(crawler, **job.args).addErrback(
+            lambda failure: result.update(error=failure.getTraceback())
+        )
+        process.start()
+
+        result['stats'] = _jsonable(crawler.stats.get_stats() if crawler.stats else {})
+        result['reason'] = result['stats'].get('finish_reason')
+    except Exception:
+        result['error'] = traceback.format_exc(limit=5)
+    conn.send(result)
+    conn.close()
+
+
+def _warm_up(jobs):
+    """Load settings and spiders once, return spiders that do not exist."""
+    from scrapy.spiderloader import SpiderLoader
+    from scrapy.utils.misc import load_object
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    loader = load_object(settings.get('SPIDER_LOADER_CLASS') or SpiderLoader)
+    loader = loader.from_settings(settings.frozencopy())
+
+    unknown = set()
+    for spider in {job.spider for job in jobs}:
+        try:
+            loader.load(spider)
+        except KeyError:
+            unknown.add(spider)
+    return unknown
+
+
+def _context():
+    # a reactor installed in the parent would be shared by forked jobs
+    if 'fork' in multiprocessing.get_all_start_methods():
+        if 'twisted.internet.reactor' not in sys.modules:
+            return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('spawn')
+
+
+class BatchRunner(object):
+    """Run jobs in a pool of processes, see module documentation.
+
+    Args:
+        jobs (List[Job]):
+        workers (int): jobs running at the same time
+        memory_mb (int): memory limit of a job
+        timeout (int): time limit of a job, in seconds
+        log_dir (str): where to write logs of every job, in the console if None
+        target (callable): function crawling a job, for tests
+
+    """
+
+    def __init__(
+        self,
+        jobs,
+        workers,
+        memory_mb=MEMORY_MB,
+        timeout=TIMEOUT,
+        log_dir=None,
+        grace=GRACE_PERIOD,
+        target=crawl,
+    ):
+        self.jobs = jobs
+        self.workers = workers
+        self.memory_mb = memory_mb
+        self.timeout = timeout
+        self.log_dir = log_dir
+        self.grace = grace
+        self.target = target
+        self.context = _context()
+
+    def job_settings(self, index, job):
+        settings = {
+            'MEMUSAGE_ENABLED': True,
+            'MEMUSAGE_LIMIT_MB': self.memory_mb,
+            'CLOSESPIDER_TIMEOUT': self.timeout,
+        }
+        if self.log_dir:
+            name = '{:03d}-{}.log'.format(index, job.spider)
+            settings['LOG_FILE'] = os.path.join(self.log_dir, name)
+        return settings
+
+    def run(self, unknown=()):
+        """Run every job, return their outcome in the order of jobs."""
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+
+        results = [None] * len(self.jobs)
+        pending = deque(enumerate(self.jobs))
+        running = {}
+        while pending or running:
+            while pending and len(running) < self.workers:
+                index, job = pending.popleft()
+                if job.spider in unknown:
+                    results[index] = self._result(job, 'failed', error='unknown spider')
+                    continue
+                running[index] = self._start(index, job)
+
+            time.sleep(POLL_INTERVAL)
+            for index in list(running):
+                result = self._check(self.jobs[index], *running[index])
+                if result is not None:
+                    results[index] = result
+                    del running[index]
+
+        return results
+
+    def _start(self, index, job):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=self.target,
+            args=(job, self.job_settings(index, job), sender),
+            name='crawl-{}'.format(job.spider),
+        )
+        process.start()
+        # only the child writes, so that reads fail once it exited
+        sender.close()
+        info('started {} {} (pid {})'.format(job.spider, job.args, process.pid))
+        return process, receiver, time.time(), {}
+
+    def _check(self, job, process, receiver, started, outcome):
+        """Collect the outcome of a job once it exited, kill it past its hard limits."""
+        if receiver.poll():
+            try:
+                outcome.update(receiver.recv())
+            except EOFError:
+                pass
+
+        duration = time.time() - started
+        if process.is_alive():
+            memory = rss_mb(process.pid)
+            if duration > self.timeout + self.grace:
+                killed = 'timeout'
+            elif memory and memory > self.memory_mb * HARD_LIMIT_FACTOR:
+                killed = 'memory'
+            else:
+                return None
+
+            getattr(process, 'kill', process.terminate)()
+            process.join()
+            receiver.close()
+            return self._result(job, 'killed', reason=killed, duration=duration)
+
+        process.join()
+        receiver.close()
+        if 'reason' not in outcome:
+            # died without a word, likely segfault, OOM killer or `os._exit`
+            return self._result(job, 'crashed', exit_code=process.exitcode, duration=duration)
+
+        return self._result(
+            job,
+            'finished' if outcome['reason'] == 'finished' else 'failed',
+            reason=outcome['reason'],
+            stats=outcome.get('stats'),
+            error=outcome.get('error'),
+            exit_code=process.exitcode,
+            duration=duration,
+        )
+
+    @staticmethod
+    def _result(job, status, reason=None, stats=None, error=None, exit_code=None, duration=0):
+        stats = stats or {}
+        return {
+            'spider': job.spider,
+            'args': job.args,
+            'status': status,
+            'reason': reason,
+            'exit_code': exit_code,
+            'duration': round(duration, 1),
+            'items': stats.get('item_scraped_count', 0),
+            'errors': stats.get('log_count/ERROR', 0),
+            'error': error,
+            'stats': stats,
+        }
+
+
+def summarize(results):
+    """Count jobs by status.
+
+    Examples:
+        >>> summarize([{'status': 'finished'}, {'status': 'crashed'}, {'status': 'finished'}])
+        {'total': 3, 'finished': 2, 'crashed': 1}
+
+    """
+    summary = {'total': len(results)}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+
+@click.command('batch-crawl')
+@click.option('-c', '--config', 'conf_files', multiple=True, default=None)
+@click.option('-R', '--root-conf', default=None)
+@click.option('-s', '--spider', 'spiders', multiple=True, default=None)
+@click.option('-w', '--workers', type=int, default=None, help='default to CPUs fitting in memory')
+@click.option('-m', '--memory', 'memory_mb', type=int, default=MEMORY_MB, help='MB per job')
+@click.option('-t', '--timeout', type=int, default=TIMEOUT, help='seconds per job')
+@click.option('-l', '--log-dir', default=None, help='one log file per job')
+@click.option('-o', '--output', default=None, help='json summary path')
+@click.option('--dry-run', is_flag=True)
+def batch_crawl(
+    conf_files, root_conf, spiders, workers, memory_mb, timeout, log_dir, output, dry_run
+):
+    """Crawl spiders of scheduling files locally, several at a time."""
+    if not (conf_files or root_conf):
+        fail('Please specify scheduling files or directory.')
+        sys.exit(1)
+
+    configs = walk_configs(conf_root=root_conf, paths=conf_files, blacklist=['settings.yml'])
+    jobs = load_batch(configs, spiders=spiders)
+    workers = workers or pool_size(memory_mb, available_mb=available_memory_mb())
+    info(f'{len(jobs)} jobs to crawl with {workers} workers')
+    if dry_run:
+        for job in jobs:
+            info(f'{job.spider} {job.args}')
+        return
+
+    unknown = _warm_up(jobs)
+    results = BatchRunner(jobs, workers, memory_mb, timeout, log_dir=log_dir).run(unknown)
+
+    for result in results:
+        line = '{status:>8} {spider} {args} in {duration}s: {items} items, {errors} errors'.format(
+            **result
+        )
+        if result['status'] == 'finished':
+            success(line)
+        else:
+            fail('{} ({})'.format(line, result['reason'] or result['error'] or result['exit_code']))
+
+    summary = summarize(results)
+    info(' '.join(f'{status}={count}' for status, count in summary.items()))
+    if output:
+        with open(output, 'w') as fd:
+            json.dump({'summary': summary, 'jobs': results}, fd, indent=2, default=str)
+
+    sys.exit(0 if summary.get('finished', 0) == len(results) else 1)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental output sinks for cli exports.
+
+Rows are written as they come instead of being accumulated in memory, and
+every sink can tell where it stands (`commit`) so that an interrupted export
+can resume from that point without duplicating or losing rows. Sinks are
+closed with `complete=False` when the export was interrupted.
+
+Supported formats are picked from the output extension:
+
+- `csv`: `;` delimited, one column per key found in any row
+- `jl`: json lines
+- `sqlite` / `db`: a single `items` table, one TEXT column per key
+- `parquet` / `feather`: one string column per key found in any row
+
+`csv`, `parquet` and `feather` rows are staged as json lines, then converted
+in batches when the sink is closed, once all keys are known.
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+import csv
+import json
+import logging
+import os
+import sqlite3
+
+
+logger = logging.getLogger(__name__)
+
+
+# rows per record batch when converting staged rows to columnar formats
+COLUMNAR_BATCH_SIZE = 50000
+
+
+class JlSink(object):
+    """Write json lines, resumable at byte offset granularity."""
+
+    def __init__(self, path, resume_from=None):
+        self.path = path
+        self._fd = open(path, 'a' if resume_from else 'w')
+        if resume_from:
+            # forget whatever was written after the last commit
+            self._fd.truncate(resume_from)
+        self._fd.seek(0, os.SEEK_END)
+
+    def write(self, row):
+        self._fd.write(json.dumps(row) + '\n')
+
+    def commit(self):
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+        return self._fd.tell()
+
+    def close(self, complete=True):
+        self._fd.close()
+
+
+class SqliteSink(object):
+    """Store rows in an `items` table, columns are added as new keys show up.
+
+    Values that are not scalars are stored as json. Every commit is a
+    transaction, so rows written after the last commit are rolled back.
+
+    """
+
+    TABLE = 'items'
+
+    def __init__(self, path, resume_from=None):
+        self.path = path
+        if not resume_from and os.path.exists(path):
+            os.remove(path)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS {} (_rowid INTEGER PRIMARY KEY)'.format(self.TABLE)
+        )
+        self._columns = [
+            column[1] for column in self._conn.execute('PRAGMA table_info({})'.format(self.TABLE))
+        ]
+
+    @staticmethod
+    def _quote(name):
+        return '"{}"'.format(name.replace('"', '""'))
+
+    @staticmethod
+    def _to_sql(value):
+        if value is None or isinstance(value, (str, int, float)):
+            return value
+        return json.dumps(value)
+
+    def write(self, row):
+        for key in row:
+            if key not in self._columns:
+                self._conn.execute(
+                    'ALTER TABLE {} ADD COLUMN {} TEXT'.format(self.TABLE, self._quote(key))
+                )
+                self._columns.append(key)
+
+        self._conn.execute(
+            'INSERT INTO {} ({}) VALUES ({})'.format(
+                self.TABLE, ', '.join(map(self._quote, row)), ', '.join('?' * len(row))
+            ),
+            [self._to_sql(value) for value in row.values()],
+        )
+
+    def commit(self):
+        self._conn.commit()
+        return True
+
+    def close(self, complete=True):
+        # uncommitted rows are rolled back
+        self._conn.close()
+
+
+class ColumnarSink(JlSink):
+    """Stage rows as json lines and convert them to parquet or feather on close.
+
+    Columnar files can't be appended to, nor read if the process died before
+    writing their footer. Staging keeps the export resumable and lets columns
+    cover keys of every row, the conversion then reads staged rows back in
+    batches to keep memory bounded.
+
+    """
+
+    def __init__(self, path, resume_from=None, fmt='parquet'):
+        self.output = path
+        self.fmt = fmt
+        super().__init__(path + '.staging.jl', resume_from=resume_from)
+
+    def close(self, complete=True):
+        super().close()
+        # keep staged rows around to resume an interrupted export
+        if complete:
+            self._convert()
+            os.remove(self.path)
+
+    def _batches(self):
+        batch = []
+        with open(self.path, 'r') as fd:
+            for line in fd:
+                batch.append(json.loads(line))
+                if len(batch) >= COLUMNAR_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _columns(self):
+        """Keys of all staged rows, in order of appearance."""
+        columns = {}
+        for batch in self._batches():
+            for row in batch:
+                columns.update(dict.fromkeys(row))
+        return list(columns)
+
+    def _convert(self):
+        # heavy and only needed here
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer, columns = None, self._columns()
+        try:
+            for batch in self._batches():
+                # cast everything to string so that heterogeneous items share a schema
+                table = pa.Table.from_arrays(
+                    [
+                        pa.array([_to_text(row.get(column)) for row in batch], type=pa.string())
+                        for column in columns
+                    ],
+                    names=columns,
+                )
+                if writer is None:
+                    if self.fmt == 'parquet':
+                        writer = pq.ParquetWriter(self.output, table.schema)
+                    else:
+                        writer = pa.RecordBatchFileWriter(self.output, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+class CsvSink(ColumnarSink):
+    """Stage rows as json lines and convert them to `;` delimited csv on close.
+
+    The header is only known once every row has been seen, keys missing from
+    a row are left empty.
+
+    """
+
+    def __init__(self, path, resume_from=None):
+        super().__init__(path, resume_from=resume_from, fmt='csv')
+
+    def _convert(self):
+        columns = self._columns()
+        with open(self.output, 'w') as fd:
+            writer = csv.DictWriter(fd, fieldnames=columns, delimiter=';')
+            writer.writeheader()
+            for batch in self._batches():
+                writer.writerows(batch)
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+SINKS = {
+    'csv': CsvSink,
+    'jl': JlSink,
+    'sqlite': SqliteSink,
+    'db': SqliteSink,
+    'parquet': lambda path, resume_from=None: ColumnarSink(path, resume_from, fmt='parquet'),
+    'feather': lambda path, resume_from=None: ColumnarSink(path, resume_from, fmt='feather'),
+}
+
+
+def open_sink(path, resume_from=None):
+    """Pick a sink from the output extension.
+
+    Args:
+        path (str): output file
+        resume_from (*): value returned by the sink last `commit`, if resuming
+
+    """
+    output_format = path.split('.')[-1]
+    if output_format not in SINKS:
+        raise ValueError('unsupported output format: {}'.format(output_format))
+
+    return SINKS[output_format](path, resume_from=resume_from)
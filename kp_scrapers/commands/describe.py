@@ -1,10 +1,150 @@
 from __future__ import absolute_import, print_function, unicode_literals
+import hashlib
+import importlib.util
 import json
+import logging
+import os
 from pprint import pprint as pp
 
 from scrapy.commands import ScrapyCommand
 
 
+logger = logging.getLogger(__name__)
+
+
+# bump it whenever the format of spider metas changes
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'spiders.manifest.json'
+)
+
+
+def _module_path(module):
+    """Locate a module directory without importing it (only its top-level package)."""
+    parts = module.split('.')
+    spec = importlib.util.find_spec(parts[0])
+    return os.path.join(os.path.dirname(spec.origin), *parts[1:])
+
+
+def sources_fingerprint(modules):
+    """Hash location, size and mtime of every source file the spiders can be defined in.
+
+    Only `stat` calls are needed, which makes it cheap enough to run before
+    every `describe`. Common parent of `modules` is scanned so that shared
+    bases (i.e. `kp_scrapers.spiders.bases`) invalidate the manifest too.
+
+    Args:
+        modules (List[str]): dotted spider modules, i.e. `SPIDER_MODULES`
+
+    Returns:
+        str:
+
+    """
+    paths = [_module_path(module) for module in modules]
+    root = os.path.commonpath(paths) if len(paths) > 1 else paths[0]
+
+    digest = hashlib.sha1(str(MANIFEST_VERSION).encode())
+    for directory, dirs, files in sorted(os.walk(root)):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith('.py'):
+                continue
+
+            stat = os.stat(os.path.join(directory, filename))
+            relpath = os.path.relpath(os.path.join(directory, filename), root)
+            digest.update(f'{relpath}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+
+    return digest.hexdigest()
+
+
+def load_manifest(path, fingerprint):
+    """Load spider metas if they were computed from the current sources."""
+    try:
+        with open(path, 'r') as fd:
+            manifest = json.load(fd)
+    except (IOError, ValueError):
+        return None
+
+    if manifest.get('fingerprint') != fingerprint:
+        return None
+
+    return manifest.get('spiders')
+
+
+def save_manifest(path, fingerprint, metas):
+    # write then rename, so that concurrent runs never read a partial manifest
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as fd:
+            json.dump({'fingerprint': fingerprint, 'spiders': metas}, fd)
+        os.replace(tmp_path, path)
+    except (IOError, OSError) as e:
+        # read-only deployments just don't benefit from the cache
+        logger.warning('unable to save spiders manifest at %s: %s', path, e)
+
+
+def describe_spider(spider):
+    """Extract machine-readable information from a spider class."""
+    # TODO fix all spiders. This hacky skip is meant to be removed
+    # FIXME customs overwrite the `commodities` function
+    try:
+        commodities = spider.commodities()
+    except (NotImplementedError, AttributeError, TypeError):
+        commodities = []
+
+    try:
+        category = spider.category()
+    except (NotImplementedError, AttributeError):
+        category = 'unknown'
+
+    # NOTE we don't filter over `args` and `kwargs` as they represent
+    # an hint that more arguments can be received
+    spider_cli = [
+        init_arg for init_arg in spider.__init__.__code__.co_varnames if init_arg not in ['self']
+    ]
+
+    # output machine-readable information (hence the casting)
+    return {
+        '_type': 'spider',
+        'doc': spider.__doc__ or spider.__init__.__doc__,
+        'cli_options': spider_cli,
+        'name': spider.name,
+        'version': spider.version if isinstance(spider.version, str) else None,
+        # usually not implemented by the spider and then this is a type `property`
+        'provider': spider.provider if isinstance(spider.provider, str) else None,
+        'produces': spider.produces if isinstance(spider.produces, list) else None,
+        # extracting pdf document currently requires Tabula, a java
+        # project, to be installed
+        'need_java': hasattr(spider, 'extract_pdf_table'),
+        'category': category,
+        'commodities': list(commodities),
+        # the `DeprecatedMixin` set this attribute to true
+        'enabled': not getattr(spider, 'deprecated', False),
+    }
+
+
+def match_filters(metas, filters):
+    """Check spider metas against `k:v` filters.
+
+    Examples:
+        >>> match_filters({'name': 'Foo', 'enabled': True}, ['enabled:true'])
+        True
+        >>> match_filters({'name': 'Foo', 'commodities': ['lng']}, ['commodities:oil'])
+        False
+
+    """
+    for _filter in filters:
+        k, v = _filter.split(':')
+        if k in ('category', 'name') and v != metas.get(k):
+            return False
+        elif k in ('commodities', 'produces') and v not in (metas.get(k) or []):
+            return False
+        elif k in ('enabled', 'need_java') and v.title() != str(metas.get(k)):
+            return False
+
+    return True
+
+
 class Command(ScrapyCommand):
 
     requires_project = True
@@ -22,6 +162,24 @@ class Command(ScrapyCommand):
         loader = self.crawler_process.spider_loader.load
         return list(map(lambda s: loader(s), spider_names))
 
+    def all_spider_metas(self, refresh=False):
+        """Describe every spider of the project.
+
+        Importing all spiders (and their heavy dependencies) takes seconds, so
+        results are cached in a manifest, invalidated as soon as a spider
+        source file changes.
+
+        """
+        path = self.settings.get('SPIDERS_MANIFEST_PATH', DEFAULT_MANIFEST_PATH)
+        fingerprint = sources_fingerprint(self.settings.getlist('SPIDER_MODULES'))
+
+        metas = None if refresh else load_manifest(path, fingerprint)
+        if metas is None:
+            metas = [describe_spider(spider) for spider in self.spider_klasses]
+            save_manifest(path, fingerprint, metas)
+
+        return metas
+
     def add_options(self, parser):
         ScrapyCommand.add_options(self, parser)
         # TODO support multiple filters
@@ -43,6 +201,12 @@ class Command(ScrapyCommand):
             "--prettify", default=False, action="store_true", help="Pretty print output"
         )
         parser.add_option("--export", default=None, help="results output redirection")
+        parser.add_option(
+            "--refresh",
+            default=False,
+            action="store_true",
+            help="ignore spiders manifest and inspect spider classes",
+        )
 
     def run(self, args, opts):
         # Scrapy doesn't support a generator as a `run` function for commands,
@@ -51,74 +215,13 @@ class Command(ScrapyCommand):
 
         spiders_constraint = args if len(args) else []
 
-        for spider in self.spider_klasses:
-            if spiders_constraint and spider.name not in spiders_constraint:
+        for spider_metas in self.all_spider_metas(refresh=opts.refresh):
+            if spiders_constraint and spider_metas['name'] not in spiders_constraint:
                 continue
 
-            # TODO fix all spiders. This hacky skip is meant to be removed
-            # FIXME customs overwrite the `commodities` function
-            try:
-                commodities = spider.commodities()
-            except (NotImplementedError, AttributeError, TypeError):
-                commodities = []
-
-            data_types = spider.produces
-            if not isinstance(data_types, list):
-                # usually not implemented by the spider and then this is a type `property`
-                data_types = []
-
-            try:
-                category = spider.category()
-            except (NotImplementedError, AttributeError):
-                category = 'unknown'
-
-            # the `DeprecatedMixin` set this attribute to true
-            enabled = not getattr(spider, 'deprecated', False)
-            need_java = hasattr(spider, 'extract_pdf_table')
-
-            ignore = False
-            for filters in opts.filter:
-                k, v = filters.split(':')
-                if k == 'category' and v != category:
-                    ignore = True
-                elif k == 'name' and v != spider.name:
-                    ignore = True
-                elif k == 'commodities' and v not in commodities:
-                    ignore = True
-                elif k == 'produces' and v not in data_types:
-                    ignore = True
-                elif k == 'enabled' and v.title() != str(enabled):
-                    ignore = True
-                elif k == 'need_java' and v.title() != str(need_java):
-                    ignore = True
-            if ignore:
+            if not match_filters(spider_metas, opts.filter):
                 continue
 
-            # NOTE we don't filter over `args` and `kwargs` as they represent
-            # an hint that more arguments can be received
-            spider_cli = [
-                init_arg
-                for init_arg in spider.__init__.__code__.co_varnames
-                if init_arg not in ['self']
-            ]
-
-            # output machine-readable information (hence the casting)
-            spider_metas = {
-                '_type': 'spider',
-                'doc': spider.__doc__ or spider.__init__.__doc__,
-                'cli_options': spider_cli,
-                'name': spider.name,
-                'version': spider.version if isinstance(spider.version, str) else None,
-                'provider': spider.provider if isinstance(spider.provider, str) else None,
-                'produces': spider.produces if isinstance(spider.produces, list) else None,
-                # extracting pdf document currently requires Tabula, a java
-                # project, to be installed
-                'need_java': need_java,
-                'category': category,
-                'commodities': list(commodities),
-                'enabled': enabled,
-            }
-
             # either it goes on stdout or we expose it for programs
             if not opts.silent:
                 if opts.prettify:
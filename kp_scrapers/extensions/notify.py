@@ -1,9 +1,24 @@
-"""Notify slack channels on relevant events."""
+"""Notify slack channels on relevant events.
 
+Messages are delivered in a thread, so that a slow or unreachable Slack never
+blocks the reactor, with a timeout and a few retries.
+
+Errors raised by callbacks are aggregated along the job: they are counted by
+status and error type, and by url pattern if `NOTIFY_ERROR_URLS` is set (off by
+default, to keep sources confidential), the most frequent ones being reported
+once the job is done.
+
+"""
+
+from collections import Counter
 import logging
+import re
+import time
+from urllib.parse import urlparse
 
 from scrapy import signals
 from scrapy.exceptions import NotConfigured
+from twisted.internet.threads import deferToThread
 
 from kp_scrapers.cli.ui import ERROR_COLOR, SUCCESS_COLOR
 from kp_scrapers.lib.services import shub, slack
@@ -12,13 +27,137 @@ from kp_scrapers.lib.utils import response_to_dict
 
 logger = logging.getLogger(__name__)
 
+# delivery defaults, in seconds
+TIMEOUT = 10
+RETRIES = 2
+BACKOFF = 2
+
+# distinct errors listed in the summary, others are only counted
+MAX_ERRORS = 10
+
+# url path segments replaced when building patterns: numbers and long hex/base64 identifiers
+_VOLATILE_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F-]{16,}|[\w-]{32,})$')
+
+
+def url_pattern(url):
+    """Reduce an url to a pattern, so that errors on similar pages add up.
+
+    Examples:
+        >>> url_pattern('https://api.example.com/vessels/9465411/positions?page=3')
+        'api.example.com/vessels/{id}/positions'
+        >>> url_pattern('http://example.com/')
+        'example.com/'
+
+    """
+    parsed = urlparse(url)
+    path = '/'.join(
+        '{id}' if _VOLATILE_SEGMENT.match(segment) else segment
+        for segment in parsed.path.split('/')
+    )
+    return f'{parsed.hostname}{path or "/"}'
+
+
+class ErrorSummary(object):
+    """Count errors by kind, keeping at most `limit` distinct kinds.
+
+    Examples:
+        >>> summary = ErrorSummary(limit=2)
+        >>> for status in (500, 500, 404, 403):
+        ...     summary.add(status, 'HttpError')
+        >>> summary.most_common(), summary.total, summary.overflow
+        ([('500 HttpError', 2), ('404 HttpError', 1)], 4, 1)
+
+    """
+
+    def __init__(self, limit=MAX_ERRORS):
+        self.limit = limit
+        self.counts = Counter()
+        self.total = 0
+        # errors of kinds not tracked because the limit was reached
+        self.overflow = 0
+
+    def __bool__(self):
+        return self.total > 0
+
+    def add(self, status, error, url=None):
+        self.total += 1
+        kind = ' '.join(str(part) for part in (status, error, url) if part)
+        if kind in self.counts or len(self.counts) < self.limit:
+            self.counts[kind] += 1
+        else:
+            self.overflow += 1
+
+    def most_common(self):
+        return self.counts.most_common()
+
+    def attachment(self):
+        lines = [f'{count} × {kind}' for kind, count in self.most_common()]
+        if self.overflow:
+            lines.append(f'{self.overflow} × other errors')
+        return {
+            'title': f'{self.total} errors',
+            'text': '\n'.join(lines),
+            'color': ERROR_COLOR,
+        }
+
+
+class SlackDispatcher(object):
+    """Deliver messages in a thread, retrying on errors or timeouts.
+
+    Messages go through `SLACK_WEBHOOK_URL` if set, or the web api otherwise.
+
+    """
+
+    def __init__(self, webhook_url=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+        self.webhook_url = webhook_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def dispatch(self, msg, attachments=None):
+        """Send a message off the reactor.
+
+        Returns:
+            twisted.internet.defer.Deferred: fires with the slack response once delivered
+
+        """
+        d = deferToThread(self._deliver, msg, attachments)
+        d.addErrback(self._failed)
+        return d
+
+    def _post(self, msg, attachments):
+        if self.webhook_url:
+            return slack.post_webhook(
+                self.webhook_url, msg, attachments=attachments, timeout=self.timeout
+            )
+        return slack.send(msg, attachments=attachments, timeout=self.timeout)
+
+    def _deliver(self, msg, attachments):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                res = self._post(msg, attachments)
+            except Exception as exc:
+                res = {'ok': False, 'error': repr(exc)}
+            if res.get('ok'):
+                return res
+            logger.warning(f'failed to notify (attempt {attempt + 1}): {res.get("error")}')
+
+        logger.error(f'failed to notify: {res.get("error")}')
+        return res
+
+    @staticmethod
+    def _failed(failure):
+        logger.error(f'failed to notify: {failure.getErrorMessage()}')
+
 
 class NotifyMiddleware(object):
     """Notify configured channel of job output.
 
     The extension depends on the Slack service so make sure to configure:
 
-            `SLACK_TOKEN` (mandatory)
+            `SLACK_TOKEN` or `SLACK_WEBHOOK_URL` (mandatory)
             `SLACK_CHANNEL` (optional)
 
     In addition you can customize the following parameters:
@@ -27,20 +166,31 @@ class NotifyMiddleware(object):
             `NOTIFY_SOMEONE` - ping analyst on Slack, separated by `;`
             `NOTIFY_DEV_IN_CHARGE` - ping technical maintainer of the scraping project
             `NOTIFY_ON_NO_DATA` - prevent messages to be sent if no data AND no errors
+            `NOTIFY_TIMEOUT`, `NOTIFY_RETRIES` - delivery attempts, and their timeout
+            `NOTIFY_MAX_ERRORS` - distinct errors listed in the message
+            `NOTIFY_ERROR_URLS` - group errors by url pattern, exposing urls on Slack
 
     """
 
     def __init__(self, settings):
-        self._failure = None
+        self.errors = ErrorSummary(limit=settings.getint('NOTIFY_MAX_ERRORS', MAX_ERRORS))
+        self.error_urls = settings.getbool('NOTIFY_ERROR_URLS')
         self.notify_on_no_items = settings.get('NOTIFY_ON_NO_DATA')
         self.analyst_in_charge = settings.get('NOTIFY_SOMEONE')
         self.dev_in_charge = settings.get('NOTIFY_DEV_IN_CHARGE')
+        self.dispatcher = SlackDispatcher(
+            webhook_url=settings.get('SLACK_WEBHOOK_URL'),
+            timeout=settings.getfloat('NOTIFY_TIMEOUT', TIMEOUT),
+            retries=settings.getint('NOTIFY_RETRIES', RETRIES),
+        )
 
     @classmethod
     def from_crawler(cls, crawler):
         if str(crawler.settings.get('NOTIFY_ENABLED')) != 'True':
             raise NotConfigured('Slack extension is disabled')
-        if not crawler.settings.get('SLACK_TOKEN'):
+        if not crawler.settings.get('SLACK_TOKEN') and not crawler.settings.get(
+            'SLACK_WEBHOOK_URL'
+        ):
             raise NotConfigured("no api token found")
 
         ext = cls(crawler.settings)
@@ -50,18 +200,21 @@ class NotifyMiddleware(object):
 
         return ext
 
-    @staticmethod
-    def _notify(msg, **kwargs):
-        res = slack.send(msg, **kwargs)
-        if not res.get('ok'):
-            logger.error(f'failed to notify: {res.get("error")}')
+    def _notify(self, msg, attachments=None):
+        return self.dispatcher.dispatch(msg, attachments=attachments)
 
     def spider_closed(self, spider):
+        """Send a summary of the job.
+
+        Returns:
+            Optional[twisted.internet.defer.Deferred]: delivery, awaited before the job ends
+
+        """
         items_count = spider.crawler.stats.get_value('item_scraped_count')
         errors_count = spider.crawler.stats.get_value('log_count/ERROR')
         missing_rows = getattr(spider, 'missing_rows', [])
 
-        no_items = not items_count and not errors_count
+        no_items = not items_count and not errors_count and not self.errors
         if no_items and not self.notify_on_no_items and not missing_rows:
             logger.info('no data nor errors, not sending notification')
             return
@@ -72,7 +225,7 @@ class NotifyMiddleware(object):
             'fields': slack.build_table(
                 Items=items_count or 0, Errors=errors_count or 0, ID=spider.job_name
             ),
-            'color': ERROR_COLOR if self._failure else SUCCESS_COLOR,
+            'color': ERROR_COLOR if self.errors else SUCCESS_COLOR,
         }
 
         job_url = shub.spider_job_url(spider.job_name)
@@ -84,7 +237,7 @@ class NotifyMiddleware(object):
         else:
             items_button = slack.Action('button', ':secret:️ Data', job_url + '/items')
 
-        if self._failure:
+        if self.errors:
             msg = f'Spider *{spider.name}* failed ❗️'
             if self.dev_in_charge:
                 dev = slack.mention(self.dev_in_charge)
@@ -112,21 +265,16 @@ class NotifyMiddleware(object):
                     msg += '\n'
                 msg += '```'
 
-        self._notify(
-            msg=msg,
-            attachments=[
-                stats,
-                # commented out to protect source confidentiality
-                # self._failure,
-                slack.build_actions(job_button, items_button),
-            ],
-        )
+        attachments = [stats]
+        if self.errors:
+            attachments.append(self.errors.attachment())
+        attachments.append(slack.build_actions(job_button, items_button))
+
+        return self._notify(msg=msg, attachments=attachments)
 
     def spider_error(self, failure, response, spider, signal=None, *args, **kwargs):
-        """Record failure, message will be sent at the end."""
+        """Record failure, a summary of all of them will be sent at the end."""
         data = response_to_dict(response)
-        self._failure = {
-            'title': 'Faulty http request details',
-            'fields': slack.build_table(Status=data.get('status'), URL=data.get('url')),
-            'color': ERROR_COLOR,
-        }
+        # urls are only disclosed on demand, to protect source confidentiality
+        url = url_pattern(data['url']) if self.error_urls else None
+        self.errors.add(data.get('status'), failure.type.__name__, url)
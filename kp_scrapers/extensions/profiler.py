@@ -0,0 +1,166 @@
+"""Profile where a job spends its time and memory.
+
+Opt-in extension measuring, for every stage of the item flow:
+
+- `callback/<name>`: spider callbacks, time spent producing their output
+- `normalize/<module>`: `process_item` of `normalize` modules next to the spider
+- `validate_item/<model>`: item validation, see `models.utils.validate_item`
+- `pipeline/<class>`: `process_item` of every enabled item pipeline
+
+Stages are timed inclusively, a callback calling a normaliser includes its
+duration. Summaries (count, mean, p50/p95/p99 and max latency in ms, memory
+allocated) end up in stats as `profile/<stage>/<metric>`, and optionally in a
+json report.
+
+Settings:
+
+    - PROFILE_ENABLED:      activate the extension
+    - PROFILE_TRACEMALLOC:  also trace memory allocations, much slower
+    - PROFILE_OUTPUT:       json report path, `%(name)s` and `%(time)s` are interpolated
+
+When disabled, nothing is wrapped and the only remaining cost is a global
+lookup in `validate_item`.
+
+"""
+
+import datetime as dt
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from kp_scrapers.lib.profiling import Profile
+
+
+logger = logging.getLogger(__name__)
+
+
+# stats reported for every stage, `alloc_kb` only if tracing memory
+STATS_METRICS = ('count', 'total_s', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')
+
+# slowest stages, by total time, listed in logs when the spider closes
+LOGGED_STAGES = 5
+
+
+def normalize_modules(spider):
+    """Find `normalize*` modules exposing `process_item` in the spider package."""
+    package = importlib.import_module(type(spider).__module__.rpartition('.')[0] or '__main__')
+    modules = []
+    for info in pkgutil.iter_modules(getattr(package, '__path__', [])):
+        if info.name.startswith('normalize'):
+            module = importlib.import_module('{}.{}'.format(package.__name__, info.name))
+            if callable(getattr(module, 'process_item', None)):
+                modules.append(module)
+    return modules
+
+
+class Profiler(object):
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.output = crawler.settings.get('PROFILE_OUTPUT')
+        self.profile = Profile(trace_memory=crawler.settings.getbool('PROFILE_TRACEMALLOC'))
+        # (owner, attribute or index, original) to restore on close
+        self._patched = []
+        self._started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PROFILE_ENABLED'):
+            raise NotConfigured('profiling is disabled')
+
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self._started = time.time()
+        self.profile.start()
+
+        for module in normalize_modules(spider):
+            stage = 'normalize/{}'.format(module.__name__.rpartition('.')[2])
+            self._patch(module, 'process_item', self.profile.wrap(stage, module.process_item))
+
+        self._wrap_pipelines(self.crawler.engine.scraper.itemproc)
+
+    def _patch(self, owner, key, value):
+        if isinstance(key, str):
+            self._patched.append((owner, key, getattr(owner, key)))
+            setattr(owner, key, value)
+        else:
+            self._patched.append((owner, key, owner[key]))
+            owner[key] = value
+
+    def _wrap_pipelines(self, manager):
+        methods = manager.methods['process_item']
+        # newer scrapy versions keep track of methods that expect a `spider` argument
+        needs_spider = getattr(manager, '_mw_methods_requiring_spider', None)
+        for index, method in enumerate(methods):
+            if method is None:
+                continue
+            stage = 'pipeline/{}'.format(type(method.__self__).__name__)
+            wrapped = self.profile.wrap(stage, method)
+            if needs_spider is not None and method in needs_spider:
+                needs_spider.add(wrapped)
+            self._patch(methods, index, wrapped)
+
+    def response_received(self, response, request, spider):
+        # NOTE scrapy reads the callback once the response made it through middlewares
+        callback = request.callback or getattr(spider, '_parse', spider.parse)
+        if getattr(callback, '__profiled__', False):
+            return
+        stage = 'callback/{}'.format(getattr(callback, '__name__', 'unknown').lstrip('_'))
+        request.callback = self.profile.wrap(stage, callback)
+
+    def spider_closed(self, spider, reason=None):
+        self.profile.stop()
+        for owner, key, original in reversed(self._patched):
+            if isinstance(key, str):
+                setattr(owner, key, original)
+            else:
+                owner[key] = original
+        self._patched = []
+
+        report = self.profile.report()
+        for stage, summary in report['stages'].items():
+            for metric in STATS_METRICS:
+                self.stats.set_value('profile/{}/{}'.format(stage, metric), summary[metric])
+            if self.profile.trace_memory:
+                self.stats.set_value('profile/{}/alloc_kb'.format(stage), summary['alloc_kb'])
+
+        slowest = sorted(report['stages'].items(), key=lambda kv: -kv[1]['total_s'])
+        for stage, summary in slowest[:LOGGED_STAGES]:
+            logger.info(
+                'profile %s: %s calls, %.3fs total, p95 %sms',
+                stage,
+                summary['count'],
+                summary['total_s'],
+                summary['p95_ms'],
+            )
+
+        if self.output:
+            self._dump(spider, report)
+
+    def _dump(self, spider, report):
+        path = self.output % {
+            'name': spider.name,
+            'time': dt.datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S'),
+        }
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        report.update(
+            spider=spider.name,
+            job_id=getattr(spider, 'job_id', None),
+            duration_s=round(time.time() - self._started, 3),
+        )
+        with open(path, 'w') as fd:
+            json.dump(report, fd, indent=2, sort_keys=True)
+        logger.info('profile report written to %s', path)
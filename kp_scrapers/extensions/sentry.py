@@ -4,6 +4,15 @@ Settings:
 
     - SENTRY_DSN:        as provided on Sentry web console
     - SENTRY_THRESHOLD:  minimum level to send log messages to Sentry
+    - SENTRY_MAX_EVENTS_PER_FINGERPRINT: similar events sent per job
+    - SENTRY_MAX_EVENTS: events sent per job
+    - SENTRY_SAMPLE_RATE: share of repeated events sent, the first one always is
+    - SENTRY_TRANSPORT:  transport class path, e.g. to keep events in memory
+
+Events are fingerprinted by logger, message template (or exception type and
+location) and spider, so that Sentry groups them the same way. Events over
+the caps are dropped before being built, and counted: a summary of what was
+dropped is sent when the spider closes, along with `sentry/*` stats.
 
 Context:
 
@@ -15,17 +24,22 @@ Context:
 """
 
 from bdb import BdbQuit
+from collections import Counter
 import logging
 import os
 import platform
+import random
 import socket
 import sys
+import traceback
 
 from scrapy import signals
 from scrapy.crawler import Crawler
 from scrapy.exceptions import CloseSpider, NotConfigured
-from sentry_sdk import configure_scope, init as sentry_init
+from scrapy.utils.misc import load_object
+from sentry_sdk import capture_message, configure_scope, init as sentry_init
 from sentry_sdk.integrations.logging import LoggingIntegration
+from sentry_sdk.transport import Transport
 
 import kp_scrapers as application
 from kp_scrapers.settings import is_shub_env
@@ -37,8 +51,128 @@ logger = logging.getLogger(__name__)
 # sane default threshold for tracking log messages with Sentry
 _DEFAULT_THRESHOLD = 'ERROR'
 
+# default caps, a job logging the same error for every row only needs a few samples
+MAX_EVENTS_PER_FINGERPRINT = 10
+MAX_EVENTS = 500
+SAMPLE_RATE = 1.0
+
+# dropped fingerprints listed in the closing summary
+SUMMARY_SIZE = 10
+
+# tag marking events that bypass governance
+_UNGOVERNED = 'kp_ungoverned'
+
+
+class EventGovernor(object):
+    """Decide which events are worth sending, and count the others.
+
+    Examples:
+        >>> governor = EventGovernor('Spider', per_fingerprint=2, per_job=3)
+        >>> [governor.allow(('log', 'failed row %s')) for _ in range(3)]
+        [True, True, False]
+        >>> governor.allow(('log', 'no table')), governor.allow(('log', 'timeout'))
+        (True, False)
+        >>> governor.sent, governor.dropped, governor.most_dropped()
+        (3, 2, [(('log', 'failed row %s'), 1), (('log', 'timeout'), 1)])
+
+    """
 
-def _init_sentry(dsn, integrations):
+    def __init__(
+        self,
+        spider,
+        per_fingerprint=MAX_EVENTS_PER_FINGERPRINT,
+        per_job=MAX_EVENTS,
+        sample_rate=SAMPLE_RATE,
+    ):
+        self.spider = spider
+        self.per_fingerprint = per_fingerprint
+        self.per_job = per_job
+        self.sample_rate = sample_rate
+        self.seen = Counter()
+        self._sent = Counter()
+        self.sent = 0
+        self.dropped = 0
+
+    def allow(self, fingerprint):
+        self.seen[fingerprint] += 1
+        allowed = (
+            self.sent < self.per_job
+            and self._sent[fingerprint] < self.per_fingerprint
+            # the first occurrence always goes through
+            and (self.seen[fingerprint] == 1 or random.random() < self.sample_rate)
+        )
+        if allowed:
+            self._sent[fingerprint] += 1
+            self.sent += 1
+        else:
+            self.dropped += 1
+        return allowed
+
+    def most_dropped(self, limit=SUMMARY_SIZE):
+        dropped = Counter(
+            {key: count - self._sent[key] for key, count in self.seen.items()}
+        )
+        return [(key, count) for key, count in dropped.most_common(limit) if count]
+
+    def record_fingerprint(self, record):
+        return (record.name, str(record.msg), self.spider)
+
+    def exception_fingerprint(self, exc_info):
+        exc_type, _, tb = exc_info
+        # where it was raised, messages usually vary with the data
+        frames = traceback.extract_tb(tb) if tb else []
+        location = '{}:{}'.format(frames[-1].filename, frames[-1].lineno) if frames else ''
+        return (exc_type.__name__, location, self.spider)
+
+    def filter(self, record):
+        """`logging.Filter` interface, attached to the Sentry event handler."""
+        return self.allow(self.record_fingerprint(record))
+
+    def before_send(self, event, hint):
+        if event.get('tags', {}).get(_UNGOVERNED):
+            return event
+
+        if event.get('logger'):
+            # already governed by `filter`, before the event was built
+            message = (event.get('logentry') or {}).get('message', '')
+            fingerprint = (event['logger'], message, self.spider)
+        elif 'exc_info' in hint:
+            fingerprint = self.exception_fingerprint(hint['exc_info'])
+            if not self.allow(fingerprint):
+                return None
+        else:
+            return event
+
+        event['fingerprint'] = list(fingerprint)
+        event.setdefault('extra', {})['occurrences'] = self.seen[fingerprint]
+        return event
+
+
+class MemoryTransport(Transport):
+    """Keep events in memory instead of sending them, for tests and dry runs."""
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.events = []
+
+    def capture_event(self, event):
+        self.events.append(event)
+
+    def capture_envelope(self, envelope):
+        # newer sdk versions send envelopes only
+        for item in envelope.items:
+            event = item.get_event()
+            if event is not None:
+                self.events.append(event)
+
+    def flush(self, timeout=None, callback=None):
+        pass
+
+    def kill(self):
+        pass
+
+
+def _init_sentry(dsn, integrations, governor=None, transport=None):
     """Initialise Sentry error tracking.
 
     For details, see:
@@ -52,10 +186,17 @@ def _init_sentry(dsn, integrations):
     environment = os.getenv('SCRAPY_PROJECT_ID', 'local')  # dependant on `scrapy-jobparameters`
     server_name = 'scrapinghub' if is_shub_env() else 'local'
 
+    def _before_send(event, hint):
+        event = _filter_exceptions(event, hint)
+        if event is not None and governor is not None:
+            event = governor.before_send(event, hint)
+        return event
+
+    options = {'transport': transport} if transport else {}
     sentry_init(
         dsn=dsn,
         integrations=integrations,
-        before_send=_filter_exceptions,
+        before_send=_before_send,
         before_breadcrumb=_filter_breadcrumbs,
         in_app_include=[application.__package__],
         release=application.__version__,
@@ -63,6 +204,7 @@ def _init_sentry(dsn, integrations):
         server_name=server_name,
         # request_bodies='always',
         # attach_stacktrace=True,  # send stacktraces together with log messages
+        **options,
     )
 
 
@@ -145,15 +287,39 @@ class SentryErrorTracker:
             self.threshold = _DEFAULT_THRESHOLD
         self.threshold = log_level(self.threshold)
 
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.caps = {
+            'per_fingerprint': settings.getint(
+                'SENTRY_MAX_EVENTS_PER_FINGERPRINT', MAX_EVENTS_PER_FINGERPRINT
+            ),
+            'per_job': settings.getint('SENTRY_MAX_EVENTS', MAX_EVENTS),
+            'sample_rate': settings.getfloat('SENTRY_SAMPLE_RATE', SAMPLE_RATE),
+        }
+        transport = settings.get('SENTRY_TRANSPORT')
+        self.transport = load_object(transport) if isinstance(transport, str) else transport
+        self.governor = None
+
     @classmethod
     def from_crawler(cls, crawler):
         ext = cls(crawler)
         crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
         return ext
 
     def spider_opened(self, spider):
+        self.governor = EventGovernor(spider.name, **self.caps)
         logging_integration = _get_logging_conf(threshold=self.threshold)
-        _init_sentry(dsn=self.dsn, integrations=[logging_integration])
+        # drop log records before sentry spends time building events out of them
+        handler = getattr(logging_integration, '_handler', None)
+        if handler is not None:
+            handler.addFilter(self.governor)
+        _init_sentry(
+            dsn=self.dsn,
+            integrations=[logging_integration],
+            governor=self.governor,
+            transport=self.transport,
+        )
 
         # append global context to events that would be useful everywhere
         with configure_scope() as scope:
@@ -170,3 +336,22 @@ class SentryErrorTracker:
             # index server setup for searchability
             scope.set_tag('spider', spider.name)
             scope.set_tag('system', _os_version())
+
+    def spider_closed(self, spider):
+        governor = self.governor
+        self.stats.set_value('sentry/events_sent', governor.sent)
+        self.stats.set_value('sentry/events_dropped', governor.dropped)
+        if not governor.dropped:
+            return
+
+        lines = [
+            '{} × {}'.format(count, ' | '.join(str(part) for part in key[:2]))
+            for key, count in governor.most_dropped()
+        ]
+        with configure_scope() as scope:
+            scope.set_tag(_UNGOVERNED, True)
+            capture_message(
+                '{} similar events were not sent:\n{}'.format(governor.dropped, '\n'.join(lines)),
+                level='warning',
+            )
+            scope.remove_tag(_UNGOVERNED)
@@ -20,16 +20,20 @@ def gzip_uncompress(filelike, **options):
     yield from _deserializer(gzip.GzipFile(fileobj=filelike), **options)
 
 
-def zip_uncompress(filelike, files_to_keep, **options):
+def zip_uncompress(filelike, files_to_keep, lazy=False, **options):
     """Uncompress a folder that has been compressed with zip format and retrieve
 
+    With `lazy`, file contents are streamed instead of being loaded in memory,
+    each generator must then be consumed before moving on to the next file.
+
     Args:
         filelike (file): file-like object
         files_to_keep (str): keep only files that have names that match this regex string
+        lazy (bool): yield a generator of lines instead of a tuple
         **options: deserialising, encoding options for interpreting a file, if required
 
     Yields:
-        Tuple[str, tuple[Any]]:
+        Tuple[str, tuple[Any] | Iterator[Any]]:
 
     """
     zipobj = zipfile.ZipFile(file=filelike)
@@ -40,7 +44,8 @@ def zip_uncompress(filelike, files_to_keep, **options):
 
         # extract unzipped file contents
         with zipobj.open(file_name) as unzipped:
-            yield file_name, tuple(_deserializer(unzipped, **options))
+            lines = _deserializer(unzipped, **options)
+            yield file_name, lines if lazy else tuple(lines)
 
 
 def _deserializer(fileobj, reader=None, deserialize=None, encoding='utf-8'):
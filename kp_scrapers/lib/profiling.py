@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+"""Lightweight per-stage latency and memory profiling.
+
+A `Profile` accumulates, for every named stage (a spider callback, a
+normaliser, a pipeline, ...), how many times it ran, a latency histogram and
+optionally the memory it allocated according to `tracemalloc`.
+
+Profiling is opt-in: code paths that are always instrumented (e.g.
+`validate_item`) only check `active()`, which returns None unless a profile
+was started, see `kp_scrapers.extensions.profiler`.
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from inspect import isgenerator
+import time
+import tracemalloc
+
+
+# upper bounds of latency buckets, in milliseconds, the last bucket is unbounded
+BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# allocation sites listed in reports
+TOP_ALLOCATIONS = 10
+
+_active = None
+
+
+def active():
+    """Profile currently collecting measures, if any."""
+    return _active
+
+
+class StageStats(object):
+    """Latency histogram and allocations of a single stage."""
+
+    __slots__ = ('count', 'total', 'max', 'allocated', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.allocated = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds, allocated=0):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.allocated += allocated
+        self.buckets[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile(self, q):
+        """Estimate a latency percentile in ms, as the upper bound of its bucket.
+
+        Examples:
+            >>> stats = StageStats()
+            >>> for seconds in (0.0004, 0.0004, 0.003, 0.015):
+            ...     stats.add(seconds)
+            >>> stats.percentile(50), stats.percentile(75), stats.percentile(100)
+            (0.5, 5, 20)
+
+        """
+        if not self.count:
+            return 0
+        rank, seen = self.count * q / 100.0, 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        # unbounded bucket
+        return round(self.max * 1000, 3)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 6),
+            'mean_ms': round(self.total * 1000 / self.count, 3) if self.count else 0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max * 1000, 3),
+            'alloc_kb': round(self.allocated / 1024.0, 1),
+        }
+
+
+class Profile(object):
+    """Collect latency and allocations of named stages.
+
+    Args:
+        trace_memory (bool): also measure memory allocated by each stage, which
+            slows down everything noticeably
+
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._snapshot = None
+
+    def start(self):
+        global _active
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def record(self, stage, seconds, allocated=0):
+        if stage not in self.stages:
+            self.stages[stage] = StageStats()
+        self.stages[stage].add(seconds, allocated)
+
+    def _memory(self):
+        return tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+
+    @contextmanager
+    def timed(self, stage):
+        """Measure the enclosed block as one run of `stage`."""
+        memory, start = self._memory(), time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, max(self._memory() - memory, 0))
+
+    def _iterate(self, stage, generator):
+        # only time spent producing items counts, not what consumers do in between
+        elapsed, allocated = 0.0, 0
+        try:
+            while True:
+                memory, start = self._memory(), time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                    allocated += max(self._memory() - memory, 0)
+                yield item
+        finally:
+            self.record(stage, elapsed, allocated)
+
+    def wrap(self, stage, func):
+        """Profile every call of `func`, including the iteration of generators it returns.
+
+        Examples:
+            >>> profile = Profile()
+            >>> double = profile.wrap('double', lambda x: x * 2)
+            >>> double(2)
+            4
+            >>> items = profile.wrap('items', lambda: (x for x in range(3)))
+            >>> list(items())
+            [0, 1, 2]
+            >>> sorted((name, s.count) for name, s in profile.stages.items())
+            [('double', 1), ('items', 1)]
+
+        """
+        if getattr(func, '__profiled__', False):
+            return func
+
+        @wraps(func)
+        def _profiled(*args, **kwargs):
+            memory, start = self._memory(), time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self.record(stage, time.perf_counter() - start)
+                raise
+
+            if isgenerator(result):
+                # calling a generator function runs none of its code, iterating does
+                return self._iterate(stage, result)
+            self.record(stage, time.perf_counter() - start, max(self._memory() - memory, 0))
+            return result
+
+        _profiled.__profiled__ = True
+        _profiled.__original__ = func
+        return _profiled
+
+    def top_allocations(self, limit=TOP_ALLOCATIONS):
+        """Allocation sites still holding the most memory when profiling stopped."""
+        if self._snapshot is None:
+            return []
+        return [
+            {
+                'site': '{}:{}'.format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                'size_kb': round(stat.size / 1024.0, 1),
+                'count': stat.count,
+            }
+            for stat in self._snapshot.statistics('lineno')[:limit]
+        ]
+
+    def report(self):
+        return {
+            'stages': {name: stats.summary() for name, stats in sorted(self.stages.items())},
+            'top_allocations': self.top_allocations(),
+        }
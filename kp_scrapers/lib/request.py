@@ -26,6 +26,20 @@ def allow_inline_requests(method):
 
                 yield {'links': results}
 
+    Yielding a list or tuple of requests sends them all at once, and resumes the
+    callback with the list of their responses, in the same order, once all of them
+    completed. Failed requests are replaced by their `twisted.python.failure.Failure`
+    instead of raising, so that one error does not lose the whole batch:
+
+                pages = yield [Request(url) for url in detail_urls]
+                for page in pages:
+                    if isinstance(page, Failure):
+                        continue
+                    ...
+
+    Requests are still scheduled like any other, concurrency being bounded by the
+    downloader slots (e.g. `CONCURRENT_REQUESTS_PER_DOMAIN`).
+
     Args:
         method (Callable[[object, scrapy.Response], scrapy.Response]): spider method
 
@@ -43,8 +57,39 @@ def allow_inline_requests(method):
     return _wrapper
 
 
+def _is_batch(output):
+    """Check if a callback output is a batch of inline requests.
+
+    Examples:
+        >>> _is_batch([Request('http://example/1'), Request('http://example/2')])
+        True
+        >>> _is_batch(())
+        True
+        >>> _is_batch(Request('http://example/1'))
+        False
+        >>> _is_batch([{'name': 'item'}])
+        False
+
+    """
+    return isinstance(output, (list, tuple)) and all(isinstance(r, Request) for r in output)
+
+
+class _Batch:
+    """Collect results of inline requests sent together."""
+
+    def __init__(self, size):
+        self.results = [None] * size
+        self.pending = size
+
+    def done(self, index, result):
+        """Store the result of a request, and tell if it was the last one awaited."""
+        self.results[index] = result
+        self.pending -= 1
+        return self.pending == 0
+
+
 class RequestManager:
-    """Wrap the callback and output requests sequentially.
+    """Wrap the callback and output inline requests, one at a time or in batches.
     """
 
     def __init__(self, callback, **kwargs):
@@ -89,7 +134,7 @@ class RequestManager:
 
         """
         while True:
-            if previous:
+            if previous is not None:
                 request, previous = previous, None
             else:
                 try:
@@ -101,11 +146,25 @@ class RequestManager:
                 yield self._wrap_request(request, generator)
                 return
 
+            if _is_batch(request):
+                if not request:
+                    # nothing to wait for, resume right away
+                    try:
+                        previous = generator.send([])
+                    except StopIteration:
+                        break
+                    continue
+
+                batch = _Batch(len(request))
+                for index, each in enumerate(request):
+                    yield self._wrap_request(each, generator, batch=batch, index=index)
+                return
+
             # catches `yield` not part of inline request coroutine
             # can be either a request with callback, an item, or NoneType
             yield request
 
-    def _wrap_request(self, request, generator):
+    def _wrap_request(self, request, generator, batch=None, index=None):
         """Wrap request and handle successes (200) and other errors.
 
         Allowing existing callback or errbacks could lead to undesired results.
@@ -115,6 +174,8 @@ class RequestManager:
         Args:
             request (scrapy.Request):
             generator (GeneratorType):
+            batch (Optional[_Batch]): batch the request belongs to, if any
+            index (Optional[int]): position of the request in its batch
 
         Returns:
             scrapy.Request:
@@ -127,8 +188,16 @@ class RequestManager:
         if request.errback is not None:
             raise ValueError(f'Request contains errback {request.errback}, not supported')
 
-        request.callback = partial(self._handle_success, generator=generator)
-        request.errback = partial(self._handle_failure, generator=generator)
+        if batch is not None:
+            request.callback = partial(
+                self._handle_batch_result, generator=generator, batch=batch, index=index
+            )
+            request.errback = partial(
+                self._handle_batch_failure, generator=generator, batch=batch, index=index
+            )
+        else:
+            request.callback = partial(self._handle_success, generator=generator)
+            request.errback = partial(self._handle_failure, generator=generator)
         return request
 
     def _handle_success(self, response, generator):
@@ -143,12 +212,7 @@ class RequestManager:
         return self.resume(generator, request)
 
     def _handle_failure(self, failure, generator):
-        # look for the request instance in the exception value
-        if hasattr(failure.value, 'request'):
-            self._clean_request(failure.value.request)
-        elif hasattr(failure.value, 'response'):
-            if hasattr(failure.value.response, 'request'):
-                self._clean_request(failure.value.response.request)
+        self._clean_failed_request(failure)
 
         try:
             # see https://bit.ly/2Hw2Muw for handling errors
@@ -158,6 +222,33 @@ class RequestManager:
 
         return self.resume(generator, request)
 
+    def _handle_batch_result(self, result, generator, batch, index):
+        if getattr(result, 'request', None):
+            self._clean_request(result.request)
+
+        # only the last request of a batch to complete resumes the generator
+        if not batch.done(index, result):
+            return
+
+        try:
+            request = generator.send(batch.results)
+        except StopIteration:
+            return
+
+        return self.resume(generator, request)
+
+    def _handle_batch_failure(self, failure, generator, batch, index):
+        self._clean_failed_request(failure)
+        return self._handle_batch_result(failure, generator, batch, index)
+
+    def _clean_failed_request(self, failure):
+        # look for the request instance in the exception value
+        if hasattr(failure.value, 'request'):
+            self._clean_request(failure.value.request)
+        elif hasattr(failure.value, 'response'):
+            if hasattr(failure.value.response, 'request'):
+                self._clean_request(failure.value.response.request)
+
     def _clean_request(self, request):
         request.callback = None
         request.errback = None
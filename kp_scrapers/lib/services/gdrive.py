@@ -1,8 +1,11 @@
 # -*- coding: utf-8; -*-
 
 from __future__ import absolute_import, unicode_literals
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import json
 import os
+import threading
+import time
 
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
@@ -44,6 +47,7 @@ def build_query(
     parent_id=None,
     included_tags=None,
     excluded_tags=None,
+    modified_after=None,
 ):
     """Builds a query string from a list of queries and additional filters like
     the name or the type of the file.
@@ -64,6 +68,10 @@ def build_query(
         Refining the original query to only keep folders
         >>> folders_query = build_query(base_query=original_query, type_=GDriveFileType.FOLDER)
 
+        Only keeping files modified since the last run
+        >>> build_query(modified_after='2020-01-01T00:00:00Z')
+        '(modifiedTime > "2020-01-01T00:00:00Z")'
+
     Args:
         base_query (str | unicode | None)
         type_ (str | unicode | None): A GDriveFileType to use as filter
@@ -72,6 +80,7 @@ def build_query(
         parent_id (str | unicode | None): id of the parent folder
         included_tags (list[str | unicode] | None): tags that must be on the files
         excluded_tags (list[str | unicode] | None): tags that must not be on the files
+        modified_after (str | None): RFC 3339 time files must have been modified after
 
     """
     queries = [base_query]
@@ -100,9 +109,49 @@ def build_query(
     if parent_id:
         queries.append('"{}" in parents'.format(parent_id))
 
+    if modified_after:
+        queries.append('modifiedTime > "{}"'.format(modified_after))
+
     return ' and '.join(['({})'.format(q) for q in queries if q])
 
 
+class FolderCache(object):
+    """Remember which folder id a path resolves to, for `ttl` seconds.
+
+    Entries live in `store`, any mutable mapping, so that a spider can keep
+    them in its persisted state and skip walking the path on the next runs.
+
+    Examples:
+        >>> cache = FolderCache({}, ttl=60)
+        >>> cache.set('root', 'a/b', 'folder-id', now=0)
+        >>> cache.get('root', 'a/b', now=30)
+        'folder-id'
+        >>> cache.get('root', 'a/b', now=90) is None
+        True
+
+    """
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(root_id, path):
+        return '{}/{}'.format(root_id, path)
+
+    def get(self, root_id, path, now=None):
+        entry = self.store.get(self._key(root_id, path))
+        now = time.time() if now is None else now
+        if entry and now - entry['resolved_at'] < self.ttl:
+            return entry['id']
+
+    def set(self, root_id, path, folder_id, now=None):
+        self.store[self._key(root_id, path)] = {
+            'id': folder_id,
+            'resolved_at': time.time() if now is None else now,
+        }
+
+
 class GDriveService(object):
     """Wrapper for Google Drive API.
 
@@ -126,7 +175,7 @@ class GDriveService(object):
 
     """
 
-    DEFAULT_FILE_FIELDS = 'parents, mimeType, id, name'
+    DEFAULT_FILE_FIELDS = 'parents, mimeType, id, name, modifiedTime, size'
     # google's api supports data retrieval from both teamdrive  and mydrive
     # even when TEAM_DRIVE_ENABLED is True
     TEAM_DRIVE_ENABLED = True
@@ -143,9 +192,11 @@ class GDriveService(object):
         # schedules the requests, making them sequential and threfor a lot
         # slower. To keep in mind when we will migrate a lot of this type of
         # scraper.
+        self.credentials = credentials
         self.session = credentials.authorize(Http())
         self._drive = self._build_service(self.session, 'drive', 'v3')
         self._sheets = self._build_service(self.session, 'sheets', 'v4')
+        self._local = threading.local()
 
     @staticmethod
     def _json_credentials(settings):
@@ -242,21 +293,23 @@ class GDriveService(object):
             .execute()
         )
 
-    def list_files_in_path(self, folder_id, path, recursive=False, query=None):
-        """List file metadata located at target path, given root folder_id.
+    def resolve_path(self, folder_id, path, folder_cache=None):
+        """Get the id of the folder at `path`, relative to `folder_id`.
 
         Args:
             folder_id (str | unicode): id of the root folder to start from
             path (str | unicode): path from the root folder to the target folder
-            recursive (bool): parse target folder and its subdirectories recursively
-            query (str | unicode): query to use to filter files
+            folder_cache (FolderCache | None): skip the lookup if the path is cached
 
         Returns:
-            list[dict]: list of dictionary of file name/id and gdrive metadata
+            str: id of the deepest folder found along the path
 
         """
+        cached_id = folder_cache.get(folder_id, path) if folder_cache else None
+        if cached_id:
+            return cached_id
+
         current_folder_id = folder_id
-        # obtain target path's folder_id
         # NOTE because google's api does not support direct retrieval of a nested dir,
         # we will have to iterate across each successive subdir until we reach the layer we target
         for child_folder_name in path.split('/'):
@@ -266,6 +319,26 @@ class GDriveService(object):
             if child_folder:
                 current_folder_id = child_folder[0]['id']
 
+        if folder_cache:
+            folder_cache.set(folder_id, path, current_folder_id)
+        return current_folder_id
+
+    def list_files_in_path(self, folder_id, path, recursive=False, query=None, folder_cache=None):
+        """List file metadata located at target path, given root folder_id.
+
+        Args:
+            folder_id (str | unicode): id of the root folder to start from
+            path (str | unicode): path from the root folder to the target folder
+            recursive (bool): parse target folder and its subdirectories recursively
+            query (str | unicode): query to use to filter files
+            folder_cache (FolderCache | None): cache of already resolved paths
+
+        Returns:
+            list[dict]: list of dictionary of file name/id and gdrive metadata
+
+        """
+        current_folder_id = self.resolve_path(folder_id, path, folder_cache=folder_cache)
+
         files = []
         folder_ids_stack = [current_folder_id]
         # recursively get descendant files within target folder_id using depth-first search
@@ -379,15 +452,26 @@ class GDriveService(object):
         with open(target_path, open_mode) as fd:
             fd.write(self.fetch_file_content(item))
 
-    def fetch_file_content(self, item):
+    def fetch_file_content(self, item, http=None):
+        """Download a file body.
+
+        Args:
+            item (dict): gdrive file dict
+            http (httplib2.Http | None): authorized session to use instead of the default one
+
+        Returns:
+            bytes:
+
+        """
         mime_type = item['mimeType']
+        session = http or self.session
         if mime_type in GDriveMimeTypes.PDF:
-            _, content = self.session.request(PDF_DOWNLOAD_URL_TPL.format(id_=item['id']))
+            _, content = session.request(PDF_DOWNLOAD_URL_TPL.format(id_=item['id']))
         elif mime_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
             content = (
                 self._drive.files()
                 .get_media(fileId=item['id'], supportsTeamDrives=self.TEAM_DRIVE_ENABLED)
-                .execute()
+                .execute(http=session)
             )
         else:
             if mime_type in GDriveMimeTypes.SPREADSHEETS:
@@ -395,9 +479,49 @@ class GDriveService(object):
             else:
                 mime_type = 'text/plain'
             req = self._drive.files().export_media(fileId=item['id'], mimeType=mime_type)
-            content = req.execute()
+            content = req.execute(http=session)
         return content
 
+    def _thread_session(self):
+        # `httplib2.Http` is not thread-safe, give each worker its own
+        if not hasattr(self._local, 'session'):
+            self._local.session = self.credentials.authorize(Http())
+        return self._local.session
+
+    def fetch_files(self, items, workers=4):
+        """Download file bodies concurrently.
+
+        Downloads run in a pool of `workers` threads, with at most twice as
+        many files in flight so that memory stays bounded however many
+        files are listed.
+
+        Args:
+            items (iterable[dict]): gdrive file dicts
+            workers (int): number of concurrent downloads
+
+        Yields:
+            tuple(dict, bytes): file dict and its content, in completion order
+
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            while True:
+                for item in items:
+                    future = executor.submit(
+                        lambda i: self.fetch_file_content(i, http=self._thread_session()), item
+                    )
+                    pending[future] = item
+                    if len(pending) >= 2 * workers:
+                        break
+
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
     def move(self, id, parent_id):
         """Move an object from one parent directory to another.
 
@@ -470,9 +594,11 @@ class GDriveServiceWebAuth(GDriveService):
             'GMAIL_TOKEN_EXPIRY',
         )
         credentials = self._build_credentials(settings)
+        self.credentials = credentials
         self.session = credentials.authorize(Http())
         self._drive = self._build_service(self.session, 'drive', 'v3')
         self._sheets = self._build_service(self.session, 'sheets', 'v4')
+        self._local = threading.local()
 
     def _build_credentials(self, settings):
         self._save_file(json.dumps(self._client_secret(settings)), 'client_secret.json')
@@ -629,3 +755,35 @@ class GSheetsService(GDriveServiceWebAuth):
             )
             .execute()
         )
+
+    def append_sheet(self, file_id, rows, valueInputOption='RAW', **kwargs):
+        """Append rows after the last non-empty row of a Google Sheet.
+
+        https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.values/append
+
+        Args:
+            file_id (str): unique file id (can be obtained from url)
+            rows (List[List[str]]): rows of data to append
+
+        Returns:
+            Dict[str, str] | None: status dict of updated range if appended successfully
+
+        """
+        if not rows:
+            return
+
+        body = {'majorDimension': 'ROWS', 'values': rows}
+        return (
+            self._sheets.spreadsheets()
+            .values()
+            .append(
+                spreadsheetId=file_id,
+                range=ALL_CELLS,
+                body=body,
+                valueInputOption=valueInputOption,
+                # never overwrite cells below the table
+                insertDataOption='INSERT_ROWS',
+                **kwargs,
+            )
+            .execute()
+        )
@@ -7,28 +7,47 @@ Remark
 
 TODO Delete the spiders that are no longer exist
 
-Note: Airtable API rate limits at 5 requests/s. Maybe we could use another wrapper.
+Note: Airtable API rate limits at 5 requests/s, per base. Exceeding it gets
+us a 429 and a 30s ban.
 
 The current wrapper we use https://github.com/nicocanali/airtable-python, does not manage rate
-limiting hence we have to manage it ourselves.
-
-https://github.com/gtalarico/airtable-python-wrapper
-This wrapper, unlike the one we currently use, helps to do the rate limiting for us by having
-a `batch_insert` method.
+limiting nor batch writes, hence `AirtableWriter` below talks to the batch
+endpoints directly (up to 10 records per request), and every call goes through
+a token bucket that waits for capacity rather than dropping calls.
 
 """
 
+from collections import namedtuple
+import json
+import logging
+import posixpath
+
 from airtable import airtable
+import requests
 
 from kp_scrapers.cli.ui import info
 from kp_scrapers.lib.services.shub import global_settings as Settings, validate_settings
-from kp_scrapers.lib.utils import throttle
+from kp_scrapers.lib.utils import TokenBucket
+
+
+logger = logging.getLogger(__name__)
 
 
 BASE_MAPPING = {'Data Sourcing': 'appY2FMxUDFExuYGK'}
 
-# Airtable API rate limit is 5 requests per second, 0.2 is from empirical tests
-RATE_LIMIT = 0.2
+# Airtable API rate limit is 5 requests per second, per base
+RATE_LIMIT = 5
+# maximum number of records the API accepts in a single create/update request
+BATCH_SIZE = 10
+
+# shared by all calls of this process, so that we stay under the limit whatever the entrypoint
+rate_limiter = TokenBucket(rate=RATE_LIMIT)
+
+# one client per base for the whole process
+_clients = {}
+_writers = {}
+
+BatchResult = namedtuple('BatchResult', ['rows', 'records', 'error'])
 
 
 def connect(base):
@@ -43,9 +62,111 @@ def connect(base):
         Airtable:
 
     """
-    validate_settings('AIRTABLE_API_KEY')
+    if base not in _clients:
+        validate_settings('AIRTABLE_API_KEY')
+        _clients[base] = airtable.Airtable(BASE_MAPPING[base], Settings()['AIRTABLE_API_KEY'])
 
-    return airtable.Airtable(BASE_MAPPING[base], Settings()['AIRTABLE_API_KEY'])
+    return _clients[base]
+
+
+class AirtableWriter(object):
+    """Write records in batches using Airtable bulk endpoints.
+
+    Each request carries up to `BATCH_SIZE` records, and is rate limited by the
+    module token bucket. A failed batch doesn't stop the others: results are
+    reported per batch so that callers can tell what was actually written.
+
+    Usage:
+
+        writer = AirtableWriter('Data Sourcing')
+        results = writer.create('Status', [{'Spider': 'Foo'}, {'Spider': 'Bar'}])
+
+    """
+
+    def __init__(self, base, api_key=None, limiter=None, session=None):
+        if api_key is None:
+            validate_settings('AIRTABLE_API_KEY')
+            api_key = Settings()['AIRTABLE_API_KEY']
+
+        self.base_url = posixpath.join(airtable.API_URL % airtable.API_VERSION, BASE_MAPPING[base])
+        self.limiter = limiter or rate_limiter
+        # keep connections alive across batches
+        self.session = session or requests.Session()
+        self.session.headers.update(
+            {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
+        )
+
+    def _request(self, method, table, records):
+        self.limiter.consume()
+        resp = self.session.request(
+            method, posixpath.join(self.base_url, table), data=json.dumps({'records': records})
+        )
+        if resp.status_code != requests.codes.ok:
+            error = resp.json().get('error', {})
+            # NOTE the API documents errors either as a string or as an object
+            if isinstance(error, str):
+                error = {'type': error}
+            raise airtable.AirtableError(
+                error_type=error.get('type', str(resp.status_code)),
+                message=error.get('message', resp.text),
+            )
+
+        return resp.json().get('records', [])
+
+    def _batches(self, method, table, records):
+        for start in range(0, len(records), BATCH_SIZE):
+            batch = records[start : start + BATCH_SIZE]
+            try:
+                yield BatchResult(batch, self._request(method, table, batch), None)
+            except (airtable.AirtableError, requests.RequestException, ValueError) as err:
+                logger.error('failed to write %s records to %s: %s', len(batch), table, err)
+                yield BatchResult(batch, [], err)
+
+    def create(self, table, rows):
+        """Create records, `BATCH_SIZE` at a time.
+
+        Args:
+            table (str):
+            rows (List[Dict[str, Any]]): record fields
+
+        Returns:
+            List[BatchResult]:
+
+        """
+        return list(self._batches('POST', table, [{'fields': row} for row in rows]))
+
+    def update(self, table, rows):
+        """Update existing records, `BATCH_SIZE` at a time.
+
+        Only given fields are updated, others are left untouched.
+
+        Args:
+            table (str):
+            rows (List[Tuple[Dict[str, Any], str]]): record fields and id
+
+        Returns:
+            List[BatchResult]:
+
+        """
+        return list(
+            self._batches('PATCH', table, [{'id': id, 'fields': row} for row, id in rows])
+        )
+
+
+def writer(base):
+    """Batch writer of the given base, shared by the whole process.
+
+    Args:
+        base (str):
+
+    Returns:
+        AirtableWriter:
+
+    """
+    if base not in _writers:
+        _writers[base] = AirtableWriter(base)
+
+    return _writers[base]
 
 
 def retrieve(base, table, **opts):
@@ -63,6 +184,7 @@ def retrieve(base, table, **opts):
         Tuple[str, str, str]: offset, fields, id
 
     """
+    rate_limiter.consume()
     payload = connect(base).get(table, **opts)
     return ((payload.get('offset'), row['fields'], row['id']) for row in payload.get('records', []))
 
@@ -93,7 +215,7 @@ def retrieve_all_records(base, table, page_size=100):
             break
 
 
-@throttle(seconds=RATE_LIMIT)
+@rate_limiter
 def create(base, table, row):
     """Create a record in Airtable and handle rate limit.
 
@@ -121,18 +243,18 @@ def batch_create(base, table, data):
     Args:
         base (str):
         table (str):
-        data (List[List[str]]):
+        data (List[Dict[str, str]]):
 
     Returns:
-        None
+        List[BatchResult]:
 
     """
-    for row in data:
-        info(f'Creating row {row["Spider"]}')
-        create(base, table, row)
+    results = writer(base).create(table, data)
+    _report(results, 'Created')
+    return results
 
 
-@throttle(seconds=RATE_LIMIT)
+@rate_limiter
 def update(base, table, id, row):
     """Update an existing Airtable row with id given and handle rate limit.
 
@@ -158,11 +280,18 @@ def batch_update(base, table, data):
     Args:
         base (str):
         table (str):
-        data (List[List[str]]):
+        data (List[Tuple[Dict[str, str], str]]): row and record id
 
     Returns:
+        List[BatchResult]:
 
     """
-    for row, id in data:
-        info(f'Updating row {row["Spider"]}')
-        update(base, table, id, row)
+    results = writer(base).update(table, data)
+    _report(results, 'Updated')
+    return results
+
+
+def _report(results, action):
+    for result in results:
+        status = 'failed' if result.error else 'ok'
+        info(f'{action} {len(result.records)}/{len(result.rows)} rows ({status})')
@@ -1,9 +1,34 @@
+"""Upload spider monitoring stats to Redshift.
+
+Stats of finished jobs are buffered by a `MonitoringSink`, shared by every
+spider of a process, and inserted in bulk over a pooled engine:
+
+- once `batch_size` rows are buffered, or as soon as the last running job of
+  the process closes, so that a process running a single spider, as on
+  Scrapinghub, uploads every job before DotScrapy syncs `.scrapy` on
+  `engine_stopped`. Rows still buffered when the process exits, e.g. after an
+  interrupted flush, are inserted by a last resort flush at exit
+- rows that could not be inserted because the database is unreachable are
+  appended to a local spill file, in json lines, and inserted again by the
+  next flush of any process using the same file. Rows rejected by the
+  database are logged and dropped, spilled ones are moved to `<file>.rejected`
+
+Any SQLAlchemy database url works, SQLite included, which is how it is tested.
+
+"""
+
+import atexit
 import datetime as dt
+import json
 import logging
+import os
+import threading
 from typing import Dict
 
+import sqlalchemy as db
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
 from kp_scrapers.lib.date import system_tz_offset
-from kp_scrapers.lib.db_connection import db_conn_orm
 from kp_scrapers.lib.services.shub import global_settings as Settings
 from kp_scrapers.lib.utils import ignore_key, map_keys
 from kp_scrapers.redshift_orm.loader_orm import CargoMovementStats, SpotCharterStats
@@ -12,60 +37,55 @@ from kp_scrapers.redshift_orm.loader_orm import CargoMovementStats, SpotCharterS
 logger = logging.getLogger(__name__)
 
 
-def upsert_metrics(stats: Dict):
-    with db_conn_orm(Settings()['MONITORING_DB']) as sesh:
-        if 'spotcharter' in stats.get('datatype'):
-            item = map_keys(stats.get('spider_attribute_stats'), sc_mapping())
-            citem = map_keys(stats, common_mapping())
-            item.update(
-                citem, datatype='spotcharter',
-            )
-            spider_stats = SpotCharterStats(**item)
-        elif 'portcall' in stats.get('datatype'):
-            item = map_keys(stats.get('spider_attribute_stats'), cml_mapping())
-            citem = map_keys(stats, common_mapping())
-            item.update(
-                citem, datatype='portcall',
-            )
-            spider_stats = CargoMovementStats(**item)
-        elif 'cargo_movement' in stats.get('datatype'):
-            item = map_keys(stats.get('spider_attribute_stats'), cml_mapping())
-            citem = map_keys(stats, common_mapping())
-            item.update(
-                citem, datatype='cargo_movement',
-            )
-            spider_stats = CargoMovementStats(**item)
-        else:
-            logger.info('redshift monitoring not supported')
-            return
+# rows buffered before being inserted
+BATCH_SIZE = 50
 
-        sesh.add(spider_stats)
-        sesh.commit()
+# spill file, relative paths are resolved in the `.scrapy` data dir
+SPILL_FILE = 'monitoring-spill.jsonl'
 
 
-def common_mapping():
-    return {
-        'warning_count': ('warning_msg_count', None),
-        'error_count': ('error_msg_count', None),
-        'exception_count': ('exception_msg_count', None),
-        'start_time': (
-            'sh_job_time',
-            lambda x: (x - dt.timedelta(hours=system_tz_offset())).isoformat(),
-        ),
-        'finish_time': (
-            'sh_job_finish_time',
-            lambda x: (x - dt.timedelta(hours=system_tz_offset())).isoformat(),
-        ),
-        'total_items': ('total_item_count', None),
-        'spider_attribute_stats': ignore_key('handled later'),
-        'sh_spider_name': ('sh_spider_name', None),
-        'sh_job_id': ('sh_job_id', None),
-        'datatype': ('datatype', None),
-    }
+def _to_utc(date):
+    # naive utc datetimes, sqlalchemy `DateTime` only takes datetimes on some backends
+    return date - dt.timedelta(hours=system_tz_offset())
 
 
-def cml_mapping():
-    return {
+COMMON_MAPPING = {
+    'warning_count': ('warning_msg_count', None),
+    'error_count': ('error_msg_count', None),
+    'exception_count': ('exception_msg_count', None),
+    'start_time': ('sh_job_time', _to_utc),
+    'finish_time': ('sh_job_finish_time', _to_utc),
+    'total_items': ('total_item_count', None),
+    'spider_attribute_stats': ignore_key('handled later'),
+    'sh_spider_name': ('sh_spider_name', None),
+    'sh_job_id': ('sh_job_id', None),
+    'datatype': ('datatype', None),
+}
+
+_VESSEL_MAPPING = {
+    'vessel.name': ('vessel_name_count', None),
+    'vessel.imo': ('vessel_imo_count', None),
+    'vessel.beam': ('vessel_beam_count', None),
+    'vessel.build_year': ('vessel_buildyear_count', None),
+    'vessel.length': ('vessel_length_count', None),
+    'vessel.mmsi': ('vessel_mmsi_count', None),
+    'vessel.callsign': ('vessel_callsign_count', None),
+    'vessel.dead_weight': ('vessel_deadweight_count', None),
+    'vessel.flag_code': ('vessel_flagcode_count', None),
+    'vessel.flag_name': ('vessel_flagname_count', None),
+    'vessel.gross_tonnage': ('vessel_grosston_count', None),
+    'vessel.vessel_type': ('vessel_vesseltype_count', None),
+    'cargo.movement': ('cargo_movement_count', None),
+    'cargo.product': ('cargo_product_count', None),
+    'cargo.volume': ('cargo_volume_count', None),
+    'cargo.volume_unit': ('cargo_volumeunit_count', None),
+    'cargo.buyer.name': ('cargo_buyername_count', None),
+    'cargo.seller.name': ('cargo_sellername_count', None),
+}
+
+CML_MAPPING = dict(
+    _VESSEL_MAPPING,
+    **{
         'eta': ('date_eta_count', None),
         'arrival': ('date_arrival_count', None),
         'berthed': ('date_berth_count', None),
@@ -73,57 +93,234 @@ def cml_mapping():
         'port_name': ('location_portname_count', None),
         'installation': ('location_installation_count', None),
         'berth': ('location_berth_count', None),
-        'vessel.name': ('vessel_name_count', None),
-        'vessel.imo': ('vessel_imo_count', None),
-        'vessel.beam': ('vessel_beam_count', None),
-        'vessel.build_year': ('vessel_buildyear_count', None),
-        'vessel.length': ('vessel_length_count', None),
-        'vessel.mmsi': ('vessel_mmsi_count', None),
-        'vessel.callsign': ('vessel_callsign_count', None),
-        'vessel.dead_weight': ('vessel_deadweight_count', None),
-        'vessel.flag_code': ('vessel_flagcode_count', None),
-        'vessel.flag_name': ('vessel_flagname_count', None),
-        'vessel.gross_tonnage': ('vessel_grosston_count', None),
-        'vessel.vessel_type': ('vessel_vesseltype_count', None),
-        'cargo.movement': ('cargo_movement_count', None),
-        'cargo.product': ('cargo_product_count', None),
-        'cargo.volume': ('cargo_volume_count', None),
-        'cargo.volume_unit': ('cargo_volumeunit_count', None),
-        'cargo.buyer.name': ('cargo_buyername_count', None),
-        'cargo.seller.name': ('cargo_sellername_count', None),
         'cargoes.movement': ('cargoes_movement_count', None),
         'cargoes.product': ('cargoes_product_count', None),
         'cargoes.volume': ('cargoes_volume_count', None),
         'cargoes.volume_unit': ('cargoes_volumeunit_count', None),
         'cargoes.buyer.name': ('cargoes_buyername_count', None),
         'cargoes.seller.name': ('cargoes_sellername_count', None),
-    }
+    },
+)
 
-
-def sc_mapping():
-    return {
+SC_MAPPING = dict(
+    _VESSEL_MAPPING,
+    **{
         'arrival_zone.': ('location_arrivalzone_count', None),
         'departure_zone': ('location_departurezone_count', None),
         'charterer': ('att_charterer_count', None),
         'status': ('att_status_count', None),
         'lay_can_start': ('date_laycanstart_count', None),
         'lay_can_end': ('date_laycanend_count', None),
-        'vessel.name': ('vessel_name_count', None),
-        'vessel.imo': ('vessel_imo_count', None),
-        'vessel.beam': ('vessel_beam_count', None),
-        'vessel.build_year': ('vessel_buildyear_count', None),
-        'vessel.length': ('vessel_length_count', None),
-        'vessel.mmsi': ('vessel_mmsi_count', None),
-        'vessel.callsign': ('vessel_callsign_count', None),
-        'vessel.dead_weight': ('vessel_deadweight_count', None),
-        'vessel.flag_code': ('vessel_flagcode_count', None),
-        'vessel.flag_name': ('vessel_flagname_count', None),
-        'vessel.gross_tonnage': ('vessel_grosston_count', None),
-        'vessel.vessel_type': ('vessel_vesseltype_count', None),
-        'cargo.movement': ('cargo_movement_count', None),
-        'cargo.product': ('cargo_product_count', None),
-        'cargo.volume': ('cargo_volume_count', None),
-        'cargo.volume_unit': ('cargo_volumeunit_count', None),
-        'cargo.buyer.name': ('cargo_buyername_count', None),
-        'cargo.seller.name': ('cargo_sellername_count', None),
-    }
+    },
+)
+
+# (datatype, model, attributes mapping), the first datatype found in `produces` wins
+DATATYPES = (
+    ('spotcharter', SpotCharterStats, SC_MAPPING),
+    ('portcall', CargoMovementStats, CML_MAPPING),
+    ('cargo_movement', CargoMovementStats, CML_MAPPING),
+)
+
+MODELS = {model.__tablename__: model for _, model, _ in DATATYPES}
+
+
+def common_mapping():
+    return COMMON_MAPPING
+
+
+def cml_mapping():
+    return CML_MAPPING
+
+
+def sc_mapping():
+    return SC_MAPPING
+
+
+def to_row(stats: Dict):
+    """Map job stats to the monitoring table matching its datatype.
+
+    Returns:
+        Tuple[str, Dict[str, Any]]: table name and row, None if the datatype is not monitored
+
+    """
+    for datatype, model, mapping in DATATYPES:
+        if datatype in (stats.get('datatype') or ''):
+            row = map_keys(stats.get('spider_attribute_stats') or {}, mapping)
+            row.update(map_keys(stats, COMMON_MAPPING), datatype=datatype)
+            return model.__tablename__, row
+
+    return None
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_url):
+    """Share one pooled engine per database in the process."""
+    with _engines_lock:
+        if db_url not in _engines:
+            # connections may be idle for a long time between two jobs
+            _engines[db_url] = db.create_engine(db_url, pool_pre_ping=True, pool_recycle=3600)
+        return _engines[db_url]
+
+
+def _dumps(row):
+    return json.dumps(row, default=lambda value: {'__datetime__': value.isoformat()})
+
+
+def _loads(line):
+    def _decode(obj):
+        if '__datetime__' in obj:
+            return dt.datetime.strptime(obj['__datetime__'][:19], '%Y-%m-%dT%H:%M:%S')
+        return obj
+
+    return json.loads(line, object_hook=_decode)
+
+
+class MonitoringSink(object):
+    """Buffer monitoring rows and insert them in bulk, see module documentation.
+
+    Args:
+        engine (sqlalchemy.engine.Engine):
+        spill_path (str): file keeping rows that could not be inserted
+        batch_size (int): rows buffered before inserting them
+
+    """
+
+    def __init__(self, engine, spill_path, batch_size=BATCH_SIZE):
+        self.engine = engine
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        # jobs of the process still running, see `started`
+        self._running = 0
+
+    def add(self, stats: Dict):
+        """Buffer stats of a job.
+
+        Returns:
+            bool: True if the buffer is full and should be flushed
+
+        """
+        row = to_row(stats)
+        if row is None:
+            logger.info('redshift monitoring not supported')
+            return False
+
+        with self._lock:
+            self._buffer.append(row)
+            return len(self._buffer) >= self.batch_size
+
+    def started(self):
+        """Count a job of the process as running, until `finished`."""
+        with self._lock:
+            self._running += 1
+
+    def finished(self, stats=None):
+        """Buffer stats of a finished job, if they are worth uploading.
+
+        Returns:
+            bool: True if the buffer should be flushed, either because it is full
+                or because no other job of the process is running
+
+        """
+        full = self.add(stats) if stats else False
+        with self._lock:
+            self._running = max(0, self._running - 1)
+            return full or (self._running == 0 and bool(self._buffer))
+
+    def flush(self):
+        """Insert buffered and spilled rows, spill them if the database is unreachable.
+
+        Returns:
+            int: number of rows inserted
+
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            spilled = self._read_spill()
+            if not rows and not spilled:
+                return 0
+
+            try:
+                self._insert(spilled + rows)
+            except (OperationalError, InterfaceError) as exc:
+                logger.warning('failed to upload %s monitoring rows: %s', len(rows), exc)
+                self._spill(rows)
+                return 0
+            except DBAPIError:
+                # rejected rows would block every later upload if spilled again
+                logger.exception('monitoring rows rejected, %s rows dropped', len(rows))
+                if spilled:
+                    os.replace(self.spill_path, self.spill_path + '.rejected')
+                return 0
+
+            if spilled:
+                logger.info('replayed %s spilled monitoring rows', len(spilled))
+                os.remove(self.spill_path)
+            return len(spilled) + len(rows)
+
+    def _insert(self, rows):
+        by_table = {}
+        for table, row in rows:
+            by_table.setdefault(table, []).append(row)
+
+        # one transaction, spilled rows are either all inserted or all kept
+        with self.engine.begin() as conn:
+            for table, values in by_table.items():
+                model = MODELS[table]
+                columns = set(model.__table__.columns.keys())
+                values = [{k: v for k, v in row.items() if k in columns} for row in values]
+                conn.execute(model.__table__.insert(), values)
+
+    def _read_spill(self):
+        try:
+            with open(self.spill_path) as fd:
+                return [tuple(_loads(line)) for line in fd if line.strip()]
+        except (IOError, OSError):
+            return []
+
+    def _spill(self, rows):
+        if not rows:
+            return
+        if os.path.dirname(self.spill_path):
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, 'a') as fd:
+            for row in rows:
+                fd.write(_dumps(row) + '\n')
+        logger.info('spilled %s monitoring rows to %s', len(rows), self.spill_path)
+
+
+_sinks = {}
+
+
+def get_sink(settings=None):
+    """Get the sink of the process, created on first use.
+
+    Jobs flush the sink themselves, from the reactor, see `MonitoringSink.finished`.
+    Flushing it on exit is only a fallback for rows left over by an interrupted job.
+
+    """
+    settings = settings or Settings()
+    db_url = settings['MONITORING_DB']
+    if db_url not in _sinks:
+        from scrapy.utils.project import data_path
+
+        sink = MonitoringSink(
+            get_engine(db_url),
+            spill_path=data_path(settings.get('MONITORING_SPILL_FILE') or SPILL_FILE),
+            batch_size=int(settings.get('MONITORING_BATCH_SIZE') or BATCH_SIZE),
+        )
+        atexit.register(sink.flush)
+        _sinks[db_url] = sink
+
+    return _sinks[db_url]
+
+
+def upsert_metrics(stats: Dict):
+    """Upload stats of a job right away, with rows spilled by previous uploads."""
+    sink = get_sink()
+    sink.add(stats)
+    sink.flush()
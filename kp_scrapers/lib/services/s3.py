@@ -1,11 +1,23 @@
-"""AWS S3 interfaces."""
+"""AWS S3 interfaces.
+
+Clients are expensive to build (session, endpoint resolution, connection
+pool), so they are created once per credentials and region and shared for
+the lifetime of the process. boto3 clients are thread-safe, resources are
+not, hence resources are kept per thread.
+
+Set `AWS_S3_ENDPOINT_URL` to talk to a local S3 stand-in such as MinIO or a
+moto server.
+
+"""
 
 from contextlib import contextmanager
 from io import BytesIO
 import json
 import logging
+import threading
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from kp_scrapers.lib.compression import gzip_uncompress
@@ -17,6 +29,78 @@ logging.getLogger('botocore').setLevel(logging.CRITICAL)
 logging.getLogger('boto3').setLevel(logging.CRITICAL)
 
 
+# connections kept alive per client, enough for a few concurrent downloads
+MAX_POOL_CONNECTIONS = 20
+
+_sessions = {}
+_clients = {}
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def _pool_key(config=None, region_name=None):
+    settings = config or Settings()
+    return (
+        settings.get('AWS_ACCESS_KEY_ID'),
+        settings.get('AWS_SECRET_ACCESS_KEY'),
+        region_name or settings.get('AWS_DEFAULT_REGION'),
+        settings.get('AWS_S3_ENDPOINT_URL'),
+    )
+
+
+def _session(key):
+    # NOTE callers hold `_lock`, sessions are not thread-safe
+    if key not in _sessions:
+        access_key, secret_key, region_name, _ = key
+        _sessions[key] = boto3.session.Session(
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region_name,
+        )
+    return _sessions[key]
+
+
+def client(config=None, region_name=None):
+    """Get the shared S3 client for the given credentials and region.
+
+    Args:
+        config(dict): AWS credentials defined like standard ENV
+        region_name(str): defaults to `AWS_DEFAULT_REGION`
+
+    Returns:
+        botocore.client.S3:
+
+    """
+    key = _pool_key(config, region_name)
+    with _lock:
+        if key not in _clients:
+            logger.debug('Connecting to S3 service')
+            _clients[key] = _session(key).client(
+                's3',
+                endpoint_url=key[3],
+                config=Config(max_pool_connections=MAX_POOL_CONNECTIONS),
+            )
+        return _clients[key]
+
+
+def resource(config=None, region_name=None):
+    """Get this thread's S3 resource for the given credentials and region."""
+    key = _pool_key(config, region_name)
+    resources = _local.__dict__.setdefault('resources', {})
+    if key not in resources:
+        with _lock:
+            resources[key] = _session(key).resource('s3', endpoint_url=key[3])
+    return resources[key]
+
+
+def reset():
+    """Forget pooled clients, e.g. after credentials rotation or a fork."""
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+        _local.__dict__.clear()
+
+
 @contextmanager
 def connect_to_s3(config=None):
     """Wraps S3 conn with defaults and error handler.
@@ -25,15 +109,8 @@ def connect_to_s3(config=None):
         config(dict): AWS credentials defined like standard ENV
 
     """
-    settings = config or Settings()
-    logger.debug('Connecting to S3 service')
-
     try:
-        yield boto3.resource(
-            's3',
-            aws_access_key_id=settings['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=settings['AWS_SECRET_ACCESS_KEY'],
-        )
+        yield resource(config)
     except ClientError as e:
         logger.error(f'Failed to connect to S3: {e}')
 
@@ -44,17 +121,107 @@ def iter_files(bucket_name, **kwargs):
         yield from bucket.objects.filter(**kwargs)
 
 
-def fetch_file(bucket_name, key_name, deserializer=json.loads, uncompress=False):
-    # TODO handle exceptions, especially on bucket or key not found
-    with connect_to_s3() as s3:
-        logger.debug(f'Downloading S3 object: {bucket_name}/{key_name}')
-        s3_object = s3.Object(bucket_name, key_name).get()
+def _byte_range(start=0, end=None):
+    """Format an HTTP range header, `end` being inclusive.
+
+    Examples:
+        >>> _byte_range(10, 19)
+        'bytes=10-19'
+        >>> _byte_range(10)
+        'bytes=10-'
+        >>> _byte_range() is None
+        True
+
+    """
+    if not start and end is None:
+        return None
+    return 'bytes={}-{}'.format(start, '' if end is None else end)
+
 
-        if key_name.endswith('.gz') or uncompress:
-            yield from gzip_uncompress(_download_fileobj(s3_object), deserialize=deserializer)
+def open_file(bucket_name, key_name, start=0, end=None):
+    """Open a streaming body over an S3 object, or a byte range of it.
 
+    Args:
+        bucket_name(str):
+        key_name(str):
+        start(int): first byte to read
+        end(int | None): last byte to read, inclusive
+
+    Returns:
+        botocore.response.StreamingBody: read it or iterate over it, then close it
+
+    """
+    logger.debug(f'Downloading S3 object: {bucket_name}/{key_name}')
+    params = {'Bucket': bucket_name, 'Key': key_name}
+    byte_range = _byte_range(start, end)
+    if byte_range:
+        params['Range'] = byte_range
+    return client().get_object(**params)['Body']
+
+
+def iter_lines(bucket_name, key_name, start=0, end=None, encoding='utf-8', chunk_size=1024 ** 2):
+    """Stream the lines of an S3 object, without loading it whole.
+
+    Gzipped objects (`.gz` keys) are uncompressed on the fly, in which case
+    `start` and `end` are offsets in the compressed object and only make
+    sense to resume at a known gzip member boundary.
+
+    Args:
+        bucket_name(str):
+        key_name(str):
+        start(int): first byte to read
+        end(int | None): last byte to read, inclusive
+        encoding(str):
+        chunk_size(int): bytes read from the network at a time
+
+    Yields:
+        str: lines, without their line ending
+
+    """
+    body = open_file(bucket_name, key_name, start=start, end=end)
+    try:
+        if key_name.endswith('.gz'):
+            yield from gzip_uncompress(body, reader=_lines, encoding=encoding)
         else:
-            yield _download_fileobj(s3_object)
+            for line in body.iter_lines(chunk_size=chunk_size):
+                yield line.decode(encoding)
+    finally:
+        body.close()
+
+
+def fetch_file(
+    bucket_name, key_name, deserializer=json.loads, uncompress=False, stream=False, **byte_range
+):
+    """Fetch an S3 object.
+
+    Gzipped objects are always streamed and yield one deserialized line at a
+    time. Otherwise, a single file object is yielded: an in-memory copy of
+    the object since callers may need to seek in it (e.g. zip archives), or
+    the streaming body itself with `stream=True`.
+
+    Args:
+        bucket_name(str):
+        key_name(str):
+        deserializer(callable): applied to each line of gzipped objects
+        uncompress(bool): force gzip decompression whatever the key extension
+        stream(bool): yield the streaming body rather than a `BytesIO`
+        byte_range: `start` and `end` offsets, see `open_file`
+
+    """
+    # TODO handle exceptions, especially on bucket or key not found
+    body = open_file(bucket_name, key_name, **byte_range)
+
+    if key_name.endswith('.gz') or uncompress:
+        try:
+            yield from gzip_uncompress(body, reader=_lines, deserialize=deserializer)
+        finally:
+            body.close()
+
+    elif stream:
+        yield body
+
+    else:
+        yield _download_fileobj(body)
 
 
 def upload_blob(bucket, key, blob, serializer=json.dumps):
@@ -64,5 +231,9 @@ def upload_blob(bucket, key, blob, serializer=json.dumps):
         return s3.Bucket(bucket).put_object(Key=key, Body=data)
 
 
-def _download_fileobj(s3_obj):
-    return BytesIO(s3_obj['Body'].read())
+def _lines(fileobj):
+    return (line.rstrip('\r\n') for line in fileobj)
+
+
+def _download_fileobj(body):
+    return BytesIO(body.read())
@@ -7,10 +7,12 @@ from collections import namedtuple
 import json
 import logging
 import os
+import threading
 
 import requests
 from requests.auth import HTTPBasicAuth
 from scrapinghub import ScrapinghubClient
+from scrapy.settings import BaseSettings, get_settings_priority, SettingsAttribute
 from scrapy.utils.project import get_project_settings as Settings
 import yaml
 
@@ -48,8 +50,66 @@ logger = logging.getLogger(__name__)
 # know that.
 PROD_PROJECT_ID = 321191
 
+# settings resolved so far, per Scrapinghub namespace
+_snapshots = {}
+_snapshots_lock = threading.Lock()
 
-def global_settings(namespace='project_settings'):
+
+class SettingsOverlay(BaseSettings):
+    """Read-only view of some settings with a few values overridden.
+
+    Only overrides are stored, other lookups fall through to `base`, so this
+    is cheap to build even on top of the whole project settings. Typed
+    accessors (`getint`, `getbool`, `getlist`, ...) work as usual.
+
+    Examples:
+        >>> base = BaseSettings({'RETRY_TIMES': '2', 'RETRY_ENABLED': True})
+        >>> settings = SettingsOverlay(base, {'RETRY_TIMES': '5'})
+        >>> settings.getint('RETRY_TIMES'), settings.getbool('RETRY_ENABLED')
+        (5, True)
+        >>> base.getint('RETRY_TIMES')
+        2
+
+    """
+
+    def __init__(self, base, overrides):
+        super(SettingsOverlay, self).__init__()
+        self.base = base
+        # `set` would look overridden names up in `base`
+        for name, value in overrides.items():
+            self.attributes[name] = SettingsAttribute(value, get_settings_priority('spider'))
+        self.freeze()
+
+    def __getitem__(self, name):
+        if name in self.attributes:
+            return self.attributes[name].value
+        return self.base[name]
+
+    def __contains__(self, name):
+        return name in self.attributes or name in self.base
+
+    def __iter__(self):
+        yield from self.attributes
+        yield from (name for name in self.base if name not in self.attributes)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def _load_settings(namespace):
+    raw_shub_settings = (
+        os.environ.get('SHUB_SETTINGS', '{}').encode('utf-8').decode('unicode_escape')
+    )
+    shub_settings = json.loads(raw_shub_settings).get(namespace)
+    scrapy_settings = Settings().copy()
+    # merge them
+    scrapy_settings.update(shub_settings)
+    scrapy_settings.freeze()
+
+    return scrapy_settings
+
+
+def global_settings(namespace='project_settings', refresh=False):
     """Unify Scrapy and Scrapinghub settings into one entrypoint.
 
     See the following for namespaces of Scrapinghub settings:
@@ -68,22 +128,50 @@ def global_settings(namespace='project_settings'):
 
             from kp_scrapers.lib.services.shub import global_settings as Settings
 
+    NOTE 3: Settings are resolved once per process and frozen, since loading
+    them imports every settings module and parses the environment. Use
+    `refresh=True` or `refresh_settings()` if the environment changed.
+
     """
-    raw_shub_settings = (
-        os.environ.get('SHUB_SETTINGS', '{}').encode('utf-8').decode('unicode_escape')
-    )
-    shub_settings = json.loads(raw_shub_settings).get(namespace)
-    scrapy_settings = Settings().copy()
-    # merge them
-    scrapy_settings.update(shub_settings)
+    with _snapshots_lock:
+        if refresh or namespace not in _snapshots:
+            _snapshots[namespace] = _load_settings(namespace)
+        return _snapshots[namespace]
 
-    return scrapy_settings
+
+def refresh_settings():
+    """Forget settings resolved so far, the next access reloads them."""
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def spider_settings(spider, namespace='project_settings'):
+    """Project settings as seen by the given spider.
+
+    Layers the same spider level settings as `KplerMixin.update_settings` on
+    top of `global_settings`, without copying them.
+
+    Args:
+        spider (type | scrapy.Spider | dict): spider (class) or mapping of overrides
+
+    Returns:
+        SettingsOverlay:
+
+    """
+    if isinstance(spider, dict):
+        overrides = spider
+    else:
+        overrides = {}
+        for attribute in ('custom_settings', 'category_settings', 'spider_settings'):
+            overrides.update(getattr(spider, attribute, None) or {})
+
+    return SettingsOverlay(global_settings(namespace), overrides)
 
 
 def shub_conn():
     # don't use default `.get()` property because then it will evaluate
     # `settings.SH_API_KEY` anyway and you might not have setup it locally
-    api_key = os.environ.get('SH_API_KEY') or Settings().get('SH_API_KEY')
+    api_key = os.environ.get('SH_API_KEY') or global_settings().get('SH_API_KEY')
 
     # NOTE not really safe when `name` doesn't exist
     return ScrapinghubClient(api_key)
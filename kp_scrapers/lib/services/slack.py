@@ -5,7 +5,7 @@
 from __future__ import absolute_import
 from collections import namedtuple
 
-from slackclient import SlackClient
+import requests
 
 from kp_scrapers.lib.services.shub import global_settings as Settings
 
@@ -69,12 +69,16 @@ def select_channel():
     return Settings().get('SLACK_CHANNEL') or DEFAULT_CHANNEL
 
 
-def send(text, channel=None, attachments=None):
+def send(text, channel=None, attachments=None, timeout=None):
+    # only needed to post with a token, webhooks don't need it
+    from slackclient import SlackClient
+
     sc = SlackClient(Settings().get('SLACK_TOKEN'))
     channel = channel or select_channel()
 
     res = sc.api_call(
         'chat.postMessage',
+        timeout=timeout,
         channel=channel,
         text=text,
         # overwrite user name (otherwise guess from token)
@@ -87,6 +91,22 @@ def send(text, channel=None, attachments=None):
     return res
 
 
+def post_webhook(url, text, attachments=None, timeout=None):
+    """Post a message with an incoming webhook, which targets its own channel.
+
+    Returns:
+        Dict[str, str]: `ok` and `error` keys, like `send`
+
+    """
+    res = requests.post(
+        url,
+        json={'text': text, 'attachments': attachments or [], 'username': PROJECT_USER},
+        timeout=timeout,
+    )
+    # webhooks answer a plain `ok` rather than json
+    return {'ok': res.ok, 'error': None if res.ok else f'{res.status_code} {res.text}'}
+
+
 def build_table(**kwargs):
     """A less verbose solution to define `fields` in messages."""
     return [{'title': k, 'value': v, 'short': True} for k, v in kwargs.items()]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""Scrapy spider loader that only imports spiders when actually needed.
+
+Scrapy default loader imports every module of `SPIDER_MODULES` as soon as a
+`CrawlerProcess` is created, even for commands that never touch a spider
+class (i.e. `scrapy describe` answering from its manifest). With hundreds of
+spiders and their dependencies (pandas, xlrd, lxml, ...) this costs seconds.
+
+"""
+
+from __future__ import absolute_import
+
+from scrapy.spiderloader import SpiderLoader
+
+
+class LazySpiderLoader(SpiderLoader):
+    """Defer spider modules import until spiders are listed or loaded."""
+
+    _loaded = False
+
+    def _load_all_spiders(self):
+        # called by `SpiderLoader.__init__`, postponed until first use
+        pass
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._loaded = True
+            super()._load_all_spiders()
+
+    def load(self, spider_name):
+        self._ensure_loaded()
+        return super().load(spider_name)
+
+    def find_by_request(self, request):
+        self._ensure_loaded()
+        return super().find_by_request(request)
+
+    def list(self):
+        self._ensure_loaded()
+        return super().list()
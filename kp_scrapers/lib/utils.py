@@ -10,6 +10,7 @@ import logging
 import os
 import random
 import re
+import threading
 import time
 from typing import Any
 import unicodedata
@@ -259,10 +260,13 @@ def strip_non_ascii(text):
     return ''.join(c for c in text if ord(c) < 128).strip()
 
 
-def retry(tries=1, wait=0):
+def retry(tries=1, wait=0, backoff=1):
     """A decorator that retries a method a certain number of times and wait a
     certain number of seconds between each try.
 
+    The wait is multiplied by `backoff` after each failure, so `backoff=2`
+    gives an exponential backoff.
+
     .. todo::
 
        There is also a retry_on_deadlock_decorator() function in etl.orm.utils.
@@ -278,12 +282,16 @@ def retry(tries=1, wait=0):
 
     def retry_decorator(fn):
         def retry_function(*args, **kwargs):
+            delay = wait
             for _ in range(tries - 1):
                 try:
                     return fn(*args, **kwargs)
                 except Exception as e:
-                    logger.warning('`{}` failed: {} - retrying in {}s'.format(fn.__name__, e, wait))
-                    time.sleep(wait)
+                    logger.warning(
+                        '`{}` failed: {} - retrying in {}s'.format(fn.__name__, e, delay)
+                    )
+                    time.sleep(delay)
+                    delay *= backoff
             return fn(*args, **kwargs)
 
         return retry_function
@@ -412,6 +420,9 @@ def is_number(check_number: Any) -> bool:
 class throttle(object):
     """Decorator that prevents a function from being called more than once every time period.
 
+    Calls made within the period are silently dropped and return None, use
+    `TokenBucket` when every call must go through.
+
     To create a function that cannot be called more than once a minute:
         @throttle(minutes=1)
         def my_fun():
@@ -436,6 +447,58 @@ class throttle(object):
         return wrapper
 
 
+class TokenBucket(object):
+    """Rate limiter that waits for capacity instead of dropping calls.
+
+    Unlike `throttle`, every call eventually goes through: the bucket holds up
+    to `capacity` tokens, refilled at `rate` tokens per second, and callers
+    sleep until enough tokens are available. It can be used as a decorator:
+
+        @TokenBucket(rate=5)
+        def my_api_call():
+            pass
+
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def consume(self, tokens=1):
+        """Block until `tokens` are available, and return the time spent waiting."""
+        waited = 0.0
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                waited = (tokens - self._tokens) / self.rate
+                self._sleep(waited)
+                self._refill()
+                # we slept long enough, don't let clock resolution make us wait again
+                self._tokens = max(self._tokens, tokens)
+
+            self._tokens -= tokens
+
+        return waited
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.consume()
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+
 def flatten_dict(dd, separator='.', prefix=''):
     """Flatten arbitrary nested dictionaries.
 
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""Record and replay crawls from a local cassette.
+
+`CassetteMiddleware` is a drop-in replacement of `HistoryMiddleware`. It
+behaves the same unless `HISTORY_CASSETTE` is set:
+
+- `record`: every response is stored in a local cassette, keyed by request
+  fingerprint, while the spider crawls as usual
+- `replay`: responses are served from the cassette and nothing reaches the
+  network. Requests missing from the cassette are dropped and reported
+
+Cassettes are sqlite files, one per spider, in `HISTORY_CASSETTE_DIR`.
+Responses are stored as plain columns, headers as json and bodies as
+compressed blobs, so that replaying a cassette shared by someone else never
+runs code from it. They can be copied around to run the same crawl
+offline, for instance to measure parser throughput on real pages:
+
+    $ scrapy crawl MySpider -s HISTORY_CASSETTE=record
+    $ scrapy crawl MySpider -s HISTORY_CASSETTE=replay
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+import logging
+import json
+import os
+import sqlite3
+import zlib
+
+from history.logic import RetrieveAlways, RetrieveNever, StoreAlways, StoreNever
+from history.middleware import HistoryMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+
+try:
+    from scrapy.utils.request import request_fingerprint
+except ImportError:
+    # scrapy >= 2.7 moved to binary fingerprints
+    from scrapy.utils.request import fingerprint
+
+    def request_fingerprint(request):
+        return fingerprint(request).hex()
+
+
+logger = logging.getLogger(__name__)
+
+
+RECORD = 'record'
+REPLAY = 'replay'
+# misses listed in logs when the spider closes, the count is in stats anyway
+MAX_REPORTED_MISSES = 20
+# responses recorded between commits, so that a crash keeps most of them
+COMMIT_EVERY = 100
+
+
+def _dump_headers(headers):
+    """Serialise scrapy headers as json, they are latin-1 on the wire.
+
+    Examples:
+        >>> _dump_headers(Headers({'Content-Type': 'text/html', 'Set-Cookie': ['a=1', 'b=2']}))
+        '{"Content-Type": ["text/html"], "Set-Cookie": ["a=1", "b=2"]}'
+
+    """
+    return json.dumps(
+        {
+            key.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for key, values in headers.items()
+        }
+    )
+
+
+class CassetteStorage(object):
+    """Store responses in a local sqlite file, bodies being zlib compressed.
+
+    Implements the `HISTORY_BACKEND` interface so that it can also be used
+    with the regular `HistoryMiddleware`.
+
+    """
+
+    def __init__(self, stats, settings):
+        self.stats = stats
+        self.root = settings.get('HISTORY_CASSETTE_DIR') or data_path('cassettes')
+        self._db = None
+
+    def path(self, spider):
+        return os.path.join(self.root, '{}.cassette'.format(spider.name))
+
+    def open_spider(self, spider):
+        os.makedirs(self.root, exist_ok=True)
+        self._db = sqlite3.connect(self.path(spider))
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'fingerprint TEXT PRIMARY KEY, url TEXT, response_url TEXT, status INTEGER, '
+            'headers TEXT, body BLOB)'
+        )
+
+    def close_spider(self, spider):
+        self._db.commit()
+        self._db.close()
+
+    def retrieve_response(self, spider, request):
+        row = self._db.execute(
+            'SELECT response_url, status, headers, body FROM responses WHERE fingerprint = ?',
+            (request_fingerprint(request),),
+        ).fetchone()
+        if not row:
+            return None
+
+        url, status, headers, body = row
+        headers = Headers(json.loads(headers))
+        response_cls = responsetypes.from_args(headers=headers, url=url)
+        return response_cls(url=url, headers=headers, status=status, body=zlib.decompress(body))
+
+    def store_response(self, spider, request, response):
+        self._db.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                request_fingerprint(request),
+                request.url,
+                response.url,
+                response.status,
+                _dump_headers(response.headers),
+                zlib.compress(response.body),
+            ),
+        )
+        self.stats.inc_value('cassette/recorded', spider=spider)
+        if self.stats.get_value('cassette/recorded', spider=spider) % COMMIT_EVERY == 0:
+            self._db.commit()
+
+
+class CassetteMiddleware(HistoryMiddleware):
+    """`HistoryMiddleware` with local record and replay modes.
+
+    Settings:
+        HISTORY_CASSETTE(str): `record` or `replay`, regular history if unset
+        HISTORY_CASSETTE_DIR(str): where cassettes are stored, `.scrapy/cassettes` by default
+
+    """
+
+    def __init__(self, crawler):
+        self.mode = crawler.settings.get('HISTORY_CASSETTE')
+        if not self.mode:
+            super(CassetteMiddleware, self).__init__(crawler)
+            return
+
+        if self.mode not in (RECORD, REPLAY):
+            raise NotConfigured('unknown HISTORY_CASSETTE mode: {}'.format(self.mode))
+
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.storage = CassetteStorage(self.stats, settings)
+        self.misses = []
+        if self.mode == RECORD:
+            self.epoch = False
+            self.retrieve_if = RetrieveNever(settings)
+            self.store_if = StoreAlways(settings)
+        else:
+            self.epoch = True
+            self.retrieve_if = RetrieveAlways(settings)
+            self.store_if = StoreNever(settings)
+        self.ignore_missing = self.mode == REPLAY
+
+    def spider_opened(self, spider):
+        super(CassetteMiddleware, self).spider_opened(spider)
+        if self.mode:
+            logger.info('{} cassette {}'.format(self.mode, self.storage.path(spider)))
+
+    def spider_closed(self, spider):
+        super(CassetteMiddleware, self).spider_closed(spider)
+        if self.mode == REPLAY and self.misses:
+            logger.warning(
+                '{} requests missing from cassette, first ones: {}'.format(
+                    self.stats.get_value('cassette/misses', spider=spider),
+                    ', '.join(self.misses),
+                )
+            )
+
+    def process_request(self, request, spider):
+        if self.mode != REPLAY:
+            return super(CassetteMiddleware, self).process_request(request, spider)
+
+        # NOTE unlike the parent, never let a request through to the network
+        response = self.storage.retrieve_response(spider, request)
+        if response is None:
+            self.stats.inc_value('cassette/misses', spider=spider)
+            if len(self.misses) < MAX_REPORTED_MISSES:
+                self.misses.append(request.url)
+            raise IgnoreRequest('not in cassette: {}'.format(request))
+
+        self.stats.inc_value('cassette/hits', spider=spider)
+        response.flags.append('historic')
+        return response
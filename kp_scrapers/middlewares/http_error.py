@@ -1,16 +1,76 @@
+"""Decide what to do with HTTP errors, per host and status.
+
+Behaviours:
+
+    - finish:   log, drop the response and count it against the error budget
+    - continue: log and let the callback handle the response
+    - retry:    request again later, honouring `Retry-After` or backing off
+                exponentially, then `finish` once retries are exhausted.
+                Retries are held on the reactor until their delay elapsed,
+                outside the downloader so that they don't take up
+                `CONCURRENT_REQUESTS`, and the spider is kept open meanwhile
+
+`ON_HTTP_ERROR` is the default behaviour, `HTTP_ERROR_POLICIES` overrides it
+for some hosts and/or statuses, the most specific rule winning:
+
+    HTTP_ERROR_POLICIES = {
+        '429': 'retry',
+        '5xx': 'retry',
+        'static.example.com': 'continue',
+        'api.example.com 404': 'continue',
+    }
+
+Once more than `HTTP_ERROR_BUDGET` responses were dropped, the spider is
+closed (with the `finished` reason, see `process_spider_input`). The budget
+is unlimited by default.
+
+Logged errors only carry the beginning of the response body
+(`HTTP_ERROR_BODY_LIMIT` bytes), for the first error of every host and
+status, then for a sample of them (`HTTP_ERROR_BODY_SAMPLE_RATE`).
+
+"""
+
+import email.utils
 import http
+import inspect
 import logging
+import random
+import time
+from urllib.parse import urlparse
 
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import reactor
 
-POSSIBLE_BEHAVIORS = ['finish', 'continue']
+
+POSSIBLE_BEHAVIORS = ['finish', 'continue', 'retry']
 # it seems reasonable to think that hitting a 503 or 404 page usually means we
 # reached the limit of the resource or are searching for something wrong. But
 # we may play safe and simply finish, in order to not waste what was scraped so
 # far
 DEFAULT_BEHAVIOR = 'finish'
 
+# retry policy defaults, delays in seconds
+MAX_RETRIES = 3
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+# body captured in error logs, in bytes
+BODY_LIMIT = 1024
+BODY_SAMPLE_RATE = 0.1
+
+# meta keys of retried requests
+RETRIES_META = 'http_error_retries'
+DELAY_META = 'http_error_delay'
+
+# reason given when the error budget is exhausted, see `process_spider_input`
+CLOSE_REASON = 'finished'
+
 logger = logging.getLogger(__name__)
 
+# status code -> name, `http.HTTPStatus` lookups by value are linear
+_STATUS_NAMES = {status.value: status.name for status in http.HTTPStatus}
+
 
 def translate_code(code):
     """Translate code to human reason from standard http codes meaning.
@@ -33,19 +93,109 @@ def translate_code(code):
         (200, 'OK')
 
     """
-    matches = [status for status in http.HTTPStatus if status.value == code]
-    if not matches:
+    name = _STATUS_NAMES.get(code)
+    if name is None:
         logger.error('Invalid HTTP status code: %s', code)
         return None
 
-    return matches[0].value, matches[0].name
+    return code, name
+
+
+def retry_after(response, now=None):
+    """Delay requested by the server with `Retry-After`, in seconds, if any.
+
+    Examples:
+        >>> from scrapy.http import Response
+        >>> retry_after(Response('http://example.com', headers={'Retry-After': '120'}))
+        120.0
+        >>> retry_after(Response(
+        ...     'http://example.com', headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:30 GMT'}
+        ... ), now=1445412480)
+        30.0
+        >>> retry_after(Response('http://example.com', headers={'Retry-After': 'soon'}))
+
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    value = value.decode('latin-1').strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - (now or time.time()), 0.0)
+
+
+def backoff(retries, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Exponential backoff with full jitter, in seconds.
+
+    Examples:
+        >>> 0 <= backoff(0) <= 2
+        True
+        >>> backoff(20, cap=60) <= 60
+        True
+
+    """
+    return random.uniform(0, min(cap, base * 2 ** retries))
+
+
+class ErrorPolicy(object):
+    """Resolve the behaviour for a host and status, from the most specific rule.
+
+    Rules are keyed by `<host> <status>`, `<host> <class>xx`, `<host>`,
+    `<status>` or `<class>xx`. Resolutions are cached, a host and status pair
+    being looked up once.
+
+    Examples:  # noqa
+        >>> policy = ErrorPolicy('finish', {'5xx': 'retry', 'a.com': 'continue', 'a.com 503': 'finish'})
+        >>> policy('b.com', 502), policy('a.com', 502), policy('a.com', 503), policy('b.com', 404)
+        ('retry', 'continue', 'finish', 'finish')
+
+    """
+
+    def __init__(self, default, rules=None):
+        self.default = default
+        self.rules = {}
+        for key, behavior in (rules or {}).items():
+            if behavior not in POSSIBLE_BEHAVIORS:
+                raise ValueError(f'invalid behavior for {key}: {behavior}')
+            self.rules[str(key).strip().lower()] = behavior
+        self._cache = {}
+
+    def __call__(self, host, status):
+        key = (host, status)
+        if key not in self._cache:
+            self._cache[key] = self._resolve(host, status)
+        return self._cache[key]
+
+    def _resolve(self, host, status):
+        family = f'{status // 100}xx'
+        for rule in (f'{host} {status}', f'{host} {family}', host, str(status), family):
+            if rule in self.rules:
+                return self.rules[rule]
+        return self.default
+
+
+def _crawl(engine, request, spider):
+    """Schedule a request, whatever the signature of the engine."""
+    if 'spider' in inspect.signature(engine.crawl).parameters:
+        # scrapy < 2.10
+        engine.crawl(request, spider)
+    else:
+        engine.crawl(request)
 
 
 class _SpiderHTTPError(Exception):
     """An invalid response was received."""
 
-    def __init__(self, response, *args, **kwargs):
+    def __init__(self, response, *args, retry=None, **kwargs):
         self.response = response
+        # request to schedule instead of the response, if any
+        self.retry = retry
         super().__init__(*args, **kwargs)
 
 
@@ -60,13 +210,39 @@ class HTTPErrorMiddleware(object):
     Note that this middleware is almost equivalent to Scrapy's built-in
     `scrapy.spidermiddlewares.httperror.HttpErrorMiddleware`.
     It just brings full control over the process and start leveraging it with
-    custom behaviour.
+    custom behaviour, see module documentation.
 
     """
 
-    def __init__(self, on_error):
+    def __init__(
+        self,
+        on_error,
+        policies=None,
+        crawler=None,
+        budget=None,
+        max_retries=MAX_RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX,
+        body_limit=BODY_LIMIT,
+        body_sample_rate=BODY_SAMPLE_RATE,
+    ):
         logger.debug(f"Spider will '{on_error}' on bad http responses")
         self.on_error = on_error
+        self.policy = ErrorPolicy(on_error, policies)
+        self.crawler = crawler
+        self.stats = crawler.stats if crawler else None
+        self.budget = budget
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.body_limit = body_limit
+        self.body_sample_rate = body_sample_rate
+        self.dropped = 0
+        # (host, status) of errors logged so far, their first body is always captured
+        self._seen = set()
+        # retries waiting for their delay to elapse, scheduled on `clock`
+        self.clock = reactor
+        self._held = set()
 
     @staticmethod
     def invalid(response):
@@ -76,41 +252,108 @@ class HTTPErrorMiddleware(object):
     def process_spider_input(self, response, spider):
         """Preprocess spider responses for "invalid" HTTP codes.
 
-        There are 2 behaviors possible, which completely depend on the source:
+        There are 3 behaviors possible, which completely depend on the source:
             - 'finish' (default) : this is highly unexpected and should fixed ASAP
               OR
               we hit the provider limit and should stop there, keeping the
               items scraped so far available for downstream processing
             - 'continue' : it's in our tolerance range, log and continue
+            - 'retry' : it's transient, try again later
 
         """
         # don't process valid responses
         if not self.invalid(response):
             return
 
-        if self.on_error == 'finish':
-            self._log_http_error(response)
-            # keep calm and close the spider
-            # rational: loaders usually ignore spiders with a status different
-            # than `finished` (that makes sense, we can't trust the spider
-            # output). In our case maybe the spider scraped hundreds of items
-            # before being rate limited. And we most probably want to load them
-            # even if the batch is incomplete (think of AIS messages)
-            raise _SpiderHTTPError(response, f'{translate_code(response.status)}')
+        host = urlparse(response.url).hostname or ''
+        behavior = self.policy(host, response.status)
+        self._inc_stat(f'http_error/{response.status}')
 
-        elif self.on_error == 'continue':
-            # tolerate HTTP error, log and continue
+        if behavior == 'retry':
+            retry = self._retry_request(response)
+            if retry is not None:
+                self._log_http_error(response, level=logging.WARNING)
+                if self.crawler is not None:
+                    # held right away, requests with an errback never reach
+                    # `process_spider_exception`
+                    self._hold(retry, spider)
+                    retry = None
+                raise _SpiderHTTPError(response, f'{translate_code(response.status)}', retry=retry)
+            # retries exhausted, give up on this one
+            behavior = 'finish'
+
+        if behavior == 'finish':
             self._log_http_error(response)
+            self._spend_budget(spider)
+            # drop the response
+            raise _SpiderHTTPError(response, f'{translate_code(response.status)}')
 
-        return
+        # tolerate HTTP error, log and continue
+        self._log_http_error(response)
 
     def process_spider_exception(self, response, exception, spider):
         if isinstance(exception, _SpiderHTTPError):
-            return []
+            # retries are held by `process_spider_input`, unless there is no engine
+            return [exception.retry] if exception.retry is not None else []
+
+    def _hold(self, request, spider):
+        def _release():
+            self._held.discard(call)
+            _crawl(self.crawler.engine, request, spider)
+
+        call = self.clock.callLater(request.meta.get(DELAY_META, 0), _release)
+        self._held.add(call)
+
+    def spider_idle(self, spider):
+        if self._held:
+            # retries are still to be scheduled
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self._held:
+            if call.active():
+                call.cancel()
+        self._held.clear()
+
+    def _retry_request(self, response):
+        request = response.request
+        retries = request.meta.get(RETRIES_META, 0)
+        if retries >= self.max_retries:
+            self._inc_stat('http_error/retries_exhausted')
+            return None
+
+        delay = retry_after(response)
+        if delay is None:
+            delay = backoff(retries, self.backoff_base, self.backoff_max)
+        delay = min(delay, self.backoff_max)
+
+        self._inc_stat('http_error/retries')
+        logger.info(f'Retrying {request} in {delay:.1f}s (retry {retries + 1}/{self.max_retries})')
+        retry = request.replace(dont_filter=True)
+        retry.meta[RETRIES_META] = retries + 1
+        retry.meta[DELAY_META] = delay
+        return retry
+
+    def _spend_budget(self, spider):
+        # keep calm and close the spider
+        # rational: loaders usually ignore spiders with a status different
+        # than `finished` (that makes sense, we can't trust the spider
+        # output). In our case maybe the spider scraped hundreds of items
+        # before being rate limited. And we most probably want to load them
+        # even if the batch is incomplete (think of AIS messages)
+        self.dropped += 1
+        if self.budget is None:
+            return
+
+        self._set_stat('http_error/budget_left', max(self.budget - self.dropped, 0))
+        if self.dropped > self.budget and self.crawler and self.crawler.engine:
+            logger.error(f'HTTP error budget exhausted ({self.budget}), closing spider')
+            self.crawler.engine.close_spider(spider, CLOSE_REASON)
 
     @classmethod
     def from_crawler(cls, crawler):
-        on_error = crawler.settings.get('ON_HTTP_ERROR') or DEFAULT_BEHAVIOR
+        settings = crawler.settings
+        on_error = settings.get('ON_HTTP_ERROR') or DEFAULT_BEHAVIOR
         if on_error not in POSSIBLE_BEHAVIORS:
             logger.warning(
                 f"Invalid behavior configured: {on_error}\n"
@@ -119,18 +362,51 @@ class HTTPErrorMiddleware(object):
             )
             on_error = DEFAULT_BEHAVIOR
 
-        return cls(on_error)
+        budget = settings.get('HTTP_ERROR_BUDGET')
+        middleware = cls(
+            on_error,
+            policies=settings.getdict('HTTP_ERROR_POLICIES'),
+            crawler=crawler,
+            budget=int(budget) if budget is not None else None,
+            max_retries=settings.getint('HTTP_ERROR_MAX_RETRIES', MAX_RETRIES),
+            backoff_base=settings.getfloat('HTTP_ERROR_BACKOFF_BASE', BACKOFF_BASE),
+            backoff_max=settings.getfloat('HTTP_ERROR_BACKOFF_MAX', BACKOFF_MAX),
+            body_limit=settings.getint('HTTP_ERROR_BODY_LIMIT', BODY_LIMIT),
+            body_sample_rate=settings.getfloat('HTTP_ERROR_BODY_SAMPLE_RATE', BODY_SAMPLE_RATE),
+        )
+        crawler.signals.connect(middleware.spider_idle, signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signals.spider_closed)
+        return middleware
+
+    def _capture_body(self, response):
+        key = (urlparse(response.url).hostname, response.status)
+        if key in self._seen and random.random() >= self.body_sample_rate:
+            return None
 
-    @staticmethod
-    def _log_http_error(response):
+        self._seen.add(key)
+        body = response.body[: self.body_limit]
+        if len(response.body) > self.body_limit:
+            body += b'... (%d bytes)' % len(response.body)
+        return body
+
+    def _log_http_error(self, response, level=logging.ERROR):
         message = '{} {} (%(method)s %(url)s)'.format(*translate_code(response.status))
-        logger.error(
+        logger.log(
+            level,
             message,
             {'method': response.request.method, 'url': response.request.url},
             extra={
-                'body': response.body,
+                'body': self._capture_body(response),
                 # TODO doesn't bring much value now to yield headers/cookies
                 # headers=dict(response.request.headers),
                 # cookies=response.request.cookies,
             },
         )
+
+    def _inc_stat(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
+
+    def _set_stat(self, key, value):
+        if self.stats is not None:
+            self.stats.set_value(key, value)
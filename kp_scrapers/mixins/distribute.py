@@ -1,23 +1,272 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 
+"""Split a large universe of work across runs and concurrent jobs.
+
+`DivideAndConquerMixin.divide_work` hands out one slice of the universe per
+run. Three mechanisms let several jobs of the same spider cooperate:
+
+- shards: a job started with `-a shard=i/N` only considers items whose stable
+  hash falls in shard `i`, so N concurrent jobs cover disjoint subsets
+- leases: a job claims its slice for `work_lease_ttl` seconds. Other jobs skip
+  leased slices, and those of a crashed job are claimed again once expired
+- completion bitmap: slices processed by a run that finished normally are
+  marked as done, so that a pass over the universe survives restarts. A new
+  pass starts once every slice is done, or when the slice size changed.
+  Items are assigned to slices by a stable hash, so that items added to or
+  removed from the universe between runs, e.g. a live fleet, do not reset the
+  progress of the pass
+- attempts: a slice claimed `work_max_attempts` times without a run finishing
+  is given up until the next pass, so that it does not starve its shard
+
+The ledger is persisted apart from the spider state, in `<spider>-work`, and
+reloaded before every update to see what other jobs did in the meantime. The
+storage offers no locking, two jobs claiming at the same instant may still
+pick the same slice, shards are the way to rule that out.
+
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import socket
+import time
+import zlib
+
+from scrapy import signals
+
 from kp_scrapers.spiders.bases.persist import PersistSpider
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
+
+
+logger = logging.getLogger(__name__)
+
+
+# default time a job keeps its slice for itself (in seconds)
+LEASE_TTL = 6 * 3600
+
+# default number of runs claiming a slice before giving it up for the pass
+MAX_ATTEMPTS = 3
+
+
+def parse_shard(shard):
+    """Parse a `i/N` shard specification.
+
+    Examples:
+        >>> parse_shard('2/8')
+        (2, 8)
+        >>> parse_shard(None)
+        (0, 1)
+        >>> parse_shard('8/8')
+        Traceback (most recent call last):
+        ...
+        ValueError: invalid shard, expected i/N with 0 <= i < N: 8/8
+
+    """
+    if not shard:
+        return 0, 1
+
+    try:
+        index, count = (int(part) for part in str(shard).split('/'))
+    except ValueError:
+        index, count = -1, 0
+    if not 0 <= index < count:
+        raise ValueError('invalid shard, expected i/N with 0 <= i < N: {}'.format(shard))
+    return index, count
+
+
+def shard_of(key, count):
+    """Stable shard of an item, unlike `hash` which is randomised across processes.
+
+    Examples:
+        >>> shard_of('9465411', 4)
+        1
+        >>> shard_of(9465411, 4)
+        1
+
+    """
+    return zlib.crc32(str(key).encode('utf-8')) % count
+
+
+def slice_of(key, count):
+    """Stable slice of an item, independent from its shard.
+
+    Examples:
+        >>> slice_of('9465411', 4)
+        0
+        >>> sorted({slice_of(key, 2) for key in range(100) if shard_of(key, 2) == 0})
+        [0, 1]
+
+    """
+    return int(hashlib.sha1(str(key).encode('utf-8')).hexdigest(), 16) % count
+
+
+class Bitmap(object):
+    """Fixed-size set of flags, serialised as base64 to fit in json.
+
+    Examples:
+        >>> bitmap = Bitmap(10)
+        >>> bitmap.set(0); bitmap.set(9)
+        >>> Bitmap(10, bitmap.dumps()).count(), 9 in bitmap, 5 in bitmap
+        (2, True, False)
+
+    """
+
+    def __init__(self, size, data=None):
+        self.size = size
+        self._bits = bytearray(base64.b64decode(data)) if data else bytearray((size + 7) // 8)
+
+    def __contains__(self, index):
+        return bool(self._bits[index // 8] & (1 << index % 8))
+
+    def set(self, index):
+        self._bits[index // 8] |= 1 << index % 8
+
+    def count(self):
+        return sum(bin(byte).count('1') for byte in self._bits)
+
+    def dumps(self):
+        return base64.b64encode(bytes(self._bits)).decode('ascii')
+
+
+def _new_pass(work, slices, slice_size):
+    """Reset the progress of a shard."""
+    return {
+        'pass': (work or {}).get('pass', 0) + 1,
+        'slices': slices,
+        'slice_size': slice_size,
+        'done': None,
+        'leases': {},
+        'attempts': {},
+    }
+
+
+def default_owner():
+    """Identify the current job, on Scrapinghub or locally."""
+    return os.getenv('SHUB_JOBKEY') or '{}-{}'.format(socket.gethostname(), os.getpid())
 
 
 class DivideAndConquerMixin(PersistSpider):
-    def divide_work(self, universe: list, slice_size: int) -> list:
-        """Produce a subset of items to process based on previous run."""
-        # check where we left the last time
-        last_slice = self.persisted_data.get('slice')
-        if not last_slice or last_slice > len(universe):
-            # nothing found, start from scratch
-            # or last run processed the last slice, restart from scratch also
-            last_slice = 0
-
-        new_slice = last_slice + slice_size
-
-        # persist state for next run
-        self.persisted_data['slice'] = new_slice
-        self.persisted_data.save()
-
-        return universe[slice(last_slice, new_slice)]
+    # how long a job keeps its slice before other jobs can claim it
+    work_lease_ttl = LEASE_TTL
+    # how many runs may claim a slice without finishing before it is given up
+    work_max_attempts = MAX_ATTEMPTS
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(DivideAndConquerMixin, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.complete_work, signals.spider_closed)
+        # work is usually divided in `__init__`, before the spider has a crawler
+        spider._report_work()
+        return spider
+
+    def _report_work(self):
+        progress = getattr(self, 'work_progress', None)
+        if progress and getattr(self, 'crawler', None):
+            for name, value in progress.items():
+                self.crawler.stats.set_value('work/{}'.format(name), value)
+
+    def _work_ledger(self):
+        # always reload, other jobs may have claimed or completed slices since
+        return PersistDataManager('{}-work'.format(self.name))
+
+    def divide_work(self, universe: list, slice_size: int, shard: str = None) -> list:
+        """Claim a subset of items to process, see module documentation.
+
+        Args:
+            universe: all items to process, in any order
+            slice_size: number of items processed by a run
+            shard: `i/N` shard of the universe, `shard` spider argument by default
+
+        Returns:
+            items of the slice claimed, empty if every slice is leased by other jobs
+
+        """
+        index, count = parse_shard(shard or getattr(self, 'shard', None))
+        key = '{}/{}'.format(index, count)
+        items = sorted((item for item in universe if shard_of(item, count) == index), key=str)
+        slices = max(1, -(-len(items) // slice_size))
+
+        ledger = self._work_ledger()
+        shards = ledger.get('shards', {})
+        work = shards.get(key)
+        if not work or work.get('slice_size') != slice_size:
+            if work:
+                logger.info('slice size of shard %s changed, starting a new pass', key)
+            work = _new_pass(work, slices, slice_size)
+
+        now = time.time()
+        done = Bitmap(work['slices'], work['done'])
+        for position, attempts in work['attempts'].items():
+            if attempts >= self.work_max_attempts and int(position) not in done:
+                logger.warning(
+                    'slice %s of shard %s failed %s times, skipping it', position, key, attempts
+                )
+                done.set(int(position))
+        if done.count() >= work['slices']:
+            logger.info('shard %s fully processed, starting a new pass', key)
+            work = _new_pass(work, slices, slice_size)
+            done = Bitmap(slices)
+        # slice count only changes between passes, so that progress is kept
+        slices = work['slices']
+        # expired leases belong to jobs that crashed or were killed
+        leases = {pos: lease for pos, lease in work['leases'].items() if lease['expires'] > now}
+        free = [pos for pos in range(slices) if pos not in done and str(pos) not in leases]
+        if not free:
+            logger.warning('every slice left in shard %s is leased by other jobs', key)
+            self._claimed = None
+            return []
+
+        position, owner = free[0], default_owner()
+        leases[str(position)] = {'owner': owner, 'expires': now + self.work_lease_ttl}
+        # counted on claim, so that runs killed without closing count as well
+        work['attempts'][str(position)] = work['attempts'].get(str(position), 0) + 1
+        work.update(done=done.dumps(), leases=leases)
+        shards[key] = work
+        ledger['shards'] = shards
+        ledger.save()
+
+        self._claimed = (key, work['pass'], position, owner)
+        self.work_progress = {
+            'shard': key,
+            'slice': position,
+            'slices': slices,
+            'slices_done': done.count(),
+        }
+        self._report_work()
+        logger.info(
+            'claimed slice %s of %s in shard %s (%s done) as %s',
+            position,
+            slices,
+            key,
+            done.count(),
+            owner,
+        )
+        return [item for item in items if slice_of(item, slices) == position]
+
+    def complete_work(self, spider, reason=None):
+        """Mark the claimed slice as done if the run finished, release it otherwise."""
+        claimed = getattr(self, '_claimed', None)
+        if spider is not self or not claimed:
+            return
+
+        key, pass_id, position, owner = claimed
+        self._claimed = None
+        ledger = self._work_ledger()
+        shards = ledger.get('shards', {})
+        work = shards.get(key)
+        if not work or work.get('pass') != pass_id:
+            # another job started a new pass meanwhile
+            return
+
+        if reason == 'finished':
+            done = Bitmap(work['slices'], work['done'])
+            done.set(position)
+            work['done'] = done.dumps()
+            work['attempts'].pop(str(position), None)
+        if work['leases'].get(str(position), {}).get('owner') == owner:
+            del work['leases'][str(position)]
+
+        ledger['shards'] = shards
+        ledger.save()
@@ -9,6 +9,7 @@ from schematics import Model
 from schematics.exceptions import DataError, ValidationError
 
 from kp_scrapers.cli.ui import is_terminal
+from kp_scrapers.lib import profiling
 from kp_scrapers.settings.extensions import MAGIC_FIELDS
 
 
@@ -34,8 +35,17 @@ def validate_item(
 
     """
 
+    stage = 'validate_item/{}'.format(model.__name__)
+
     def _outer_wrapper(fn):
         def _validate(item):
+            profile = profiling.active()
+            if profile is None:
+                return _check(item)
+            with profile.timed(stage):
+                return _check(item)
+
+        def _check(item):
             try:
                 item_as_model = model(item)
                 item_as_model.validate()
@@ -8,30 +8,111 @@ https://doc.scrapy.org/en/stable/topics/feed-exports.html?highlight=feed%20stora
 """
 
 from __future__ import absolute_import, unicode_literals
-import codecs
 import csv
 import datetime as dt
-from io import BytesIO
+from io import BytesIO, StringIO
+import itertools
 import logging
+import os
 
-from kp_scrapers.lib.services.gdrive import GSheetsService
+from kp_scrapers.lib.utils import retry
 
 
 logger = logging.getLogger(__name__)
 
 
+# rows sent per Sheets API call
+BATCH_SIZE = 500
+# attempts per batch, waiting 1s, 2s, 4s, ... in between
+BATCH_TRIES = 4
+
+# spider folders resolved so far, keyed by (parent folder id, spider name)
+_SPIDER_DIRS = {}
+
+
+def _chunks(rows, size):
+    """Split rows in lists of at most `size` rows.
+
+    Examples:
+        >>> list(_chunks([1, 2, 3, 4, 5], 2))
+        [[1, 2], [3, 4], [5]]
+        >>> list(_chunks([], 2))
+        []
+
+    """
+    rows = iter(rows)
+    chunk = list(itertools.islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(rows, size))
+
+
+class LocalSheetsService(object):
+    """Offline stand-in for `GSheetsService`.
+
+    Folders and sheets only live in memory, unless `root` is given in which
+    case every sheet is also dumped as `<root>/<sheet id>.csv` so that a local
+    run can be inspected. Only implements what `DriveBackend` needs.
+
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self.files = {}
+        self.sheets = {}
+        self.calls = []
+
+    def create(self, name, mimetype, **kwargs):
+        self.calls.append('create')
+        metadata = dict(kwargs, id='local-{}'.format(len(self.files) + 1), name=name)
+        metadata['mimeType'] = mimetype
+        self.files[metadata['id']] = metadata
+        if mimetype == DriveBackend.SHEET_MIMETYPE:
+            self.sheets[metadata['id']] = []
+        return metadata
+
+    def list_children(self, folder_id, type_=None, name=None, mimes=None, query=None):
+        self.calls.append('list_children')
+        return [
+            meta
+            for meta in self.files.values()
+            if folder_id in meta.get('parents', []) and (name is None or meta['name'] == name)
+        ]
+
+    def clear_sheet(self, file_id):
+        self.calls.append('clear_sheet')
+        self.sheets[file_id] = []
+        self._dump(file_id)
+
+    def append_sheet(self, file_id, rows, **kwargs):
+        self.calls.append('append_sheet')
+        self.sheets.setdefault(file_id, []).extend(rows)
+        self._dump(file_id)
+
+    def _dump(self, file_id):
+        if self.root:
+            with open(os.path.join(self.root, '{}.csv'.format(file_id)), 'w') as fd:
+                csv.writer(fd).writerows(self.sheets[file_id])
+
+
 class DriveBackend(object):
     """Custom feed storage for exporting data to a Google Sheet.
 
     This class has been written to be consistent with the `FileFeedStorage` class in
     `scrapy.extensions.feedexport`.
 
+    Rows are streamed to the sheet: `flush` can be called whenever the
+    exporter has written enough rows to the file object, they are then
+    appended to the sheet in batches of `batch_size` rows. A batch that keeps
+    failing is kept aside and sent again with the next flush, so nothing is
+    lost unless the very last `store` fails too.
+
     """
 
     FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
     SHEET_MIMETYPE = 'application/vnd.google-apps.spreadsheet'
 
-    def __init__(self, parent_id, spider):
+    def __init__(self, parent_id, spider, service=None, batch_size=BATCH_SIZE, tries=BATCH_TRIES):
         """Initialize Google Drive storage with the raw export folder.
 
         Like on S3, raw exports are to be stored in a master "bucket" such as
@@ -41,11 +122,26 @@ class DriveBackend(object):
         Args:
             dir_id (str): master folder ID
             spider (scrapy.Spider):
+            service (GSheetsService | LocalSheetsService): defaults to Google Sheets
+            batch_size (int): rows per Sheets API call
+            tries (int): attempts per batch before keeping it for the next flush
 
         """
         self.parent_id = parent_id
         self.spider = spider
-        self.drive = GSheetsService()
+        if service is None:
+            # only import Google client libraries when actually talking to Google
+            from kp_scrapers.lib.services.gdrive import GSheetsService
+
+            service = GSheetsService()
+        self.drive = service
+        self.batch_size = batch_size
+        self._append = retry(tries=tries, wait=1, backoff=2)(self.drive.append_sheet)
+
+        self.sheet_id = None
+        self._sheet_ready = False
+        self._pending = []
+        self.rows_stored = 0
 
     @property
     def sheet_name(self):
@@ -71,55 +167,104 @@ class DriveBackend(object):
             io.BytesIO:
 
         """
-        self.spider_dir = self._get_spider_dir(spider)
-        if not self.spider_dir:
-            self.spider_dir = self.drive.create(
-                name=self.spider.name, mimetype=self.FOLDER_MIMETYPE, parents=[self.parent_id]
-            )
+        cache_key = (self.parent_id, spider.name)
+        if cache_key not in _SPIDER_DIRS:
+            spider_dir = self._get_spider_dir(spider)
+            if not spider_dir:
+                spider_dir = self.drive.create(
+                    name=spider.name, mimetype=self.FOLDER_MIMETYPE, parents=[self.parent_id]
+                )
+            _SPIDER_DIRS[cache_key] = spider_dir
+        self.spider_dir = _SPIDER_DIRS[cache_key]
 
         # return file object to maintain API consisitency with rest of feed exporting framework
         # NOTE `CsvItemExporter` expects a binary file object, see:
         # https://doc.scrapy.org/en/latest/topics/exporters.html#scrapy.exporters.CsvItemExporter
         return BytesIO()
 
+    def flush(self, file_object, sheet_id=None):
+        """Append rows exported so far to the sheet and empty the file object.
+
+        Args:
+            file_object (io.BytesIO): file object containing exported data
+            sheet_id (str | None): existing sheet to overwrite instead of creating one
+
+        Returns:
+            bool: False if some rows could not be sent yet
+
+        """
+        # `csv.reader` only supports unicodes, but `file_object` holds bytes
+        rows = list(csv.reader(StringIO(file_object.getvalue().decode('utf-8'), newline='')))
+        # the exporter writes straight through, so it keeps writing from the start
+        file_object.seek(0)
+        file_object.truncate()
+
+        self._pending.extend(rows)
+        if not self._pending:
+            return True
+
+        self._prepare_sheet(sheet_id)
+        while self._pending:
+            batch = self._pending[: self.batch_size]
+            try:
+                self._append(self.sheet_id, batch)
+            except Exception as e:
+                logger.warning('failed to append {} rows to sheet: {}'.format(len(batch), e))
+                return False
+            del self._pending[: len(batch)]
+            self.rows_stored += len(batch)
+
+        return True
+
     def store(self, file_object, sheet_id=None):
         """Store the given file stream in a Google Sheet (CSV-formatted)
 
         Google's API does not support conversion into a Google Sheet with a simple
         file upload, even with the appropriate Google-speciifc MIME type.
-        As an alternative, we create a file first, then modify the Sheet to export data.
+        As an alternative, we create a file first, then append rows to the Sheet.
 
         Args:
             file_object (io.BytesIO): file object containing exported data
+            sheet_id (str | None): existing sheet to overwrite instead of creating one
 
         Returns:
-            str | None: Google Sheet URL string if raw export is successful
+            str | None: Google Sheet id if raw export is successful
 
         """
-        # check if filestream is not an empty string
-        file_object.seek(0)
-        # `csv.reader` only supports unicodes, but `file_object` returns bytes
-        file_data = list(csv.reader(codecs.iterdecode(file_object, 'utf-8')))
+        if not self.flush(file_object, sheet_id=sheet_id):
+            file_object.close()
+            raise RuntimeError(
+                '{} rows could not be exported to sheet {}'.format(
+                    len(self._pending), self.sheet_id
+                )
+            )
         file_object.close()
-        if not file_data:
+
+        if not self.sheet_id:
             logger.warning('Job returned no items scraped, Drive raw export will not proceed')
             return
 
+        logger.info('spreadsheet ready: {}'.format(self.sheet_id))
+        # expose url that might be handy for integrating with other middlewares
+        return self.sheet_id
+
+    def _prepare_sheet(self, sheet_id=None):
+        """Create the sheet, or clear the given one, before the first batch."""
+        if self._sheet_ready:
+            return
+
         if not sheet_id:
             logger.info("no sheet provided, creating a new one")
             sheet = self.drive.create(
                 name=self.sheet_name, mimetype=self.SHEET_MIMETYPE, parents=[self.spider_dir['id']]
             )
-            sheet_id = sheet['id']
+            self.sheet_id = sheet['id']
         else:
             logger.info("overwritting given sheet id={}".format(sheet_id))
             self.drive.clear_sheet(sheet_id)
+            self.sheet_id = sheet_id
 
-        self.drive.write_sheet(file_id=sheet_id, rows=file_data)
-
-        logger.info('spreadsheet ready: {}'.format(sheet_id))
-        # expose url that might be handy for integrating with other middlewares
-        return sheet_id
+        self._sheet_ready = True
 
     def _get_spider_dir(self, spider):
         """Get metadata dictionary of spider subdir in master folder.
@@ -131,6 +276,6 @@ class DriveBackend(object):
             Dict[str, str] | None: return dict if dir exists, else None
 
         """
-        for key in self.drive.list_children(self.parent_id):
+        for key in self.drive.list_children(self.parent_id, name=spider.name):
             if key['name'] == spider.name and key['mimeType'] == self.FOLDER_MIMETYPE:
                 return key
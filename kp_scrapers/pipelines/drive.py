@@ -8,15 +8,19 @@ to a Drive backend.
 """
 
 from __future__ import absolute_import, unicode_literals
+from io import BytesIO
 import logging
 import os
 
 from scrapy import signals
 from scrapy.exceptions import NotConfigured
 from scrapy.exporters import CsvItemExporter
+from twisted.internet.defer import DeferredLock
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
 
 from kp_scrapers.models.base import strip_meta_fields
-from kp_scrapers.pipelines.backends.drive import DriveBackend
+from kp_scrapers.pipelines.backends.drive import BATCH_SIZE, DriveBackend, LocalSheetsService
 
 
 logger = logging.getLogger(__name__)
@@ -28,6 +32,12 @@ class DriveStorage(object):
     This class is merely copy-pasted from `S3RawStorage` since it works well enough,
     and we want to maintain a consistent API for better clarity.
 
+    Items are appended to the sheet every `KP_DRIVE_BATCH_SIZE` rows while the
+    spider runs, instead of all at once when it closes. Batches are sent off
+    the reactor, one at a time, the item completing a batch being held until
+    it is sent. Set `KP_DRIVE_LOCAL_DIR` to export sheets as local csv files
+    instead of talking to Google.
+
     """
 
     STATS_TPL = 'pipeline/drive/{metric}'
@@ -35,6 +45,9 @@ class DriveStorage(object):
     def __init__(self, stats):
         self.stats = stats
         self.include_meta = False
+        self.buffered = 0
+        # the backend is not thread-safe, batches are sent one after the other
+        self._lock = DeferredLock()
 
     @staticmethod
     def _validate_settings(settings):
@@ -71,7 +84,13 @@ class DriveStorage(object):
 
     def spider_opened(self, spider):
         self.stats.set_value(self._namespace('backend'), 'rawDrive')
-        self.storage = DriveBackend(spider.settings.get('KP_DRIVE_FEED_URI'), spider)
+        local_dir = spider.settings.get('KP_DRIVE_LOCAL_DIR')
+        self.storage = DriveBackend(
+            spider.settings.get('KP_DRIVE_FEED_URI'),
+            spider,
+            service=LocalSheetsService(local_dir) if local_dir else None,
+            batch_size=int(spider.settings.get('KP_DRIVE_BATCH_SIZE') or BATCH_SIZE),
+        )
         self.include_meta = str(spider.settings.get('KP_DRIVE_INCLUDE_META')) == 'True'
         self.sheet_id = spider.settings.get('KP_DRIVE_SHEET_ID')
 
@@ -90,32 +109,70 @@ class DriveStorage(object):
                 custom_data = custom_data.values()
 
             for item in custom_data:
-                self.stats.inc_value(self._namespace('items_stored'))
-                self.exporter.export_item(item)
+                self._export(item)
 
         logger.debug('exporting items to drive storage')
         self.exporter.finish_exporting()
 
-        # push items to Google Drive and store url for later retrieval
-        sheet_id = self.storage.store(self.raw_content, sheet_id=self.sheet_id)
+        # push remaining items to Google Drive, once batches in flight are sent
+        return self._lock.run(
+            deferToThread, self.storage.store, self.raw_content, sheet_id=self.sheet_id
+        ).addBoth(self._stored, spider)
+
+    def _stored(self, sheet_id, spider):
+        self.stats.set_value(self._namespace('rows_stored'), self.storage.rows_stored)
+        if isinstance(sheet_id, Failure):
+            return sheet_id
 
         # bind items url so spider or extensions can eventually make use of it
         spider.job_items_url = 'https://docs.google.com/spreadsheets/d/{}'.format(sheet_id)
         logger.debug('items will be available at `{}`'.format(spider.job_items_url))
 
-        # remove temporary client credentials
-        os.remove(os.path.join(os.getcwd(), 'client_secret.json'))
-        os.remove(os.path.join(os.getcwd(), 'auth_token.json'))
+        # remove temporary client credentials (not created by the local backend)
+        for filename in ('client_secret.json', 'auth_token.json'):
+            path = os.path.join(os.getcwd(), filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _export(self, item):
+        """Export an item, return a deferred sending the batch if it is full."""
+        self.stats.inc_value(self._namespace('items_stored'))
+        self.exporter.export_item(item)
+        self.buffered += 1
+
+        if self.buffered < self.storage.batch_size:
+            return None
+
+        self.buffered = 0
+        self.stats.inc_value(self._namespace('batches'))
+        # hand rows over to the thread, the exporter keeps writing to `raw_content`
+        rows = BytesIO(self.raw_content.getvalue())
+        self.raw_content.seek(0)
+        self.raw_content.truncate()
+        return self._lock.run(
+            deferToThread, self.storage.flush, rows, sheet_id=self.sheet_id
+        ).addCallbacks(self._flushed, self._flush_failed)
+
+    def _flushed(self, sent):
+        if not sent:
+            # rows are kept and sent again with the next batch
+            self.stats.inc_value(self._namespace('batches_failed'))
+
+    def _flush_failed(self, failure):
+        logger.error('failed to send batch to drive: %s', failure.getErrorMessage())
+        self.stats.inc_value(self._namespace('batches_failed'))
 
     def process_item(self, item, spider):
         # NOTE `CsvItemExporter` expects bytes, not unicodes
         # NOTE if custom data exporting is enabled, don't export yielded items automatically
-        if not spider.settings.get('KP_DRIVE_CUSTOM_EXPORT'):
-            self.stats.inc_value(self._namespace('items_stored'))
-            self.exporter.export_item(item if self.include_meta else strip_meta_fields(item))
+        if spider.settings.get('KP_DRIVE_CUSTOM_EXPORT'):
+            return item
 
         # running jobs on scrapinghub will still store them
         # in their database. The point of this pipeline is
         # to allow analysts an easy interface to view and edit
         # data if needed
-        return item
+        sending = self._export(item if self.include_meta else strip_meta_fields(item))
+        if sending is None:
+            return item
+        return sending.addCallback(lambda _: item)
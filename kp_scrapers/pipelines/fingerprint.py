@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+"""Item fingerprint pipeline.
+
+Spiders re-scraping overlapping windows (mails, pdfs, port line-ups, ...)
+emit the same items run after run. This pipeline hashes every item, meta
+fields aside, and looks the hash up in a store kept by the spider across
+runs, so that unchanged items are dropped, or tagged, before being stored and
+reported by the next pipelines.
+
+The store is a SQLite file per spider in the `.scrapy` data dir, synced by
+DotScrapy on Scrapinghub like `PersistSpider` state. Hashes not seen for
+`FINGERPRINT_TTL_DAYS` are pruned, and hashes of a run are only recorded if it
+finished normally, so that items lost by a failed run are emitted again.
+
+Settings:
+
+    - FINGERPRINT_ENABLED:  activate the pipeline
+    - FINGERPRINT_MODE:     `drop` unchanged items, or `tag` them with `kp_unchanged`
+    - FINGERPRINT_FORCE:    emit every item, hashes are still recorded
+    - FINGERPRINT_TTL_DAYS: forget items not seen for that long
+    - FINGERPRINT_IGNORE_FIELDS: more fields to leave out of hashes, e.g. `reported_date`
+    - FINGERPRINT_DIR:      store directory, relative to the `.scrapy` data dir
+
+"""
+
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.logformatter import LogFormatter
+from scrapy.utils.project import data_path
+
+from kp_scrapers.models.base import strip_meta_fields
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTL_DAYS = 30
+
+MODES = ('drop', 'tag')
+
+# context added by pipelines and extensions, different on every run
+META_PREFIXES = ('kp_', 'sh_')
+
+# field set on unchanged items in `tag` mode
+TAG = 'kp_unchanged'
+
+
+class UnchangedItem(DropItem):
+    """Item already emitted by a previous run."""
+
+
+class QuietLogFormatter(LogFormatter):
+    """Log unchanged items dropped at debug level, they are expected and counted in stats."""
+
+    def dropped(self, item, exception, response, spider):
+        entry = super(QuietLogFormatter, self).dropped(item, exception, response, spider)
+        if isinstance(exception, UnchangedItem):
+            entry['level'] = logging.DEBUG
+        return entry
+
+
+def item_fingerprint(item, ignore=()):
+    """Hash an item regardless of its meta fields and key order.
+
+    Examples:
+        >>> a = item_fingerprint({'vessel': {'imo': '9465411'}, 'eta': '2020-01-01', 'kp_uuid': 1})
+        >>> b = item_fingerprint({'eta': '2020-01-01', 'vessel': {'imo': '9465411'}, 'kp_uuid': 2})
+        >>> a == b, len(a)
+        (True, 32)
+        >>> a == item_fingerprint({'eta': '2020-01-02', 'vessel': {'imo': '9465411'}})
+        False
+        >>> a == item_fingerprint({'eta': '2020-01-01', 'vessel': {'imo': '9465411'}, 'foo': 1},
+        ...                       ignore=('foo',))
+        True
+
+    """
+    fields = {
+        key: value
+        for key, value in strip_meta_fields(dict(item)).items()
+        if not key.startswith(META_PREFIXES) and key not in ignore
+    }
+    blob = json.dumps(fields, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(blob.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class FingerprintStore(object):
+    """Hashes of items emitted by previous runs, with the last time they were seen."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints (hash TEXT PRIMARY KEY, seen REAL NOT NULL)'
+        )
+
+    def __contains__(self, fingerprint):
+        query = 'SELECT 1 FROM fingerprints WHERE hash = ?'
+        return self._db.execute(query, (fingerprint,)).fetchone() is not None
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+    def prune(self, older_than):
+        """Forget hashes last seen before the given timestamp, return how many."""
+        with self._db:
+            query = 'DELETE FROM fingerprints WHERE seen < ?'
+            return self._db.execute(query, (older_than,)).rowcount
+
+    def record(self, fingerprints, seen):
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO fingerprints (hash, seen) VALUES (?, ?)',
+                ((fingerprint, seen) for fingerprint in fingerprints),
+            )
+
+    def close(self):
+        self._db.close()
+
+
+class ItemFingerprint(object):
+    """Drop or tag items already emitted by previous runs, see module documentation."""
+
+    STATS_TPL = 'pipeline/fingerprint/{metric}'
+
+    def __init__(
+        self, stats, mode='drop', force=False, ttl_days=DEFAULT_TTL_DAYS, ignore=(), root=None
+    ):
+        if mode not in MODES:
+            raise NotConfigured('unknown fingerprint mode: {}'.format(mode))
+
+        self.stats = stats
+        self.mode = mode
+        self.force = force
+        self.ttl = ttl_days * 24 * 3600
+        self.ignore = frozenset(ignore)
+        self.root = root
+        self.store = None
+        # hashes of this run, recorded at once when it finishes
+        self._seen = set()
+
+    @classmethod
+    def _namespace(cls, metric):
+        """Namespace metrics to distinguish them in Scrapy stats.
+
+        Examples:
+            >>> ItemFingerprint._namespace('hits')
+            'pipeline/fingerprint/hits'
+
+        """
+        return cls.STATS_TPL.format(metric=metric)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('FINGERPRINT_ENABLED'):
+            raise NotConfigured('item fingerprints are disabled')
+
+        pipeline = cls(
+            crawler.stats,
+            mode=settings.get('FINGERPRINT_MODE') or 'drop',
+            force=settings.getbool('FINGERPRINT_FORCE'),
+            ttl_days=settings.getfloat('FINGERPRINT_TTL_DAYS', DEFAULT_TTL_DAYS),
+            ignore=settings.getlist('FINGERPRINT_IGNORE_FIELDS'),
+            root=settings.get('FINGERPRINT_DIR'),
+        )
+        crawler.signals.connect(pipeline.spider_opened, signals.spider_opened)
+        crawler.signals.connect(pipeline.spider_closed, signals.spider_closed)
+        return pipeline
+
+    def spider_opened(self, spider):
+        path = data_path(os.path.join(self.root or 'fingerprints', '{}.sqlite'.format(spider.name)))
+        self.store = FingerprintStore(path)
+        pruned = self.store.prune(time.time() - self.ttl)
+        self.stats.set_value(self._namespace('pruned'), pruned)
+        if self.force:
+            logger.info('fingerprints ignored, every item will be emitted')
+
+    def spider_closed(self, spider, reason=None):
+        hits = self.stats.get_value(self._namespace('hits'), 0)
+        total = hits + self.stats.get_value(self._namespace('misses'), 0)
+        if total:
+            self.stats.set_value(self._namespace('hit_ratio'), round(hits / total, 4))
+
+        if reason == 'finished':
+            self.store.record(self._seen, time.time())
+        else:
+            logger.info('run did not finish (%s), item fingerprints not recorded', reason)
+        self.stats.set_value(self._namespace('stored'), len(self.store))
+        self.store.close()
+
+    def process_item(self, item, spider):
+        fingerprint = item_fingerprint(item, ignore=self.ignore)
+        unchanged = fingerprint in self._seen or fingerprint in self.store
+        self._seen.add(fingerprint)
+
+        self.stats.inc_value(self._namespace('hits' if unchanged else 'misses'))
+        if not unchanged or self.force:
+            return item
+
+        if self.mode == 'drop':
+            raise UnchangedItem('item unchanged since a previous run: {}'.format(fingerprint))
+        item[TAG] = True
+        return item
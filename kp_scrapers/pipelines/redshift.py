@@ -2,9 +2,9 @@ import logging
 
 from scrapy import signals
 from scrapy.exceptions import NotConfigured
-from sqlalchemy.exc import OperationalError
+from twisted.internet.threads import deferToThread
 
-from kp_scrapers.lib.services.kp_redshift import upsert_metrics
+from kp_scrapers.lib.services.kp_redshift import get_sink
 from kp_scrapers.settings.utils import determine_env
 
 
@@ -12,10 +12,24 @@ logger = logging.getLogger(__name__)
 
 
 class RedshiftStats(object):
-    """Upload stats in reporter.py to redshift"""
+    """Upload stats in reporter.py to redshift
 
-    def __init__(self, stats):
+    Stats are buffered by the monitoring sink of the process and inserted in
+    bulk, at the latest when the last spider of the process closes, see
+    `kp_scrapers.lib.services.kp_redshift`.
+
+    """
+
+    def __init__(self, stats, sink=None):
         self.stats = stats
+        self._sink = sink
+
+    @property
+    def sink(self):
+        # created lazily, so that settings are only resolved in production
+        if self._sink is None:
+            self._sink = get_sink()
+        return self._sink
 
     @staticmethod
     def _validate_settings(spider):
@@ -36,7 +50,7 @@ class RedshiftStats(object):
         return pipeline
 
     def spider_opened(self, spider):
-        pass
+        self.sink.started()
 
     def spider_closed(self, spider):
         item_args = self.get_extra_crawler_stats(spider.crawler.stats.get_stats())
@@ -53,17 +67,18 @@ class RedshiftStats(object):
         ):
             # do not upload if spider run is uneventful, i.e no new emails
             logging.info('Uneventful spider run, skipping redshift upload')
-            return
-
-        logging.info('Uploading spider stats to Redshift...')
-        try:
-            upsert_metrics(item_args)
-            logging.info('Redshift monitoring pipeline successfully ran')
-        except OperationalError as exc:
-            # catch operational errors so as not to hinder other pipelines
-            logger.exception(
-                'Failed to run: %(exception)s', {'exception': exc},
-            )
+            item_args = None
+
+        if self.sink.finished(item_args):
+            logging.info('Uploading buffered spider stats to Redshift...')
+            # off the reactor, connection errors are handled by the sink, and
+            # before `engine_stopped` so that spilled rows are synced by DotScrapy
+            return deferToThread(self.sink.flush).addErrback(self._failed)
+
+    @staticmethod
+    def _failed(failure):
+        # so as not to hinder other pipelines
+        logger.error('Failed to run: %s', failure.getErrorMessage())
 
     @staticmethod
     def get_extra_crawler_stats(stat_dict):
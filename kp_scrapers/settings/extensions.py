@@ -30,7 +30,8 @@ DOWNLOADER_MIDDLEWARES = {
     # Right before HttpCompressionMiddleware, so when the request comes back it
     # is ungziped by HttpCompressionMiddleware before being stored in S3
     # learn more: https://github.com/kpler/scrapy-history-middleware
-    'history.middleware.HistoryMiddleware': 589,
+    # NOTE extended to record/replay crawls locally, see `HISTORY_CASSETTE`
+    'kp_scrapers.middlewares.cassette.CassetteMiddleware': 589,
     # allows for dynamic retrieval of data from javascript heavy pages
     # or to work around bot detection algorithms
     'scrapy_splash.SplashCookiesMiddleware': 723,
@@ -50,6 +51,8 @@ SPIDER_MIDDLEWARES = {
 }
 
 ITEM_PIPELINES = {
+    # drop items unchanged since a previous run, opt-in with `FINGERPRINT_ENABLED`
+    'kp_scrapers.pipelines.fingerprint.ItemFingerprint': 150,
     # extend items with project and context information
     'kp_scrapers.pipelines.context.EnrichItemContext': 200,
     # pretty print item stats once done
@@ -67,9 +70,25 @@ ITEM_PIPELINES = {
     'kp_scrapers.extensions.notify.NotifyMiddleware': 410,
 }
 
+# monitoring rows buffered before uploading them to redshift, the rest is uploaded when
+# the last spider of the process closes
+MONITORING_BATCH_SIZE = 50
+# rows kept while redshift is unreachable, replayed by the next upload
+MONITORING_SPILL_FILE = 'monitoring-spill.jsonl'
+
+# forget items not emitted for that long, `FINGERPRINT_ENABLED` to drop unchanged items
+FINGERPRINT_TTL_DAYS = 30
+# `drop` unchanged items, or `tag` them with `kp_unchanged`
+FINGERPRINT_MODE = 'drop'
+
 # uncomment and modify DSN to enable `sentry` spider middleware and start
 # sending exceptions on Sentry
 # SENTRY_DSN = 'https://******@sentry.io/261345'
+# similar events sent per job, and events sent per job, the rest is summarised on close
+SENTRY_MAX_EVENTS_PER_FINGERPRINT = 10
+SENTRY_MAX_EVENTS = 500
+# share of repeated events sent once under the caps, the first one is always sent
+SENTRY_SAMPLE_RATE = 1.0
 
 MAGIC_FIELDS = {  # The fields that we add to every item using machine state:
     "sh_item_time": "$isotime",  # Machine time of scraping
@@ -99,12 +118,42 @@ EXTENSIONS = {
     'scrapy_dotpersistence.DotScrapyPersistence': 0,
     # capture exceptions and send them on Sentry
     'kp_scrapers.extensions.sentry.SentryErrorTracker': 600,
+    # time spider callbacks, normalisers and pipelines, see `PROFILE_ENABLED`
+    'kp_scrapers.extensions.profiler.Profiler': 601,
 }
 
+# what `HTTPErrorMiddleware` does on status >= 400: `finish`, `continue` or `retry`
+# ON_HTTP_ERROR = 'finish'
+# overrides per host and/or status, e.g. {'429': 'retry', 'api.example.com 404': 'continue'}
+HTTP_ERROR_POLICIES = {}
+# responses dropped before closing the spider, unlimited if None
+HTTP_ERROR_BUDGET = None
+HTTP_ERROR_MAX_RETRIES = 3
+# exponential backoff in seconds, unless the server sends `Retry-After`
+HTTP_ERROR_BACKOFF_BASE = 2.0
+HTTP_ERROR_BACKOFF_MAX = 300.0
+# response body logged with errors, truncated and sampled past the first one per host/status
+HTTP_ERROR_BODY_LIMIT = 1024
+HTTP_ERROR_BODY_SAMPLE_RATE = 0.1
+
+# opt-in profiling of callbacks, normalisers and pipelines
+PROFILE_ENABLED = False
+PROFILE_TRACEMALLOC = False
+# json report, e.g. `profiles/%(name)s-%(time)s.json`, only stats if unset
+PROFILE_OUTPUT = None
+
 # Use DotScrapy Persistence if running on Scrapinghub.
 # Report to spiders/persist_data_manager for main use case
 # or http://help.scrapinghub.com/scrapy-cloud/addons/dotscrapy-persistence-addon.
 DOTSCRAPY_ENABLED = is_shub_env()
+# where `PersistSpider` state lives: `local` (.scrapy dir, synced by DotScrapy) or `s3`
+PERSIST_BACKEND = 'local'
+# `gzip`, `zstd` (needs `zstandard`) or None for plain json
+PERSIST_COMPRESSION = 'gzip'
+# PERSIST_LOCAL_DIR = '.scrapy'
+# PERSIST_S3_BUCKET = 'kp-datalake'
+PERSIST_S3_PREFIX = 'spiders-state'
+
 # DotScrapy configuration
 # ADDONS_AWS_ACCESS_KEY_ID = "ABC"
 # ADDONS_AWS_SECRET_ACCESS_KEY = "DEF"
@@ -151,6 +200,9 @@ HISTORY_STORE_IF = 'history.logic.StoreAlways'
 # value
 # HISTORY_S3_BUCKET = 'kp-datalake'
 HISTORY_USE_PROXY = True
+# `record` or `replay` a crawl from a local cassette instead of S3 history
+HISTORY_CASSETTE = None
+# HISTORY_CASSETTE_DIR = '.scrapy/cassettes'
 HTTPCACHE_IGNORE_MISSING = False
 
 # scrapy-splash middleware settings
@@ -18,6 +18,8 @@ BOT_NAME = 'spiders'
 
 # default, can be (is) customized per spider or from SHUB
 LOG_LEVEL = 'WARNING'
+# items dropped as unchanged by `ItemFingerprint` are logged at debug level
+LOG_FORMATTER = 'kp_scrapers.pipelines.fingerprint.QuietLogFormatter'
 
 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 # DO **NOT** put kp_scrapers.spiders.bases in here
@@ -46,5 +48,7 @@ SPIDER_MODULES = [__spiders(mod) for mod in __SPIDER_TYPES]
 # where to create new spiders using the genspider command
 NEWSPIDER_MODULE = __spiders('others')
 COMMANDS_MODULE = 'kp_scrapers.commands'
+# spiders are only imported when listed or loaded, see `scrapy describe` manifest
+SPIDER_LOADER_CLASS = 'kp_scrapers.lib.spider_loader.LazySpiderLoader'
 
 SHUB_SPIDER_TYPE = os.environ.get('SHUB_SPIDER_TYPE')
@@ -7,11 +7,21 @@ GOOGLE_DRIVE_DEFAULT_USER = None
 GOOGLE_DRIVE_PRIVATE_KEY = None
 GOOGLE_DRIVE_PRIVATE_KEY_ID = None
 GOOGLE_TEAM_DRIVE_ENABLED = True
+# how long `GDriveSpider` trusts the folder id a path resolved to, in seconds
+GDRIVE_FOLDER_CACHE_TTL = 24 * 3600
+# concurrent file downloads of `GDriveSpider`
+GDRIVE_DOWNLOAD_WORKERS = 4
+# days `GDriveSpider` looks back before the last file it processed
+GDRIVE_LAG_DAYS = 1
 
 # Define Google Drive item storage settings.
 # This is mandatory to activate the DriveRawStorage pipeline.
 # Despite its name, the string supplied should be purely the raw export folder's ID
 KP_DRIVE_FEED_URI = '1nbp4SbyYK73aFmLNcTcAVhUMYsxmRJU3'
+# rows appended to the sheet per Sheets API call, while the spider runs
+KP_DRIVE_BATCH_SIZE = 500
+# export sheets as csv files in this local directory instead of Google Drive
+KP_DRIVE_LOCAL_DIR = None
 # NOTE disabled by default as we don't want to clutter Drive storage
 
 # Define GMail credentials required for accessing email reports.
@@ -43,7 +53,15 @@ AIRTABLE_API_KEY = os.environ.get('AIRTABLE_API_KEY')
 # notification channel for job completion
 SLACK_CHANNEL = '#data-notifications'
 SLACK_TOKEN = os.environ.get('SLACK_TOKEN')
+# post with an incoming webhook instead of the token, if set
+SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL')
 NOTIFY_DEV_IN_CHARGE = None
+# delivery happens in a thread, `NOTIFY_RETRIES` times at most after the first attempt
+NOTIFY_TIMEOUT = 10
+NOTIFY_RETRIES = 2
+# distinct errors listed in notifications, and whether to group them by url pattern
+NOTIFY_MAX_ERRORS = 10
+NOTIFY_ERROR_URLS = False
 
 # define credentials for Kpler Excel API
 KP_API_BASE = None
@@ -25,6 +25,11 @@ Thus spider invocation is simply::
        -a 'token=xxxxxxxxxxxxxxxxxxxx'  \
        -a 'limit=1000000'
 
+Large fleets can be processed a slice at a time, and split across concurrent
+jobs with hash-based shards (see `kp_scrapers.mixins.distribute`)::
+
+  $ scrapy crawl SpireApi -a token=xxx -a slice_size=500 -a shard=0/4
+
 
 JSON document format
 ~~~~~~~~~~~~~~~~~~~~
@@ -219,7 +224,7 @@ class SpireApi(AisSpider, DivideAndConquerMixin, Spider):
 
     name = 'SpireApi'
 
-    version = '3.1.0'
+    version = '3.2.0'
     provider = PROVIDER_ID
     produces = [DataTypes.Ais, DataTypes.Vessel]
 
@@ -252,7 +257,9 @@ class SpireApi(AisSpider, DivideAndConquerMixin, Spider):
         slice_size = kwargs.get('slice_size')
         if slice_size:
             self.logger.info(f"slicing scraping scope to {slice_size}")
-            self.vessel_ids = self.divide_work(self.vessel_ids, int(slice_size))
+            self.vessel_ids = self.divide_work(
+                self.vessel_ids, int(slice_size), shard=kwargs.get('shard')
+            )
 
         # TODO on `message type`, use since with last run date
         # self.forced_since = compute_since(minutes=int(since)) if since else None
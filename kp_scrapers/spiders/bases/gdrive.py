@@ -1,19 +1,62 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
+import datetime as dt
+import time
 
 from scrapy.spiders import Spider
+from twisted.internet.threads import deferToThread
 
 from kp_scrapers.constants import BLANK_START_URL
-from kp_scrapers.lib.services.gdrive import build_query, GDriveMimeTypes, GDriveService
+from kp_scrapers.lib.services.gdrive import (
+    build_query,
+    FolderCache,
+    GDriveMimeTypes,
+    GDriveService,
+)
 from kp_scrapers.lib.services.shub import global_settings as Settings, validate_settings
 from kp_scrapers.lib.xls import Workbook
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
 
 
 TMP_DATA_DIR = '/tmp'
 PROCESS_TAG = 'processed'
+# format of Drive `modifiedTime` (RFC 3339, always UTC)
+MODIFIED_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def modified_since(last_modified, lag_days):
+    """Lower bound on `modifiedTime` for files to list, given the last one processed.
+
+    Files uploaded from a synced disk can keep an older modification time, so
+    we look `lag_days` further back and rely on the processed tag to skip
+    files already seen.
+
+    Examples:
+        >>> modified_since('2020-01-10T12:00:00.000Z', 1)
+        '2020-01-09T12:00:00.000000Z'
+        >>> modified_since(None, 1) is None
+        True
+
+    """
+    if not last_modified:
+        return None
+
+    since = dt.datetime.strptime(last_modified, MODIFIED_TIME_FORMAT) - dt.timedelta(days=lag_days)
+    return since.strftime(MODIFIED_TIME_FORMAT)
 
 
 class GDriveSpider(Spider):
+    """Parse files found in a Drive folder, then tag them as processed.
+
+    Between runs, the spider remembers in its persisted state which folder id
+    `path` resolves to (for `GDRIVE_FOLDER_CACHE_TTL` seconds) and the latest
+    `modifiedTime` it processed, so that older files are filtered out by
+    Drive. Files are listed, parsed and tagged off the reactor, their bodies
+    being downloaded by `GDRIVE_DOWNLOAD_WORKERS` threads while the ones
+    already received are parsed.
+
+    """
+
     start_urls = [BLANK_START_URL]
 
     def __init__(self, *args, **kwargs):
@@ -30,6 +73,7 @@ class GDriveSpider(Spider):
 
         # init service
         self.service = GDriveService()
+        self.drive_state = PersistDataManager('{}-gdrive'.format(self.name))
 
     @property
     def mime_types(self):
@@ -55,13 +99,22 @@ class GDriveSpider(Spider):
         Given the path to a single folder starting from the root, retrieves the files matching
         the filters and parses them.
         Each processed file is then tagged.
+        Drive is only queried from a thread, so that the reactor keeps serving other requests.
         Args:
             _: unused response argument
-        Yields:
-            dict
+        Returns:
+            twisted.internet.defer.Deferred: fires with the list of items parsed
         """
+        return deferToThread(lambda: list(self._parse_files()))
+
+    def _parse_files(self):
         validate_settings('GOOGLE_DRIVE_BASE_FOLDER_ID')
         base_folder_id = Settings()['GOOGLE_DRIVE_BASE_FOLDER_ID']
+        folder_cache = FolderCache(
+            self.drive_state.setdefault('folders', {}),
+            ttl=self.settings.getint('GDRIVE_FOLDER_CACHE_TTL', 24 * 3600),
+        )
+        last_modified = self.drive_state.get('last_modified')
 
         # check if we want to force parse one file only
         if self.file_to_process:
@@ -76,21 +129,44 @@ class GDriveSpider(Spider):
             query = build_query(
                 mimes=self.mime_types,
                 excluded_tags=[PROCESS_TAG] if not self.force_processing else [],
+                modified_after=(
+                    None
+                    if self.force_processing
+                    else modified_since(last_modified, self.settings.getint('GDRIVE_LAG_DAYS', 1))
+                ),
             )
 
         # find all files within specified path
         recursive = self.recursive and not self.file_to_process
         gfiles = self.service.list_files_in_path(
-            base_folder_id, path=self.path, query=query, recursive=recursive
+            base_folder_id,
+            path=self.path,
+            query=query,
+            recursive=recursive,
+            folder_cache=folder_cache,
         )
 
-        # parse each file found separately
-        for gfile in gfiles:
+        # parse each file found separately, as soon as it is downloaded
+        stats = self.crawler.stats
+        started_at = time.time()
+        downloads = self.service.fetch_files(
+            gfiles, workers=self.settings.getint('GDRIVE_DOWNLOAD_WORKERS', 4)
+        )
+        for gfile, file_content in downloads:
             self.logger.info('Parsing gdrive file {}'.format(gfile))
-            file_content = self.service.fetch_file_content(gfile)
+            stats.inc_value('gdrive/files')
+            stats.inc_value('gdrive/bytes', len(file_content))
             for item in self.parse_file_content(file_content):
                 yield item
             self.service.tag_file(gfile['id'], [PROCESS_TAG])
+            last_modified = max(last_modified or '', gfile.get('modifiedTime') or '') or None
+
+        elapsed = max(time.time() - started_at, 1e-6)
+        stats.set_value('gdrive/files_per_second', stats.get_value('gdrive/files', 0) / elapsed)
+        stats.set_value('gdrive/bytes_per_second', stats.get_value('gdrive/bytes', 0) / elapsed)
+
+        self.drive_state['last_modified'] = last_modified
+        self.drive_state.save()
 
 
 class GDriveXlsSpider(GDriveSpider):
@@ -38,8 +38,13 @@ class PersistSpider(Spider):
     - spider parameter start_data
     - last spider execution datetime - lag
     - 2011-01-01
+
+    Set `state_ttl_days` to forget state keys that were not assigned for
+    that long, so that the state does not grow forever.
     """
 
+    state_ttl_days = None
+
     def spider_closed(self, spider):
         """Handler for the ``spider_closed`` signal
 
@@ -97,7 +102,9 @@ class PersistSpider(Spider):
 
     def __init__(self, start_date=None, *args, **kwargs):
         # Use spider name as filename
-        self.persisted_data = PersistDataManager(kwargs.get('state_file') or self.name)
+        self.persisted_data = PersistDataManager(
+            kwargs.get('state_file') or self.name, ttl_days=self.state_ttl_days
+        )
         self.logger.debug("Data from last execution: {}".format(self.persisted_data))
 
         self.today = datetime.today()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Storage backends and codecs for persisted spider state.
+
+Backends only move bytes around, `PersistDataManager` takes care of
+serialising and compressing the state:
+
+- `LocalBackend`: files in the `.scrapy` data dir, synced by DotScrapy on
+  Scrapinghub. Writes go to a temporary file renamed over the previous state,
+  so that a job killed while saving never leaves a truncated state behind
+- `S3Backend`: objects under `PERSIST_S3_BUCKET/PERSIST_S3_PREFIX`, S3 puts
+  being atomic already
+
+Codecs are picked with `PERSIST_COMPRESSION` (`gzip`, `zstd` or None for
+plain json), and identified by the file extension so that state written with
+another codec can still be read.
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+from collections import namedtuple
+import gzip
+import logging
+import os
+import tempfile
+
+from scrapy.utils.project import data_path
+
+
+logger = logging.getLogger(__name__)
+
+
+Codec = namedtuple('Codec', ('extension', 'compress', 'decompress'))
+
+
+def _identity(data):
+    return data
+
+
+def _zstd_compress(data):
+    # optional dependency, only needed when configured
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _gzip_compress(data):
+    # state is written often and read once per job, favour speed over ratio
+    return gzip.compress(data, compresslevel=6)
+
+
+CODECS = {
+    None: Codec('.json', _identity, _identity),
+    'gzip': Codec('.json.gz', _gzip_compress, gzip.decompress),
+    'zstd': Codec('.json.zst', _zstd_compress, _zstd_decompress),
+}
+
+
+def get_codec(name):
+    """Get a codec by name, falling back on gzip if zstd is not installed.
+
+    Examples:
+        >>> get_codec('gzip').extension
+        '.json.gz'
+        >>> get_codec(None).extension
+        '.json'
+        >>> get_codec('lz4')
+        Traceback (most recent call last):
+        ...
+        ValueError: unknown state compression: lz4
+
+    """
+    name = name or None
+    if name not in CODECS:
+        raise ValueError('unknown state compression: {}'.format(name))
+
+    if name == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning('zstandard is not installed, compressing state with gzip')
+            return CODECS['gzip']
+
+    return CODECS[name]
+
+
+class LocalBackend(object):
+    """Store state in local files, by default in the `.scrapy` data dir."""
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def location(self, name):
+        return os.path.join(self.root, name) if self.root else data_path(name)
+
+    def read(self, name):
+        try:
+            with open(self.location(name), 'rb') as fd:
+                return fd.read()
+        except (IOError, OSError):
+            return None
+
+    def write(self, name, data):
+        path = self.location(name)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # same directory as the target, or the rename would not be atomic
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(name))
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, name):
+        try:
+            os.remove(self.location(name))
+            return True
+        except (IOError, OSError):
+            return False
+
+
+class S3Backend(object):
+    """Store state as S3 objects, see `kp_scrapers.lib.services.s3`."""
+
+    def __init__(self, bucket, prefix=''):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, name):
+        return '{}/{}'.format(self.prefix, name) if self.prefix else name
+
+    def location(self, name):
+        return 's3://{}/{}'.format(self.bucket, self._key(name))
+
+    def read(self, name):
+        from botocore.exceptions import ClientError
+
+        from kp_scrapers.lib.services import s3
+
+        try:
+            body = s3.open_file(self.bucket, self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def write(self, name, data):
+        from kp_scrapers.lib.services import s3
+
+        s3.client().put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def delete(self, name):
+        from kp_scrapers.lib.services import s3
+
+        s3.client().delete_object(Bucket=self.bucket, Key=self._key(name))
+        return True
+
+
+def backend_from_settings(settings):
+    """Build the backend configured with `PERSIST_BACKEND`, `local` by default."""
+    kind = settings.get('PERSIST_BACKEND') or 'local'
+    if kind == 'local':
+        return LocalBackend(settings.get('PERSIST_LOCAL_DIR'))
+    if kind == 's3':
+        if not settings.get('PERSIST_S3_BUCKET'):
+            raise ValueError('PERSIST_S3_BUCKET is required to persist state on S3')
+        return S3Backend(settings['PERSIST_S3_BUCKET'], settings.get('PERSIST_S3_PREFIX') or '')
+    raise ValueError('unknown state backend: {}'.format(kind))
@@ -48,16 +48,25 @@ from datetime import datetime, timedelta
 import json
 import logging
 import os
+import time
 
 from scrapy.utils.project import data_path
 
 # TODO don't use start import
 from kp_scrapers.lib.date import create_str_from_time, may_parse_date_str
+from kp_scrapers.lib.services.shub import global_settings as Settings
+from kp_scrapers.spiders.bases.persist_backends import backend_from_settings, CODECS, get_codec
 
 
 logger = logging.getLogger(__name__)
 
 
+# marks states saved along with key timestamps, plain dicts are legacy states
+_ENVELOPE = '__state__'
+# bookkeeping keys rewritten on every run, never pruned
+PERMANENT_KEYS = ('spider_exec', 'spider_start')
+
+
 class PersistDataException(Exception):
     pass
 
@@ -67,31 +76,111 @@ class PersistDataManager(dict):
         Dict like object that persist data as json in file on SH
 
         Usage example is to persist the last execution of a spider
+
+        State is stored with the backend and compression configured in
+        settings (`PERSIST_BACKEND`, `PERSIST_COMPRESSION`), see
+        `persist_backends`. Given a `ttl_days`, top-level keys that were not
+        assigned for that long are pruned when saving. Values mutated in place
+        are not seen as assigned, re-assign them to keep them alive.
     """
 
-    def __init__(self, filename, save_exec_time=False, *args, **kwargs):
+    def __init__(
+        self,
+        filename,
+        save_exec_time=False,
+        *args,
+        backend=None,
+        compression=None,
+        ttl_days=None,
+        **kwargs
+    ):
         super(PersistDataManager, self).__init__(*args, **kwargs)
         if filename == '':
             raise PersistDataException('Filename required to persist data on SH')
-        self.file_path = data_path(filename + '.json')
+
+        settings = Settings()
+        self.filename = filename
+        self.backend = backend or backend_from_settings(settings)
+        self.codec = get_codec(compression or settings.get('PERSIST_COMPRESSION'))
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        # last assignment of each key, only tracked to prune them
+        self._touched = {}
+        self._loaded_from = None
+
+        self.file_path = self.backend.location(filename + self.codec.extension)
         logger.info('Using persistent file : ' + self.file_path)
         self._load()
         if save_exec_time:
             self['spider_exec'] = str(datetime.today())
 
+    def __setitem__(self, key, value):
+        super(PersistDataManager, self).__setitem__(key, value)
+        if self.ttl:
+            self._touched[key] = time.time()
+
+    def __delitem__(self, key):
+        super(PersistDataManager, self).__delitem__(key)
+        self._touched.pop(key, None)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def prune(self, now=None):
+        """Drop keys not assigned for longer than the TTL.
+
+        Returns:
+            int: number of keys dropped
+
+        """
+        if not self.ttl:
+            return 0
+
+        now = now or time.time()
+        expired = [
+            key
+            for key in self
+            if key not in PERMANENT_KEYS and now - self._touched.get(key, now) > self.ttl
+        ]
+        for key in expired:
+            del self[key]
+        if expired:
+            logger.info('Pruned {} expired keys from {}'.format(len(expired), self.file_path))
+        return len(expired)
+
     def save(self):
-        with open(self.file_path, 'w') as f:
-            try:
-                json.dump(self, f)
-            except ValueError:
-                logger.error('Cannot serialize json file {}'.format(self.file_path))
+        self.prune()
+        state = dict(self)
+        if self.ttl:
+            touched = {key: self._touched[key] for key in state if key in self._touched}
+            state = {_ENVELOPE: 1, 'data': state, 'touched': touched}
+        try:
+            data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+        except (TypeError, ValueError):
+            logger.error('Cannot serialize json file {}'.format(self.file_path))
+            return
+
+        name = self.filename + self.codec.extension
+        self.backend.write(name, self.codec.compress(data))
+        # state found under another codec is now outdated
+        if self._loaded_from and self._loaded_from != name:
+            self.backend.delete(self._loaded_from)
+        self._loaded_from = name
 
     def clean_file(self):
         self.clear()
-        try:
-            os.remove(self.file_path)
-        except IOError:
+        self._touched.clear()
+        deleted = [
+            self.backend.delete(self.filename + codec.extension) for codec in CODECS.values()
+        ]
+        if not any(deleted):
             logger.error('{} does not exist'.format(self.file_path))
+        self._loaded_from = None
 
     def get_last_spider_exec(self, day_diff=2):
         try:
@@ -112,14 +201,34 @@ class PersistDataManager(dict):
         return create_str_from_time(time, format=frmt)
 
     def _load(self):
-        try:
-            logger.debug('Deserializing file {}'.format(self.file_path))
-            with open(self.file_path, 'rb') as f:
-                self.update(json.load(f))
-        except IOError:
-            logger.error('{} does not exist'.format(self.file_path))
-        except ValueError:
-            logger.error('Could not deserialize to json file {}'.format(self.file_path))
+        # configured codec first, then states written with another one
+        codecs = [self.codec] + [c for c in CODECS.values() if c is not self.codec]
+        for codec in codecs:
+            name = self.filename + codec.extension
+            logger.debug('Deserializing file {}'.format(name))
+            data = self.backend.read(name)
+            if data is None:
+                continue
+
+            try:
+                state = json.loads(codec.decompress(data).decode('utf-8'))
+            except (IOError, OSError, ValueError):
+                logger.error('Could not deserialize to json file {}'.format(name))
+                return
+
+            self._loaded_from = name
+            if isinstance(state, dict) and state.get(_ENVELOPE):
+                self._touched = state.get('touched', {})
+                state = state['data']
+            super(PersistDataManager, self).update(state)
+            if self.ttl:
+                # legacy keys start their lifetime now
+                now = time.time()
+                for key in self:
+                    self._touched.setdefault(key, now)
+            return
+
+        logger.error('{} does not exist'.format(self.file_path))
 
     @staticmethod
     def delete_spidersfiles():
@@ -1,11 +1,15 @@
 import csv
 import datetime as dt
+import io
 import json
 import logging
 import re
+import time
 from urllib.parse import urlencode
 
 from scrapy import Request
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
 
 from kp_scrapers.lib.parser import may_strip
 from kp_scrapers.models.normalize import DataTypes
@@ -19,6 +23,16 @@ logger = logging.getLogger(__name__)
 # ImportGenius can add Bill of Lading (bol) at worst 6 days later
 DEFAULT_BACKLOG = 7
 
+# csv export status polling, in seconds
+# an export of 100k rows usually takes a few minutes to be generated on IG side
+STATUS_POLL_BASE_DELAY = 2
+STATUS_POLL_MAX_DELAY = 60
+STATUS_POLL_DEADLINE = 30 * 60
+
+# csv exports are capped at 100k rows, i.e. a few dozens of MB
+CSV_MAXSIZE = 256 * 1024 * 1024
+CSV_WARNSIZE = 64 * 1024 * 1024
+
 # NOTE if you update DEFAULT_QUERY, please also update DEFAULT_NOT_TERMS
 DEFAULT_QUERY = """
     AND crude, OR API gravity, OR crude oil, OR alkylate, OR avgas, OR barr*, OR bbl*, OR blend,
@@ -409,6 +423,52 @@ DEFAULT_NOT_TERMS = [
 ]
 
 
+def iter_csv_rows(fileobj, encoding='utf-8', **extras):
+    """Lazily parse a binary csv file into raw items with upper-cased keys.
+
+    Header mapping is computed once instead of rebuilding an upper-cased dict
+    from each row, and rows are decoded as the file is read.
+
+    Args:
+        fileobj (io.BufferedIOBase): binary file-like object
+        encoding (str):
+        extras: additional key/values merged into every row
+
+    Yields:
+        Dict[str, str]:
+
+    Examples:
+        >>> rows = iter_csv_rows(io.BytesIO(b'foo,Bar\\r\\n1,2\\r\\n'), provider_name='IG')
+        >>> list(rows)
+        [{'FOO': '1', 'BAR': '2', 'provider_name': 'IG'}]
+
+    """
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding=encoding, newline=''), delimiter=',')
+    header = next(reader, None)
+    if not header:
+        return
+
+    keys = [column.upper() for column in header]
+    for row in reader:
+        if not row:
+            continue
+
+        raw_item = dict(zip(keys, row))
+        raw_item.update(extras)
+        yield raw_item
+
+
+def status_poll_delay(attempt):
+    """Seconds to wait before polling export status again.
+
+    Examples:
+        >>> [status_poll_delay(attempt) for attempt in range(7)]
+        [2, 4, 8, 16, 32, 60, 60]
+
+    """
+    return min(STATUS_POLL_BASE_DELAY * 2 ** attempt, STATUS_POLL_MAX_DELAY)
+
+
 def parse_response_info(jsresp):
     """Parse response info.
 
@@ -513,6 +573,7 @@ class ImportGeniusBolSpider(ContractSpider):
         assert self.mode in ('csv', 'html')
 
         self.query = query or DEFAULT_QUERY
+        self.status_deadline = None
 
         if not_terms:
             self.not_terms = [e.strip().lower() for e in not_terms.split(',')]
@@ -673,35 +734,58 @@ class ImportGeniusBolSpider(ContractSpider):
         jsresp = json.loads(response.body)
         self.logger.debug(parse_response_info(jsresp))
         self.pid = jsresp.get('pid')
+        self.status_deadline = time.time() + STATUS_POLL_DEADLINE
+        yield self._status_request(attempt=0)
 
+    def _status_request(self, attempt):
         # TODO factorise and move to `api.py`
-        yield Request(url=api.URL_STATUS.format(pid=self.pid), callback=self.on_status_result)
+        return Request(
+            url=api.URL_STATUS.format(pid=self.pid),
+            callback=self.on_status_result,
+            meta={'attempt': attempt},
+            dont_filter=True,
+        )
 
     def on_status_result(self, response):
         """Wait for csv to be generated by the website
+
+        Status is polled with an exponential backoff, until `STATUS_POLL_DEADLINE`
+        is reached. The next poll is scheduled on the reactor rather than slept on,
+        so that the crawl (and other spiders of the process) keep running meanwhile.
+
         """
         jsresp = json.loads(response.body)
         percent = jsresp.get('percent')
         if percent == '100':
             # Download csv when ready
             # TODO factorise and move to `api.py`
-            yield Request(
-                url=api.URL_DOWNLOAD_CSV_BASE.format(sid=self.sid, pid=self.pid),
-                callback=self.parse_csv,
-            )
-        else:
-            # Or check for status
-            # TODO factorise and move to `api.py`
-            yield Request(
-                url=api.URL_STATUS.format(pid=self.pid),
-                callback=self.on_status_result,
-                dont_filter=True,
+            return [
+                Request(
+                    url=api.URL_DOWNLOAD_CSV_BASE.format(sid=self.sid, pid=self.pid),
+                    callback=self.parse_csv,
+                    meta={'download_maxsize': CSV_MAXSIZE, 'download_warnsize': CSV_WARNSIZE},
+                )
+            ]
+
+        attempt = response.meta.get('attempt', 0)
+        delay = status_poll_delay(attempt)
+        if time.time() + delay > self.status_deadline:
+            self.logger.error(
+                'Export %s not ready after %ss (%s%%), giving up',
+                self.pid,
+                STATUS_POLL_DEADLINE,
+                percent,
             )
+            return []
+
+        self.logger.debug('Export %s at %s%%, checking again in %ss', self.pid, percent, delay)
+        self.crawler.stats.inc_value('bol/status_polls')
+        return deferLater(reactor, delay, lambda: [self._status_request(attempt + 1)])
 
     def parse_csv(self, response):
-        reader = csv.DictReader(response.body.splitlines(), delimiter=',')
-        for row in reader:
-            raw_item = {k.upper(): v for k, v in row.items()}
-            # contextualise with meta data
-            raw_item.update(provider_name=self.provider)
+        # `BytesIO` shares the body buffer, so rows are decoded lazily without
+        # copying the whole export into a list of lines
+        self.crawler.stats.inc_value('bol/csv/bytes', len(response.body))
+        for raw_item in iter_csv_rows(io.BytesIO(response.body), provider_name=self.provider):
+            self.crawler.stats.inc_value('bol/csv/rows')
             yield normalize.process_item(raw_item, self.not_terms)
@@ -2,10 +2,14 @@
 
 from __future__ import absolute_import, unicode_literals
 from abc import abstractmethod
+import hashlib
+import re
 
+from scrapy import signals
 import six
 
 from kp_scrapers.lib.date import get_month_look_back
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
 from kp_scrapers.spiders.customs import CustomsSpider
 
 
@@ -14,6 +18,59 @@ from kp_scrapers.spiders.customs import CustomsSpider
 DEFAULT_COMMOS = ['lng']
 
 
+class ProductCodeIndex(object):
+    """Longest-prefix trie over HS product codes.
+
+    Customs spiders look for known product codes inside raw table cells, for
+    every cell. Instead of testing each code as a substring of the value, codes
+    are arranged in a trie that is compiled once into a single regex: at the
+    leftmost position where a code starts, greedy optional branches make the
+    longest code win.
+
+    Examples:
+        >>> index = ProductCodeIndex(['2711', '271111', '270900'])
+        >>> index.match('HS 271111 - LNG')
+        '271111'
+        >>> index.match('2711.12 propane')
+        '2711'
+        >>> index.match('crude 2709')
+
+    """
+
+    _LEAF = ''
+
+    def __init__(self, codes):
+        trie = {}
+        for code in codes:
+            node = trie
+            for char in code:
+                node = node.setdefault(char, {})
+            node[self._LEAF] = {}
+
+        self._pattern = re.compile(self._compile(trie)) if trie else None
+
+    @classmethod
+    def _compile(cls, node):
+        branches = [
+            re.escape(char) + cls._compile(child)
+            for char, child in sorted(node.items())
+            if char != cls._LEAF
+        ]
+        if not branches:
+            return ''
+
+        pattern = branches[0] if len(branches) == 1 else '(?:{})'.format('|'.join(branches))
+        if cls._LEAF in node:
+            # shorter code is a valid match, but only if no longer one matches
+            pattern = '(?:{})?'.format(pattern)
+
+        return pattern
+
+    def match(self, value):
+        match = self._pattern.search(value) if self._pattern else None
+        return match.group(0) if match else None
+
+
 class CustomsBaseSpider(CustomsSpider):
     def __init__(self, months_look_back=None, start_date=None, commodity=None, *args, **kwargs):
         super(CustomsSpider, self).__init__(*args, **kwargs)
@@ -38,32 +95,141 @@ class CustomsBaseSpider(CustomsSpider):
 
     @property
     def products(self):
-        products_codes = dict()
-        for commodity, codes in six.iteritems(self.relevant_commodities()):
-            for code, code_name in six.iteritems(codes):
-                if code in products_codes:
-                    if code_name in products_codes[code]:
-                        products_codes[code][code_name].append(commodity)
-                    else:
-                        products_codes[code][code_name] = [commodity]
-                else:
-                    products_codes[code] = {code_name: [commodity]}
-        return products_codes
+        """Map product codes to their names and commodities.
+
+        Computed once per spider, since requested commodities don't change
+        during a crawl.
+
+        Returns:
+            Dict[str, Dict[str, List[str]]]: code -> code name -> commodities
+
+        """
+        if getattr(self, '_products', None) is None:
+            products_codes = dict()
+            for commodity, codes in six.iteritems(self.relevant_commodities()):
+                for code, code_name in six.iteritems(codes):
+                    products_codes.setdefault(code, {}).setdefault(code_name, []).append(commodity)
+
+            self._products = products_codes
+            self._products_index = ProductCodeIndex(products_codes)
+            self._subcommodities = {}
+
+        return self._products
 
     def get_product(self, value):
-        for code in self.products:
-            if code in value:
-                return code
-        return None
+        if not self.products:
+            return None
+
+        return self._products_index.match(value)
 
     def get_subcommodities(self, code):
-        subcommodities = dict()
-        for code_name, commodities in six.iteritems(self.products[code]):
-            if len(commodities) > 1:
-                raise Exception(
-                    'Multiple commodities {} linked to product {} ({})'.format(
-                        commodities, code_name, code
+        if code not in self.products:
+            raise KeyError(code)
+
+        if code not in self._subcommodities:
+            subcommodities = dict()
+            for code_name, commodities in six.iteritems(self.products[code]):
+                if len(commodities) > 1:
+                    raise Exception(
+                        'Multiple commodities {} linked to product {} ({})'.format(
+                            commodities, code_name, code
+                        )
                     )
-                )
-            subcommodities[code_name] = commodities[0]
-        return subcommodities
+                subcommodities[code_name] = commodities[0]
+
+            self._subcommodities[code] = subcommodities
+
+        # callers are free to mutate what they get
+        return dict(self._subcommodities[code])
+
+
+class IncrementalDatasetMixin(object):
+    """Skip customs datasets that did not change since the last run.
+
+    Each dataset (typically a product and period) is identified by a key
+    given to `conditional_request`. Once its response has been parsed,
+    `remember` stores a digest of it, with its `ETag` and `Last-Modified`
+    headers, in the spider persisted state. Next runs send conditional
+    requests and `is_unchanged` tells whether the response can be skipped,
+    either because the server answered 304 or because the digest matches.
+
+    `-a force=true` ignores known digests. The ratio of unchanged datasets
+    is reported as `customs/datasets/hit_rate`.
+
+    """
+
+    STATS_TPL = 'customs/datasets/{}'
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(IncrementalDatasetMixin, cls).from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.save_datasets, signals.spider_closed)
+        return spider
+
+    @property
+    def datasets(self):
+        if getattr(self, '_datasets', None) is None:
+            self._datasets = PersistDataManager('{}-datasets'.format(self.name))
+        return self._datasets
+
+    @property
+    def force_refresh(self):
+        return str(getattr(self, 'force', '')).lower() == 'true'
+
+    def dataset_digest(self, response):
+        """Fingerprint the data of a response, override to ignore volatile parts."""
+        return hashlib.sha1(response.body).hexdigest()
+
+    def conditional_request(self, request, key):
+        """Tag a request with its dataset key and make it conditional if already seen."""
+        known = {} if self.force_refresh else self.datasets.get(key, {})
+        headers = {}
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+
+        request.headers.update(headers)
+        statuses = request.meta.get('handle_httpstatus_list', [])
+        request.meta.update(dataset=key, handle_httpstatus_list=statuses + [304])
+        return request
+
+    def is_unchanged(self, response):
+        key = response.meta['dataset']
+        known = {} if self.force_refresh else self.datasets.get(key, {})
+        unchanged = response.status == 304 or (
+            known.get('digest') is not None and known['digest'] == self.dataset_digest(response)
+        )
+
+        self._inc_stats('unchanged' if unchanged else 'changed')
+        if unchanged:
+            self.logger.debug('dataset {} did not change since last run'.format(key))
+        return unchanged
+
+    def remember(self, response):
+        """Record a dataset as processed, only call it once items were extracted."""
+        self.datasets[response.meta['dataset']] = {
+            'digest': self.dataset_digest(response),
+            'etag': _header(response, 'ETag'),
+            'last_modified': _header(response, 'Last-Modified'),
+        }
+
+    def save_datasets(self, spider):
+        if spider is not self:
+            return
+
+        stats = self.crawler.stats
+        unchanged = stats.get_value(self.STATS_TPL.format('unchanged'), 0)
+        total = unchanged + stats.get_value(self.STATS_TPL.format('changed'), 0)
+        if total:
+            stats.set_value(self.STATS_TPL.format('hit_rate'), unchanged / total)
+
+        self.datasets.save()
+
+    def _inc_stats(self, metric):
+        self.crawler.stats.inc_value(self.STATS_TPL.format(metric))
+
+
+def _header(response, name):
+    value = response.headers.get(name)
+    return value.decode('latin-1') if value else None
@@ -3,6 +3,7 @@
 from __future__ import absolute_import, unicode_literals
 import copy
 from datetime import date
+import hashlib
 import re
 
 from scrapy.http import FormRequest, Request
@@ -12,23 +13,35 @@ from six.moves import range
 from kp_scrapers.lib.date import rewind_time
 from kp_scrapers.models.items import Customs
 from kp_scrapers.spiders.bases.markers import LngMarker, LpgMarker, OilMarker
-from kp_scrapers.spiders.customs.base import CustomsBaseSpider
+from kp_scrapers.spiders.customs.base import CustomsBaseSpider, IncrementalDatasetMixin
 
 
 DEFAULT_PRICE_CURRENCY = 'EUROS'
 DEFAULT_WEIGHT_CURRENCY = 'quintal'
 
+_DATA_VARS = re.compile(r'var (?:x|y|data)(?:Index|Values)="(.*)";')
 
-class EurostatCustomsSpider(LngMarker, LpgMarker, OilMarker, CustomsBaseSpider):
+
+class EurostatCustomsSpider(
+    IncrementalDatasetMixin, LngMarker, LpgMarker, OilMarker, CustomsBaseSpider
+):
     """
     For each year, for each commodity a bookmark is specified to be used in URL
     Divided into many bookmarks to avoid reaching the max num of rows
+
+    Months are fetched incrementally: a (product, period, flow) dataset that
+    did not change since the last run is not parsed again.
     """
 
     name = 'EurostatCustoms'
     version = '1.0.0'
     provider = 'EurostatCustoms'
 
+    spider_settings = {
+        # every product x month x flow is a request, don't hammer the server
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 4
+    }
+
     url = 'http://appsso.eurostat.ec.europa.eu/nui/show.do'
 
     bookmarks = {
@@ -114,23 +127,42 @@ class EurostatCustomsSpider(LngMarker, LpgMarker, OilMarker, CustomsBaseSpider):
                             "cfo": "%23%23%23%2C%23%23%23.%23%23%23",
                         }
 
-                        yield FormRequest(
+                        request = FormRequest(
                             formdata=formdata,
                             url='http://appsso.eurostat.ec.europa.eu/nui/show.do',
                             callback=self.parse_values,
                             meta={'flow': flow, 'year': year, 'month': month, 'product': product},
                         )
+                        yield self.conditional_request(
+                            request, key='{}/{}/{}'.format(product, period, flow)
+                        )
+
+    def dataset_digest(self, response):
+        # only hash table data, the page around it embeds session details
+        return hashlib.sha1(
+            ''.join(_DATA_VARS.findall(response.text)).encode('utf-8')
+        ).hexdigest()
 
     # Parsing the results
     def parse_values(self, response):
+        # not modified since last run, nothing to check
+        if response.status != 304:
+            if not response.body:
+                self.logger.error('No response body to be parsed')
+                return
+            error_check = ['Bookmark parsing error', 'Unexpected error']
+            if any(i in response.text for i in error_check):
+                self.logger.warning('Invalid format page')
+                return
 
-        if not response.body:
-            self.logger.error('No response body to be parsed')
-            return
-        error_check = ['Bookmark parsing error', 'Unexpected error']
-        if any(i in response.body for i in error_check):
-            self.logger.warning('Invalid format page')
+        if self.is_unchanged(response):
             return
+
+        for item in self.extract_items(response):
+            yield item
+        self.remember(response)
+
+    def extract_items(self, response):
         flow = 'Import' if response.meta['flow'] == 1 else 'Export'
         month = int(response.meta['month'])
         year = int(response.meta['year'])
@@ -138,12 +170,12 @@ class EurostatCustomsSpider(LngMarker, LpgMarker, OilMarker, CustomsBaseSpider):
 
         self.logger.debug('Getting items for month %s, year %s, and flow %s' % (month, year, flow))
 
-        col_index = re.search(r'var xIndex="([0-9a-f]*)";', response.body).group(1)
-        row_index = re.search(r'var yIndex="([0-9a-f]*)";', response.body).group(1)
-        data_index = re.search(r'var dataIndex="([0-9a-f]*)";', response.body).group(1)
-        col_value = re.search(r'var xValues="(.*)";', response.body).group(1)
-        row_value = re.search(r'var yValues="(.*)";', response.body).group(1)
-        data_value = re.search(r'var dataValues="(.*)";', response.body).group(1)
+        col_index = re.search(r'var xIndex="([0-9a-f]*)";', response.text).group(1)
+        row_index = re.search(r'var yIndex="([0-9a-f]*)";', response.text).group(1)
+        data_index = re.search(r'var dataIndex="([0-9a-f]*)";', response.text).group(1)
+        col_value = re.search(r'var xValues="(.*)";', response.text).group(1)
+        row_value = re.search(r'var yValues="(.*)";', response.text).group(1)
+        data_value = re.search(r'var dataValues="(.*)";', response.text).group(1)
 
         row_dimension = Dimension(row_index, row_value)
         col_dimension = Dimension(col_index, col_value)
@@ -172,22 +204,29 @@ class EurostatCustomsSpider(LngMarker, LpgMarker, OilMarker, CustomsBaseSpider):
         return item
 
     def aggregate_fields(self, row_dimension, column_dimension, cells):
+        # headers don't depend on the cell, resolve them once per row and column
+        rows = [
+            EurostatCustomsSpider.format_player_names(row.split('|')[7])
+            for row in row_dimension.items
+        ]
+        columns = []
+        for column in column_dimension.items:
+            column_item = column.split('|')
+            columns.append(
+                (
+                    EurostatCustomsSpider.format_player_names(column_item[7]),
+                    self.check_unit(column_item[11]),
+                )
+            )
+
         items = {}
-        for row_idx in range(0, row_dimension.items_count):
-            row_item = row_dimension.items[row_idx].split('|')
-            for column_idx in range(0, column_dimension.items_count):
-                column_item = column_dimension.items[column_idx].split('|')
-                data_cell = cells.items[column_idx + row_idx * column_dimension.items_count]
+        width = column_dimension.items_count
+        for row_idx, row_player in enumerate(rows):
+            for column_idx, (column_player, unit) in enumerate(columns):
+                data_cell = cells.items[column_idx + row_idx * width]
                 value_cell = EurostatCustomsSpider.format_value(data_cell.split('|')[0])
                 if value_cell:
-                    players = (
-                        EurostatCustomsSpider.format_player_names(row_item[7]),
-                        EurostatCustomsSpider.format_player_names(column_item[7]),
-                    )
-                    if players in items:
-                        items[players][self.check_unit(column_item[11])] = value_cell
-                    else:
-                        items[players] = {self.check_unit(column_item[11]): value_cell}
+                    items.setdefault((row_player, column_player), {})[unit] = value_cell
         return items
 
     def check_unit(self, unit):
@@ -101,6 +101,15 @@ BANNED_TIME = 1 * 24 * 3600
 # average interval between requests (in seconds)
 AVG_DELAY = 40
 
+# logged-in sessions crawling vessels concurrently, each one with its own login
+SESSIONS = 3
+
+# time a login rests after reaching its search quota (in seconds)
+LOGIN_COOLDOWN = 10 * 60
+
+# vessels parsed between two saves of the pending imos queue
+CHECKPOINT_EVERY = 25
+
 # when identifying Equasis vessels from newbuilds cache, take ±10 % of DWT
 DWT_APPROXIMATION = 0.10
 
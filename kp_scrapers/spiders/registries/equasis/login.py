@@ -1,5 +1,6 @@
 import datetime as dt
 import logging
+import time
 
 from scrapy.exceptions import CloseSpider
 from scrapy.http import FormRequest
@@ -80,6 +81,65 @@ def rebuild_logins(persisted_creds, creds):
     return persisted_creds
 
 
+class CredentialPool(object):
+    """Share logins between sessions running concurrently.
+
+    A login is leased by one session at a time, and rests for `cooldown` seconds once
+    released, so that sessions rotating together do not hammer the same accounts.
+    Banned logins stay quarantined for `constants.BANNED_TIME`, like before.
+
+    Args:
+        persisted_data(PersistDataManager): logins metadata, shared with `Credentials`
+        stats(scrapy.statscollectors.StatsCollector):
+        cooldown(int): seconds a login rests after being released
+
+    """
+
+    def __init__(self, persisted_data, stats, cooldown=constants.LOGIN_COOLDOWN):
+        self.persisted_data = persisted_data
+        self.stats = stats
+        self.cooldown = cooldown
+        self.leased = set()
+        # login -> monotonic time it can be used again
+        self._resting = {}
+
+    def _logins(self):
+        return self.persisted_data.get('logins', {}).values()
+
+    @property
+    def available_logins(self):
+        """Logins neither banned, nor used by another session, nor resting."""
+        now = time.monotonic()
+        return [
+            login
+            for login in self._logins()
+            if old_enough(login)
+            and login['login'] not in self.leased
+            and self._resting.get(login['login'], 0) <= now
+        ]
+
+    @property
+    def exhausted(self):
+        """Tell if every login is banned, as opposed to temporarily unavailable."""
+        return not any(old_enough(login) for login in self._logins())
+
+    def lease(self, login):
+        self.leased.add(login)
+        self.stats.set_value('equasis/logins_leased', len(self.leased))
+
+    def release(self, login):
+        if login in self.leased:
+            self.leased.discard(login)
+            self._resting[login] = time.monotonic() + self.cooldown
+        self.stats.set_value('equasis/logins_leased', len(self.leased))
+
+    def quarantine(self, login):
+        logger.warning(f'quarantining banned login {login}')
+        self.stats.inc_value('equasis/logins_quarantined')
+        # no need to rest, the ban keeps it out of the pool anyway
+        self.leased.discard(login)
+
+
 # NOTE this class could be much more generic
 class Credentials(object):
     """Manage how to make and keep a scrapper logged in.
@@ -87,15 +147,17 @@ class Credentials(object):
     Args:
         storage(PersistDataManager): make data persistent between runs
         credentials(list[dict]): list of login/password dictionnaries
+        pool(CredentialPool): logins shared with other sessions, if any
     """
 
-    def __init__(self, persisted_data, inventory, stats):
+    def __init__(self, persisted_data, inventory, stats, pool=None):
         self._credentials = {}
         self.inventory = inventory
         # keep scrapy `PersistSpider` convention
         self.persisted_data = persisted_data
         # closely monitor credntials lifecycle
         self.stats = stats
+        self.pool = pool
 
         # check if list of persisted logins is equal to the one we have in `constants`
         # if not, append new logins and keep old logins as they are
@@ -112,18 +174,38 @@ class Credentials(object):
     @property
     def available_logins(self):
         """Remove blocked logins that are still in the ban period."""
+        if self.pool is not None:
+            return self.pool.available_logins
         return [login for login in self.persisted_data['logins'].values() if old_enough(login)]
 
     def renew(self):
+        """Switch to the login used the least recently.
+
+        Returns:
+            bool: False if other sessions hold or rest every login left
+
+        """
+        self.release()
+
         # filter to elligible logins
         logins = self.available_logins
         self.stats.set_value('equasis/logins', len(logins))
         if not logins:
+            if self.pool is not None and not self.pool.exhausted:
+                return False
             raise CloseSpider(reason='no logins left to use')
 
         logger.info('renewing credentials (%d left)', len(logins))
         # select login that was used the least recently
         self._credentials = oldest_login(logins)
+        if self.pool is not None:
+            self.pool.lease(self._credentials['login'])
+        return True
+
+    def release(self):
+        """Give the current login back to the pool."""
+        if self.pool is not None and self._credentials:
+            self.pool.release(self._credentials['login'])
 
     def success(self, login_res):
         self._update_meta('last_response', login_res)
@@ -137,6 +219,8 @@ class Credentials(object):
 
     def ban(self):
         self._update_meta('_last_blocked', utils.to_timestamp(dt.datetime.utcnow()))
+        if self.pool is not None:
+            self.pool.quarantine(self._credentials['login'])
 
     def _update_time(self, key):
         # store time as ISO8601 to be human-readable and compatible
@@ -190,7 +274,10 @@ class LoginPage(object):
         }
 
     def submit(self):
-        self.credentials.renew()
+        if not self.credentials.renew():
+            logger.info(f'no login available right now, closing session {self.session}')
+            return None
+
         logger.debug('Submit new Login request with login {}'.format(self.credentials['login']))
         return FormRequest(
             url=self.LOGIN_URL,
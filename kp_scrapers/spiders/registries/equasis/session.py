@@ -1,10 +1,19 @@
+"""Equasis sessions.
+
+Every session logs in with its own credentials, and uses its own cookiejar and
+download slot, so that several sessions can crawl at once, each one waiting
+`DOWNLOAD_DELAY` between its requests.
+
+"""
+
+from collections import deque
 import logging
 
 from scrapy.exceptions import CloseSpider
 from scrapy.http import FormRequest
 from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.misc import arg_to_iter
 
-from kp_scrapers.lib.utils import random_delay
 from kp_scrapers.spiders.registries.equasis import api, constants, parser, utils
 from kp_scrapers.spiders.registries.equasis.login import LoginPage
 
@@ -12,6 +21,77 @@ from kp_scrapers.spiders.registries.equasis.login import LoginPage
 logger = logging.getLogger(__name__)
 
 
+class ImoQueue(object):
+    """Imos left to parse, shared by vessel sessions and saved as the crawl goes.
+
+    The queue (pending imos, and those being requested) is written to the spider
+    persisted data every `checkpoint_every` vessels, so that an interrupted job
+    resumes where it stopped. It is removed from it once empty.
+
+    Args:
+        imos(List[str]):
+        persisted_data(PersistDataManager):
+        key(str): where the queue is saved in persisted data
+        checkpoint_every(int): vessels parsed between two saves
+
+    Examples:
+        >>> queue = ImoQueue(['1', '2', '3'], persisted_data={})
+        >>> queue.pop(), queue.pop()
+        ('1', '2')
+        >>> queue.retry('2')
+        >>> queue.done('1')
+        >>> queue.snapshot()
+        ['2', '3']
+
+    """
+
+    def __init__(
+        self, imos, persisted_data, key='imos_queue', checkpoint_every=constants.CHECKPOINT_EVERY
+    ):
+        self._pending = deque(imos)
+        self._in_flight = []
+        self.persisted_data = persisted_data
+        self.key = key
+        self.checkpoint_every = checkpoint_every
+        self._done = 0
+
+    def __len__(self):
+        return len(self._pending) + len(self._in_flight)
+
+    def pop(self):
+        """Next imo to request, None if there is nothing left."""
+        if not self._pending:
+            return None
+        imo = self._pending.popleft()
+        self._in_flight.append(imo)
+        return imo
+
+    def retry(self, imo):
+        """Put an imo back at the front of the queue."""
+        self._in_flight.remove(imo)
+        self._pending.appendleft(imo)
+
+    def done(self, imo):
+        self._in_flight.remove(imo)
+        self._done += 1
+        if not self:
+            self.checkpoint()
+        elif self._done % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def snapshot(self):
+        return self._in_flight + list(self._pending)
+
+    def checkpoint(self):
+        if self:
+            self.persisted_data[self.key] = self.snapshot()
+        else:
+            self.persisted_data.pop(self.key, None)
+
+        if hasattr(self.persisted_data, 'save'):
+            self.persisted_data.save()
+
+
 class EquasisSession(object):
     """Basic session class providing common session behaviour for Equasis"""
 
@@ -59,14 +139,20 @@ class EquasisSession(object):
             callback: triggered after rotation.
 
         Returns:
+            Optional[scrapy.FormRequest]: login request, if rotating
 
         """
         # rotate and spread usage across all credentials to minimise chances of being banned
         if self.search_count < self.spider.search_quota:
             self.search_count += 1
+            return None
 
-        else:
-            self.rotate(callback=callback)
+        return self.rotate(callback=callback)
+
+    def close(self):
+        """Give the current login back to the pool."""
+        logger.info(f'Closing {self.name} [session_id={self.id}]')
+        self.credentials.release()
 
     def is_blocked(self, response):
         """Check if current credential is blocked based on response.
@@ -193,11 +279,11 @@ class SearchSession(object):
             )
 
         # aggregate results
-        elif self.result_imos:
+        self.session.close()
+        if self.result_imos:
             logger.info('Searching vessels is done, moving to vessel parsing with imo.')
             return self.session.spider.parse_vessels(self.result_imos)
 
-    @random_delay(average=constants.AVG_DELAY)
     def on_search_results(self, response):
         """Handle results with given search parameters, scan next page if any.
 
@@ -208,11 +294,13 @@ class SearchSession(object):
 
         """
         if self.session.is_blocked(response):
-            self.session.rotate(callback=self.advanced_search)
+            # search again with another login
+            yield self.session.rotate(callback=self.advanced_search)
+            return
 
         if self.session.has_no_result(response):
             # retry, this is because of timeout
-            yield self.advanced_search(response)
+            yield from arg_to_iter(self.advanced_search(response))
 
         # get imos from current page
         imos = api.get_imos(response)
@@ -237,10 +325,13 @@ class SearchSession(object):
             self.init_pages()
 
         # rotate and spread usage across all credentials to minimise chances of being banned
-        self.session.stay_or_rotate(callback=self.advanced_search)
+        login = self.session.stay_or_rotate(callback=self.advanced_search)
+        if login is not None:
+            yield login
+            return
 
         # search for params list
-        yield self.advanced_search(response)
+        yield from arg_to_iter(self.advanced_search(response))
 
     def init_pages(self):
         if len(self.search_filters) > 0:
@@ -255,6 +346,9 @@ class VesselSession(object):
     detailed vessel information. It would only be called with given imo list, or after all
     the imos are aggregated in SearchSession.
 
+    Several sessions can share the same `ImoQueue`, each one taking the next imo
+    as soon as it is done with the previous one.
+
     This session is able to:
         - redo searching by imo without changing credentials
         - rotate credentials after the search count has reached search quota
@@ -262,9 +356,12 @@ class VesselSession(object):
 
     """
 
-    def __init__(self, spider, imos, whitelist=None, blacklist=None):
-        self.session = EquasisSession(spider, self.__class__.__name__)
+    def __init__(self, spider, imos, whitelist=None, blacklist=None, name=None):
+        self.session = EquasisSession(spider, name or self.__class__.__name__)
+        if not isinstance(imos, ImoQueue):
+            imos = ImoQueue(imos, persisted_data=spider.persisted_data)
         self.imos = imos
+        self.current_imo = None
 
         # allow blacklisting/whitelisting fields of the item
         # NOTE both whitelist/blacklist cannot be specified together
@@ -296,15 +393,18 @@ class VesselSession(object):
         """
 
         def _request_failed(error):
-            if not self.session.should_retry_when_failed(error):
+            if self.session.should_retry_when_failed(error):
+                self.imos.retry(self.current_imo)
+            else:
                 # skip current imo
-                self.imos.pop(0)
+                self.imos.done(self.current_imo)
 
             return self.request_vessel(response)
 
-        if len(self.imos) > 0:
+        self.current_imo = self.imos.pop()
+        if self.current_imo is not None:
             return api.make_vessel_request(
-                imo=self.imos[0],
+                imo=self.current_imo,
                 response=response,
                 callback=self.parse_vessel,
                 errback=_request_failed,
@@ -312,8 +412,8 @@ class VesselSession(object):
 
         else:
             logger.info(f'Parsed all imos [session_id={self.session.id}]')
+            self.session.close()
 
-    @random_delay(average=constants.AVG_DELAY)
     def parse_vessel(self, response):
         """Parse the vessel page with given imo.
 
@@ -324,13 +424,14 @@ class VesselSession(object):
             Dict[str, str]:
 
         """
+        current_imo = self.current_imo
         if self.session.is_blocked(response):
-            self.session.rotate(self.request_vessel)
-
-        current_imo = self.imos[0]
+            # let another session, or this one once logged in again, take care of it
+            self.imos.retry(current_imo)
+            yield self.session.rotate(self.request_vessel)
+            return
 
         logger.debug(f'Parsing vessel imo={current_imo} [session_id={self.session.id}]')
-        self.imos.pop(0)
 
         if self.session.has_no_result(response):
             logger.warning(
@@ -355,11 +456,16 @@ class VesselSession(object):
                     exc_info=1,
                 )
 
+        self.imos.done(current_imo)
+
         # will close the runtime if close to memory limit
         # after saving the given data dict
-        self.session.spider.handle_high_memory({'imos_queue': self.imos})
+        self.session.spider.handle_high_memory({'imos_queue': self.imos.snapshot()})
 
-        self.session.stay_or_rotate(callback=self.request_vessel)
+        login = self.session.stay_or_rotate(callback=self.request_vessel)
+        if login is not None:
+            yield login
+            return
 
         # parse next imo
         yield self.request_vessel(response)
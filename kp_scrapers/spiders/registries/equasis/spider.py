@@ -14,6 +14,9 @@ website: http://www.equasis.org/EquasisWeb/public/HomePage
         -a min_page=1 \
         -a max_page=5
 
+    # Vessels are parsed by several sessions at once, each one with its own login
+    $ scrape EquasisActive -a sessions=4 -a vessels_per_login=5
+
     # To do a test run, add the `test` argument
     $ scrape Equasis \
         -a test=1 \
@@ -41,8 +44,8 @@ from kp_scrapers.lib.static_data import fetch_kpler_fleet
 from kp_scrapers.spiders.bases.persist import PersistSpider
 from kp_scrapers.spiders.registries import RegistrySpider
 from kp_scrapers.spiders.registries.equasis import constants
-from kp_scrapers.spiders.registries.equasis.login import Credentials
-from kp_scrapers.spiders.registries.equasis.session import SearchSession, VesselSession
+from kp_scrapers.spiders.registries.equasis.login import CredentialPool, Credentials
+from kp_scrapers.spiders.registries.equasis.session import ImoQueue, SearchSession, VesselSession
 
 
 logger = logging.getLogger(__name__)
@@ -57,10 +60,14 @@ class _EquasisCrawler(RegistrySpider, PersistSpider):
     """Base crawl class for Equasis."""
 
     name = '_EquasisCrawler'
-    version = '1.1.0'
+    version = '1.2.0'
     provider = 'Equasis'
 
     spider_settings = {
+        # every session has its own download slot, so sessions wait between their own
+        # requests without holding back each other (nor the reactor)
+        'DOWNLOAD_DELAY': constants.AVG_DELAY,
+        'RANDOMIZE_DOWNLOAD_DELAY': True,
         'DATADOG_CUSTOM_METRICS': [
             # we usually want to monitor the quantity of data found and the performance
             'item_scraped_count',
@@ -72,6 +79,7 @@ class _EquasisCrawler(RegistrySpider, PersistSpider):
             'equasis/pages_count',
             'equasis/requests_failed',
             'equasis/logins',
+            'equasis/logins_quarantined',
             # equasis spider has the bad idea to often fail on too much memory used
             'memusage/max',
         ]
@@ -79,7 +87,8 @@ class _EquasisCrawler(RegistrySpider, PersistSpider):
 
     # NOTE at this point it's almost ready to be shared accross every spider
     def handle_high_memory(self, data, tolerance=SHUB_MEMORY_TOLERANCE):
-        memusage = self.crawler.stats.get_value('memusage/max')
+        # not collected when the memory usage extension is disabled
+        memusage = self.crawler.stats.get_value('memusage/max', 0)
         if memusage > tolerance:
             self.logger.warning('reaching memory limit: {}'.format(memusage))
             # TODO if near max memory usage : store imos and close spiders
@@ -89,6 +98,12 @@ class _EquasisCrawler(RegistrySpider, PersistSpider):
             # gracefully end spider (finished being the normal code)
             raise CloseSpider(NORMAL_EXIT_REASON)
 
+    def spider_closed(self, spider):
+        # sessions may have given up early because no login was left, save what they did not do
+        if spider is self and getattr(self, 'imos_queue', None) is not None:
+            self.imos_queue.checkpoint()
+        super().spider_closed(spider)
+
     @abstractmethod
     def parse_vessels(self, imo_list):
         """Mandatory method called after imos are aggregated."""
@@ -112,7 +127,7 @@ class EquasisSpider(_EquasisCrawler):
     """
 
     name = 'Equasis'
-    version = '1.1.0'
+    version = '1.2.0'
     provider = 'Equasis'
 
     def __init__(self, *args, **kwargs):
@@ -130,6 +145,8 @@ class EquasisSpider(_EquasisCrawler):
             imos (str): comma-delimited list of IMOs to get data for
             category (str): vessel category, see `constants.py` for details
             filters (str): comma-delimited key-value pairs, functions like kwargs
+            sessions (str): number of vessel sessions running concurrently
+            login_cooldown (str): seconds a login rests before being used again
 
         """
         super(EquasisSpider, self).__init__(*args, **kwargs)
@@ -140,6 +157,12 @@ class EquasisSpider(_EquasisCrawler):
         # this is done to distribute downloads across all logins and minimise possibility of bans
         self.search_quota = int(kwargs.get('vessels_per_login', 5))
 
+        # each session holds a login, sessions never share one
+        self.sessions = int(kwargs.get('sessions', constants.SESSIONS))
+        self.imos_queue = None
+        self._pool = None
+        self._login_cooldown = int(kwargs.get('login_cooldown', constants.LOGIN_COOLDOWN))
+
         # be gentle with equasis: split search
         self._min_page = int(kwargs.get('min_page', constants.DEFAULT_MIN_PAGE))
         self._max_page = int(kwargs.get('max_page', constants.DEFAULT_MAX_PAGE))
@@ -182,24 +205,50 @@ class EquasisSpider(_EquasisCrawler):
         """
         if self._requested_imos:
             logger.info('Scraping given imos: {}'.format(self._requested_imos))
-            return [self.parse_vessels(self._requested_imos)]
+            return self.parse_vessels(self._requested_imos)
 
         else:
 
             session = SearchSession(self, self.make_search_params())
             return session.open_session()
 
-    def parse_vessels(self, imo_list):
-        # NOTE since too many imos will make the spider to crash, may be we
-        # could die early here instead
-        session = VesselSession(self, imo_list)
-        return session.open_session()
+    def parse_vessels(self, imo_list, **options):
+        """Open concurrent sessions sharing the queue of imos to parse.
+
+        Returns:
+            List[scrapy.Request]: login requests of every session
+
+        """
+        # saved right away, and as sessions go, so that the next run resumes if this one dies
+        self.imos_queue = ImoQueue(imo_list, persisted_data=self.persisted_data)
+        self.imos_queue.checkpoint()
+
+        sessions = max(1, min(self.sessions, len(imo_list)))
+        self.crawler.stats.set_value('equasis/sessions', sessions)
+        logger.info(f'Parsing {len(imo_list)} vessels with {sessions} sessions')
+        requests = [
+            VesselSession(
+                self, self.imos_queue, name=f'VesselSession-{index}', **options
+            ).open_session()
+            for index in range(sessions)
+        ]
+        # sessions that found no login available are not opened
+        return [request for request in requests if request is not None]
+
+    @property
+    def credential_pool(self):
+        if self._pool is None:
+            self._pool = CredentialPool(
+                self.persisted_data, self.crawler.stats, cooldown=self._login_cooldown
+            )
+        return self._pool
 
     def make_credentials(self):
         return Credentials(
             persisted_data=self.persisted_data,
             inventory=constants.DEV_USERS if self._is_test else constants.PROD_USERS,
             stats=self.crawler.stats,
+            pool=self.credential_pool,
         )
 
     def make_search_params(self):
@@ -232,7 +281,7 @@ class EquasisActiveSpider(EquasisSpider):
     """
 
     name = 'EquasisActive'
-    version = '1.0.0'
+    version = '1.1.0'
     # provider should actually be Equasis, but we mock Gibson so that the loaders
     # won't reject the data due to lower provider confidence by Equasis
     provider = 'GR'
@@ -269,10 +318,7 @@ class EquasisActiveSpider(EquasisSpider):
         )
 
         logger.info('Going to scrape for %d active vessels' % len(self._requested_imos))
-        yield self.parse_vessels(self._requested_imos)
+        yield from self.parse_vessels(self._requested_imos)
 
     def parse_vessels(self, imo_list):
-        # NOTE since too many imos will make the spider to crash,
-        # maybe we could die early here instead
-        session = VesselSession(self, imo_list, whitelist=self.whitelist, blacklist=self.blacklist)
-        return session.open_session()
+        return super().parse_vessels(imo_list, whitelist=self.whitelist, blacklist=self.blacklist)
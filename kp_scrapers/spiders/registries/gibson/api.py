@@ -7,20 +7,37 @@ import sqlite3
 logger = logging.getLogger(__name__)
 
 
+# rows inserted per statement, bounds memory while streaming extracts
+BATCH_SIZE = 10000
+
+# the DB is a throwaway copy of the snapshot, trade durability for load speed
+BULK_LOAD_PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    # in KiB when negative
+    'PRAGMA cache_size = -131072',
+)
+
+
 class VesselsDB:
     """Pretty API around SQLite DB interaction with CSV extracts.
 
-    Exposes two public methods for appending/retrieving data using a reconstructed SQLite DB:
+    Exposes public methods for appending/retrieving data using a reconstructed SQLite DB:
         - set_rows (INSERT)
+        - create_indexes (once all rows are inserted)
         - get_rows (SELECT)
 
     """
 
     def __init__(self, path):
-        self.db_conn = sqlite3.connect(path)
+        # NOTE without `uri`, `file::memory:` paths would be created on disk
+        self.db_conn = sqlite3.connect(path, uri=path.startswith('file:'))
         # see https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.row_factory
         # allow key-based access to columns
         self.db_conn.row_factory = sqlite3.Row
+        for pragma in BULK_LOAD_PRAGMAS:
+            self.db_conn.execute(pragma)
 
         # initialise empty tables
         list(self._execute(self._sql_script('create-tables.sql')))
@@ -58,18 +75,40 @@ class VesselsDB:
         # table names cannot be parametrized by sqlite, so we need to protect against injection
         return ''.join(char for char in raw if char.isalnum() or char in ('.', '_'))
 
-    def set_rows(self, table_name, rows):
-        """Insert rows into a specified table.
+    def set_rows(self, table_name, rows, batch_size=BATCH_SIZE):
+        """Insert rows into a specified table, in batches.
 
         Args:
             table_name (str): name of table
-            rows (List[List(str)]): a list of rows to be inserted into the table
+            rows (Iterable[List(str)]): rows to be inserted into the table, possibly streamed
+            batch_size (int): rows inserted per statement
+
+        Returns:
+            int: number of rows inserted
 
         """
-        # assume `rows` is truthy
-        values = ','.join(itertools.repeat('?', len(rows[0])))
-        # exhaust generator to commit query
-        list(self._execute(f'INSERT INTO {self._scrub(table_name)} VALUES ({values});', rows))
+        rows = iter(rows)
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return 0
+
+        values = ','.join(itertools.repeat('?', len(batch[0])))
+        query = f'INSERT INTO {self._scrub(table_name)} VALUES ({values});'
+        count = 0
+        while batch:
+            # exhaust generator to commit query
+            list(self._execute(query, batch))
+            count += len(batch)
+            batch = list(itertools.islice(rows, batch_size))
+        return count
+
+    def close(self):
+        # in-memory DBs are freed with their last connection
+        self.db_conn.close()
+
+    def create_indexes(self):
+        """Index join keys, faster once rows are loaded than maintained while inserting."""
+        list(self._execute(self._sql_script('create-indexes.sql')))
 
     def get_rows(self, query=None):
         """Get rows from a specified query.
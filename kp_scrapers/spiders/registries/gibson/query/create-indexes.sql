@@ -0,0 +1,15 @@
+CREATE INDEX IF NOT EXISTS idx_vesselmain_imo ON EAGKplerVesselMain (IMONumber);
+CREATE INDEX IF NOT EXISTS idx_vesselmain_id ON EAGKplerVesselMain (ID);
+CREATE INDEX IF NOT EXISTS idx_company_id ON EAGKplerCompany (ID);
+CREATE INDEX IF NOT EXISTS idx_companytype_id ON EAGKplerCompanyType (ID);
+CREATE INDEX IF NOT EXISTS idx_vesseltype_code ON EAGKplerVesselType (Code);
+CREATE INDEX IF NOT EXISTS idx_subtype_code ON EAGKplerSubtype (Code);
+CREATE INDEX IF NOT EXISTS idx_tradingcategory_code ON EAGKplerTradingCategory (Code);
+CREATE INDEX IF NOT EXISTS idx_tradingstatus_code ON EAGKplerTradingStatus (Code);
+CREATE INDEX IF NOT EXISTS idx_scrubbertype_code ON EAGKplerScrubberType (Code);
+CREATE INDEX IF NOT EXISTS idx_exname_vessel ON EAGKplerExname (VesselID);
+CREATE INDEX IF NOT EXISTS idx_gear_vessel ON EAGKplerGear (VesselID);
+CREATE INDEX IF NOT EXISTS idx_alteration_vessel ON EAGKplerAlteration (VesselID);
+CREATE INDEX IF NOT EXISTS idx_userdefinedyn_vessel ON EAGKplerUserDefinedYNValues (VesselID);
+CREATE INDEX IF NOT EXISTS idx_userdefinednd_vessel ON EAGKplerUserDefinedNDValues (VesselID);
+ANALYZE;
@@ -1,17 +1,24 @@
 """Spider module for GibsonRegistry spider.
 
-TODO docs on design considerations
+The provider uploads a weekly snapshot of its DB as zipped CSV tables. Tables
+are streamed into an indexed SQLite DB, then joined to build vessels. A digest
+of each vessel row is persisted so that only vessels that changed since the
+previous snapshot are yielded, unless `full_snapshot` is given.
 
 Usage
 ~~~~~
 
     $ scrapy crawl GibsonRegistry \
-        -a reported_date=20190314
+        -a reported_date=20190314 \
+        -a full_snapshot=1
 
 """
 import csv
 import datetime as dt
+import hashlib
+import json
 import re
+import time
 
 from kp_scrapers.constants import BLANK_START_URL
 from kp_scrapers.lib.compression import zip_uncompress
@@ -19,6 +26,7 @@ from kp_scrapers.lib.services import s3
 from kp_scrapers.lib.static_data import fetch_kpler_fleet
 from kp_scrapers.models.normalize import DataTypes
 from kp_scrapers.spiders.bases.persist import PersistSpider
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
 from kp_scrapers.spiders.registries import RegistrySpider
 from kp_scrapers.spiders.registries.gibson import api, normalize
 
@@ -29,6 +37,20 @@ SOURCE_KEY_PATTERN = r'EAGKpler(?P<reported_date>\d{8})\d{4}\.zip'
 TABLES_TO_KEEP = r'EAGKpler\w+\.txt'
 
 
+def row_digest(row):
+    """Fingerprint a vessel row, whatever the order of its columns.
+
+    Examples:
+        >>> row_digest({'imonumber': '9834454', 'dwt': '1000'})
+        '69cb982c986f64cb'
+        >>> row_digest({'dwt': '1000', 'imonumber': '9834454'})
+        '69cb982c986f64cb'
+
+    """
+    payload = json.dumps(row, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
 class GibsonRegistryBaseSpider(RegistrySpider, PersistSpider):
     """Base module for getting vessels data from uploaded S3 file with generic queries.
 
@@ -40,12 +62,20 @@ class GibsonRegistryBaseSpider(RegistrySpider, PersistSpider):
     name = 'GibsonRegistry'
     # NOTE provider name is deliberately obfuscated due to the sensitive nature of the source
     provider = 'GR'
-    version = '1.7.0'
+    version = '1.8.0'
     produces = [DataTypes.Vessel]
 
     start_urls = [BLANK_START_URL]
 
-    def __init__(self, reported_date=None, query=None, force_load=False, *args, **kwargs):
+    def __init__(
+        self,
+        reported_date=None,
+        query=None,
+        force_load=False,
+        full_snapshot=False,
+        *args,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
         # get persistence state
@@ -62,6 +92,8 @@ class GibsonRegistryBaseSpider(RegistrySpider, PersistSpider):
         # custom data query; this will override the default query specified
         self.query = query
         self.force_load = force_load
+        # yield every vessel, not only those that changed since the previous snapshot
+        self.full_snapshot = full_snapshot
 
     def parse(self, _):
         """Entrypoint for GibsonRegistry spider.
@@ -77,8 +109,21 @@ class GibsonRegistryBaseSpider(RegistrySpider, PersistSpider):
         # and they were obtained as CSV extracts from the provider's DB anyway.
         # Use in-memory DB for performance.
         db = api.VesselsDB(path='file::memory:?cache=shared')
+        try:
+            if self._load_snapshot(db):
+                yield from self._extract_vessels(db)
+        finally:
+            db.close()
+
+    def _load_snapshot(self, db):
+        """Populate sqlite tables with S3 data.
 
-        # populate sqlite tables with S3 data
+        Returns:
+            bool: False if there is nothing to extract
+
+        """
+        stats = self.crawler.stats
+        start, loaded = time.time(), 0
         for s3obj in s3.iter_files(SOURCE_BUCKET, Prefix=SOURCE_KEY_PREFIX):
             # filter files having specified `reported_date`
             file_match = re.search(SOURCE_KEY_PATTERN, s3obj.key)
@@ -87,29 +132,79 @@ class GibsonRegistryBaseSpider(RegistrySpider, PersistSpider):
 
             # check if files on specified date has been extracted already
             if not self._check_persistence() and not self.force_load:
-                return
+                return False
 
             # download zipped folder
             s3_file = next(s3.fetch_file(SOURCE_BUCKET, key_name=s3obj.key))
 
-            # uncompress zipped folder
-            for file_name, rows in zip_uncompress(s3_file, TABLES_TO_KEEP, reader=csv.reader):
+            # uncompress zipped folder, streaming rows instead of loading whole tables
+            for file_name, rows in zip_uncompress(
+                s3_file, TABLES_TO_KEEP, lazy=True, reader=csv.reader
+            ):
+                # table name is identical to file name sans extension
+                count = db.set_rows(table_name=file_name.split('.txt')[0], rows=rows)
                 # sanity check in case csv extract does not contain any rows
-                if not rows:
-                    self.logger.error(f'No data found in extract: {s3_file.key}/{file_name}')
-                    return
+                if not count:
+                    self.logger.error(f'No data found in extract: {s3obj.key}/{file_name}')
+                    return False
+                loaded += count
+
+        stats.set_value('gibson/rows_loaded', loaded)
+        stats.set_value('gibson/load_seconds', round(time.time() - start, 3))
+        if not loaded:
+            self.logger.warning(f'No snapshot found for {self.reported_date}')
+            return False
 
-                # table name is identical to file name sans extension
-                db.set_rows(table_name=file_name.split('.txt')[0], rows=rows)
+        start = time.time()
+        db.create_indexes()
+        stats.set_value('gibson/index_seconds', round(time.time() - start, 3))
+        return True
+
+    def _extract_vessels(self, db):
+        """Retrieve vessels according to specified sql query, skipping unchanged ones.
+
+        Yields:
+            Dict[str, str]:
 
-        # retrieve vessels according to specified sql query
-        for raw_item in db.get_rows(self.query):
+        """
+        stats = self.crawler.stats
+        previous, current = self.digests, {}
+        rows, query_time = db.get_rows(self.query), 0.0
+        while True:
+            start = time.time()
+            raw_item = next(rows, None)
+            query_time += time.time() - start
+            if raw_item is None:
+                break
+
+            # NOTE before contextualising, `reported_date` changes every week
+            imo, digest = raw_item.get('IMONumber'), row_digest(raw_item)
+            current.setdefault(imo, []).append(digest)
+            if digest in previous.get(imo, ()) and not self.full_snapshot:
+                stats.inc_value('gibson/vessels_unchanged')
+                continue
+
+            stats.inc_value('gibson/vessels_changed')
             # contextualise raw item with meta info
             raw_item.update(
                 provider_name=self.provider, reported_date=self.iso_reported_date,
             )
             yield normalize.process_item(raw_item)
 
+        stats.set_value('gibson/query_seconds', round(query_time, 3))
+
+        # vessels gone from the snapshot are forgotten
+        previous.clear()
+        previous.update(current)
+        previous.save()
+
+    @property
+    def digests(self):
+        """Row digests of the previous snapshot, keyed by IMO number."""
+        if getattr(self, '_digests', None) is None:
+            self._digests = PersistDataManager('{}-digests'.format(self.name))
+        return self._digests
+
     def _check_persistence(self):
         """Check if the vessel data to be processed has been scraped previously.
 
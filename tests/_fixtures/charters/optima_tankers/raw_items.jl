@@ -0,0 +1,2 @@
+{"vessel_status": "JAG PRAKASH", "cargo_volume": "35", "cargo_product": "CPP", "lay_can": "03/MAR", "voyage": "SIKKA/HAZIRA-JNPT", "rate_value": "USD255K", "charterer": "RELIANCE", "provider_name": "Optima Tankers", "reported_date": "28 Feb 2020", "mail_title": "FW: OPTIMA TANKERS-CLN FIXTURE REPORT (REF:20078IW)"}
+{"vessel": "ENERGY CHAMPION", "cargo_volume": "50", "lay_can": "1/03", "voyage": "ECMEX/USG", "rate_value": "WS195", "charterer_status": "HUNT", "provider_name": "Optima Tankers", "reported_date": "28 Feb 2020", "mail_title": "Fwd: FW: OPTIMA TANKERS-DPP FIXTURE REPORT (REF:2007983)"}
@@ -0,0 +1,72 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import shutil
+import tempfile
+import threading
+import time
+import sys
+import unittest
+
+# NOTE `kp_scrapers.cli.commands.export` is shadowed by the click command of the same name
+import kp_scrapers.cli.commands.export  # noqa
+
+
+export = sys.modules['kp_scrapers.cli.commands.export']
+
+
+class BoundedMapTestCase(unittest.TestCase):
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def task(i):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return i * 2
+
+        results = [future.result() for future in export.bounded_map(task, range(10), 3)]
+
+        self.assertEqual(sorted(results), [i * 2 for i in range(10)])
+        self.assertLessEqual(state['peak'], 3)
+
+    def test_results_in_submission_order(self):
+        completed = []
+
+        def task(job):
+            # the newest job comes first and finishes last
+            time.sleep(0.05 if job == 'newest' else 0)
+            completed.append(job)
+            return job
+
+        jobs = ['newest', 'newer', 'older']
+        results = [future.result() for future in export.bounded_map(task, jobs, 3)]
+
+        self.assertEqual(completed[-1], 'newest')
+        self.assertEqual(results, jobs)
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = self.tmp_dir + '/export.csv'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resume(self):
+        checkpoint = export.Checkpoint('session', self.output)
+        self.assertFalse(checkpoint.exists())
+        checkpoint.save('1/2/3', ['1234567'], 42)
+        checkpoint.save('1/2/4', [], 84)
+        checkpoint.close()
+
+        resumed = export.Checkpoint('session', self.output)
+        resumed.load()
+        self.assertEqual(resumed.done, {'1/2/3', '1/2/4'})
+        self.assertEqual(resumed.seen, {'1234567'})
+        self.assertEqual(resumed.sink_state, 84)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from kp_scrapers.cli.commands import runner
+
+
+def _finish(job, settings, conn):
+    stats = {'finish_reason': 'finished', 'item_scraped_count': job.args['items']}
+    conn.send({'reason': 'finished', 'stats': stats})
+
+
+def _close(job, settings, conn):
+    conn.send({'reason': 'memusage_exceeded', 'stats': {'log_count/ERROR': 1}})
+
+
+def _crash(job, settings, conn):
+    os._exit(3)
+
+
+def _hang(job, settings, conn):
+    time.sleep(30)
+
+
+TARGETS = {'Finish': _finish, 'Close': _close, 'Crash': _crash, 'Hang': _hang}
+
+
+def _dispatch(job, settings, conn):
+    TARGETS[job.spider](job, settings, conn)
+
+
+def _job(spider, **args):
+    return runner.Job(spider, dict(args, items=args.get('items', 0)), {})
+
+
+class BatchRunnerTestCase(unittest.TestCase):
+    def _run(self, jobs, workers=2, **options):
+        options.setdefault('timeout', 10)
+        batch = runner.BatchRunner(jobs, workers, target=_dispatch, **options)
+        with patch.object(runner, 'POLL_INTERVAL', 0.05):
+            return batch.run(unknown={'Missing'})
+
+    def test_outcome_of_every_job_in_order(self):
+        jobs = [_job('Finish', items=3), _job('Close'), _job('Crash'), _job('Missing')]
+
+        results = self._run(jobs)
+
+        self.assertEqual(
+            [result['status'] for result in results], ['finished', 'failed', 'crashed', 'failed']
+        )
+        self.assertEqual(results[0]['items'], 3)
+        self.assertEqual(results[1]['reason'], 'memusage_exceeded')
+        self.assertEqual(results[1]['errors'], 1)
+        self.assertEqual(results[2]['exit_code'], 3)
+        self.assertEqual(results[3]['error'], 'unknown spider')
+        self.assertEqual(
+            runner.summarize(results), {'total': 4, 'finished': 1, 'failed': 2, 'crashed': 1}
+        )
+
+    def test_hung_job_is_killed_without_blocking_others(self):
+        started = time.time()
+
+        results = self._run([_job('Hang'), _job('Finish'), _job('Finish')], timeout=2, grace=1)
+
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(results[0]['status'], 'killed')
+        self.assertEqual(results[0]['reason'], 'timeout')
+        self.assertEqual([result['status'] for result in results[1:]], ['finished'] * 2)
+
+    def test_jobs_get_soft_limits_and_own_log_file(self):
+        batch = runner.BatchRunner([], 1, memory_mb=512, timeout=60, log_dir='logs')
+
+        settings = batch.job_settings(7, _job('Finish'))
+
+        self.assertEqual(settings['MEMUSAGE_LIMIT_MB'], 512)
+        self.assertEqual(settings['CLOSESPIDER_TIMEOUT'], 60)
+        self.assertEqual(settings['LOG_FILE'], os.path.join('logs', '007-Finish.log'))
+
+    def test_memory_of_running_process(self):
+        self.assertGreater(runner.rss_mb(os.getpid()) or 1, 0)
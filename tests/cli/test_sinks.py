@@ -0,0 +1,122 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from kp_scrapers.cli import sinks
+
+
+ROWS = [{'imo': '1234567', 'name': 'Vaiselle'}, {'imo': '2345678', 'name': 'Vessel'}]
+
+
+class SinksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _path(self, filename):
+        return os.path.join(self.tmp_dir, filename)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            sinks.open_sink(self._path('export.xlsx'))
+
+    def test_csv_resume_drops_uncommitted_rows(self):
+        sink = sinks.open_sink(self._path('export.csv'))
+        sink.write(ROWS[0])
+        offset = sink.commit()
+        # interrupted before the next commit
+        sink.write(ROWS[1])
+        sink.close(complete=False)
+
+        sink = sinks.open_sink(self._path('export.csv'), resume_from=offset)
+        sink.write(ROWS[1])
+        sink.close()
+
+        with open(self._path('export.csv')) as fd:
+            self.assertEqual(
+                fd.read().splitlines(), ['imo;name', '1234567;Vaiselle', '2345678;Vessel']
+            )
+
+    def test_csv_header_covers_keys_of_all_rows(self):
+        sink = sinks.open_sink(self._path('export.csv'))
+        sink.write(ROWS[0])
+        sink.write({'imo': '3456789', 'flag': 'FR'})
+        sink.commit()
+        sink.close()
+
+        self.assertFalse(os.path.exists(self._path('export.csv.staging.jl')))
+        with open(self._path('export.csv')) as fd:
+            self.assertEqual(
+                fd.read().splitlines(), ['imo;name;flag', '1234567;Vaiselle;', '3456789;;FR']
+            )
+
+    def test_jl(self):
+        sink = sinks.open_sink(self._path('export.jl'))
+        for row in ROWS:
+            sink.write(row)
+        sink.commit()
+        sink.close()
+
+        with open(self._path('export.jl')) as fd:
+            self.assertEqual([json.loads(line) for line in fd], ROWS)
+
+    def test_sqlite_adds_columns_and_rolls_back(self):
+        sink = sinks.open_sink(self._path('export.sqlite'))
+        sink.write(ROWS[0])
+        sink.write({'imo': '3456789', 'flag': {'code': 'FR'}})
+        state = sink.commit()
+        sink.write(ROWS[1])
+        sink.close(complete=False)
+
+        sink = sinks.open_sink(self._path('export.sqlite'), resume_from=state)
+        sink.close()
+
+        conn = sqlite3.connect(self._path('export.sqlite'))
+        rows = conn.execute('SELECT imo, name, flag FROM items ORDER BY imo').fetchall()
+        self.assertEqual(rows, [('1234567', 'Vaiselle', None), ('3456789', None, '{"code": "FR"}')])
+
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        sink = sinks.open_sink(self._path('export.parquet'))
+        for row in ROWS:
+            sink.write(row)
+        sink.commit()
+        sink.close()
+
+        self.assertFalse(os.path.exists(self._path('export.parquet.staging.jl')))
+        self.assertEqual(pq.read_table(self._path('export.parquet')).to_pylist(), ROWS)
+
+    def test_parquet_columns_cover_keys_of_all_rows(self):
+        import pyarrow.parquet as pq
+
+        sink = sinks.open_sink(self._path('export.parquet'))
+        sink.write(ROWS[0])
+        sink.write({'imo': '3456789', 'flag': 'FR'})
+        sink.commit()
+        sink.close()
+
+        self.assertEqual(
+            pq.read_table(self._path('export.parquet')).to_pylist(),
+            [
+                {'imo': '1234567', 'name': 'Vaiselle', 'flag': None},
+                {'imo': '3456789', 'name': None, 'flag': 'FR'},
+            ],
+        )
+
+    def test_columnar_keeps_staged_rows_when_interrupted(self):
+        sink = sinks.open_sink(self._path('export.feather'))
+        sink.write(ROWS[0])
+        sink.commit()
+        sink.close(complete=False)
+
+        self.assertFalse(os.path.exists(self._path('export.feather')))
+        self.assertTrue(os.path.exists(self._path('export.feather.staging.jl')))
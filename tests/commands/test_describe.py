@@ -0,0 +1,84 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from scrapy.settings import Settings
+
+from kp_scrapers.commands import describe
+from kp_scrapers.lib.spider_loader import LazySpiderLoader
+
+
+FAKE_SPIDER = '''
+from scrapy import Spider
+
+
+class FakeSpider(Spider):
+    name = 'Fake'
+    version = '1.0.0'
+    provider = 'Fake'
+    produces = ['PortCall']
+
+    @classmethod
+    def category(cls):
+        return 'port-authority'
+'''
+
+
+class DescribeManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.package = os.path.join(self.tmp_dir, 'fake_project', 'spiders')
+        os.makedirs(self.package)
+        open(os.path.join(self.tmp_dir, 'fake_project', '__init__.py'), 'w').close()
+        open(os.path.join(self.package, '__init__.py'), 'w').close()
+        with open(os.path.join(self.package, 'fake.py'), 'w') as fd:
+            fd.write(FAKE_SPIDER)
+
+        sys.path.insert(0, self.tmp_dir)
+        self.manifest_path = os.path.join(self.tmp_dir, 'manifest.json')
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir)
+        for module in [m for m in sys.modules if m.startswith('fake_project')]:
+            del sys.modules[module]
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fingerprint_changes_with_sources(self):
+        fingerprint = describe.sources_fingerprint(['fake_project.spiders'])
+        self.assertEqual(fingerprint, describe.sources_fingerprint(['fake_project.spiders']))
+
+        with open(os.path.join(self.package, 'fake.py'), 'a') as fd:
+            fd.write('\n# changed\n')
+        self.assertNotEqual(fingerprint, describe.sources_fingerprint(['fake_project.spiders']))
+
+    def test_fingerprint_does_not_import_spiders(self):
+        describe.sources_fingerprint(['fake_project.spiders'])
+        self.assertNotIn('fake_project.spiders.fake', sys.modules)
+
+    def test_manifest_roundtrip(self):
+        describe.save_manifest(self.manifest_path, 'abc', [{'name': 'Fake'}])
+
+        self.assertEqual(describe.load_manifest(self.manifest_path, 'abc'), [{'name': 'Fake'}])
+        self.assertIsNone(describe.load_manifest(self.manifest_path, 'outdated'))
+        self.assertIsNone(describe.load_manifest(self.manifest_path + '.missing', 'abc'))
+
+    def test_lazy_spider_loader(self):
+        loader = LazySpiderLoader(Settings({'SPIDER_MODULES': ['fake_project.spiders']}))
+        self.assertNotIn('fake_project.spiders.fake', sys.modules)
+
+        self.assertEqual(loader.list(), ['Fake'])
+        metas = describe.describe_spider(loader.load('Fake'))
+        self.assertEqual(metas['category'], 'port-authority')
+        self.assertEqual(metas['produces'], ['PortCall'])
+        self.assertTrue(metas['enabled'])
+
+    def test_match_filters(self):
+        metas = {'name': 'Fake', 'category': 'ais', 'produces': None, 'enabled': False}
+        self.assertTrue(describe.match_filters(metas, []))
+        self.assertTrue(describe.match_filters(metas, ['category:ais', 'enabled:false']))
+        self.assertFalse(describe.match_filters(metas, ['produces:PortCall']))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from scrapy import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from kp_scrapers.extensions.notify import NotifyMiddleware, SlackDispatcher
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """Slack incoming webhook stub, failing the first `failures` posts."""
+
+    failures = 0
+    received = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.received.append(payload)
+        status = 500 if len(self.received) <= self.failures else 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b'ok' if status == 200 else b'internal_error')
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeSpider(Spider):
+    name = 'FakeNotified'
+    job_name = '321353/1/42'
+
+
+class NotifyTestCase(TestCase):
+    def setUp(self):
+        _WebhookHandler.failures = 0
+        _WebhookHandler.received = []
+        self.server = HTTPServer(('127.0.0.1', 0), _WebhookHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.webhook_url = 'http://127.0.0.1:{}/hook'.format(self.server.server_port)
+
+        # deliver synchronously instead of in the reactor thread pool
+        patcher = patch('kp_scrapers.extensions.notify.deferToThread', defer.maybeDeferred)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _extension(self, **settings):
+        settings.update(NOTIFY_ENABLED=True, SLACK_WEBHOOK_URL=self.webhook_url)
+        crawler = get_crawler(_FakeSpider, settings)
+        spider = _FakeSpider.from_crawler(crawler)
+        return NotifyMiddleware.from_crawler(crawler), spider
+
+    def _fail(self, extension, spider, url, status=500):
+        extension.spider_error(
+            Failure(ValueError('oops')), Response(url, status=status), spider
+        )
+
+    def test_disabled_without_credentials(self):
+        crawler = get_crawler(_FakeSpider, {'NOTIFY_ENABLED': True})
+
+        with self.assertRaises(NotConfigured):
+            NotifyMiddleware.from_crawler(crawler)
+
+    def test_errors_are_summarised_in_one_message(self):
+        extension, spider = self._extension(NOTIFY_ERROR_URLS=True, NOTIFY_MAX_ERRORS=2)
+        for page in range(5):
+            self._fail(extension, spider, 'http://example.com/vessels/{}'.format(page))
+        self._fail(extension, spider, 'http://example.com/ports', status=404)
+        self._fail(extension, spider, 'http://example.com/berths', status=403)
+        spider.crawler.stats.set_value('log_count/ERROR', 7)
+
+        result = []
+        extension.spider_closed(spider).addCallback(result.append)
+
+        self.assertTrue(result[0]['ok'])
+        message, = _WebhookHandler.received
+        self.assertIn('failed', message['text'])
+        summary = message['attachments'][1]
+        self.assertEqual(summary['title'], '7 errors')
+        self.assertEqual(
+            summary['text'].splitlines(),
+            [
+                '5 × 500 ValueError example.com/vessels/{id}',
+                '1 × 404 ValueError example.com/ports',
+                '1 × other errors',
+            ],
+        )
+
+    def test_urls_are_not_disclosed_by_default(self):
+        extension, spider = self._extension()
+        self._fail(extension, spider, 'http://secret.example.com/data')
+
+        extension.spider_closed(spider)
+
+        summary = _WebhookHandler.received[0]['attachments'][1]
+        self.assertNotIn('secret', summary['text'])
+
+    def test_delivery_is_retried(self):
+        _WebhookHandler.failures = 1
+        dispatcher = SlackDispatcher(self.webhook_url, timeout=5, retries=1, backoff=0)
+
+        res = dispatcher._deliver('hello', [])
+
+        self.assertTrue(res['ok'])
+        self.assertEqual(len(_WebhookHandler.received), 2)
+
+    def test_delivery_gives_up_on_unreachable_slack(self):
+        self.server.shutdown()
+        self.server.server_close()
+        dispatcher = SlackDispatcher(self.webhook_url, timeout=1, retries=1, backoff=0)
+
+        with self.assertLogs('kp_scrapers.extensions.notify', 'ERROR'):
+            res = dispatcher._deliver('hello', [])
+
+        self.assertFalse(res['ok'])
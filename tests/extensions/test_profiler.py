@@ -0,0 +1,120 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import json
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+from schematics import Model
+from schematics.types import StringType
+from scrapy import Request, Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.extensions.profiler import Profiler
+from kp_scrapers.lib import profiling
+from kp_scrapers.models.utils import validate_item
+
+
+class _Vessel(Model):
+    name = StringType(required=True)
+
+
+@validate_item(_Vessel, normalize=True, strict=True)
+def _process_item(raw_item):
+    return raw_item
+
+
+class _FakeSpider(Spider):
+    name = 'FakeProfiled'
+
+    def parse(self, response):
+        yield _process_item({'name': 'Vaiselle'})
+        yield Request('http://example.com/next', callback=self.parse_next)
+
+    def parse_next(self, response):
+        return [_process_item({'name': 'Vessel'})]
+
+
+class _FakePipeline(object):
+    def process_item(self, item, spider):
+        return item
+
+
+class _FakeItemProcessor(object):
+    def __init__(self, pipeline):
+        self.methods = {'process_item': [pipeline.process_item]}
+
+
+class ProfilerTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def _extension(self, **settings):
+        settings.setdefault('PROFILE_ENABLED', True)
+        crawler = get_crawler(_FakeSpider, settings)
+        spider = _FakeSpider.from_crawler(crawler)
+        return Profiler.from_crawler(crawler), spider
+
+    def _crawl(self, extension, spider):
+        """Feed the spider two responses and its items to a pipeline."""
+        pipeline = _FakePipeline()
+        itemproc = _FakeItemProcessor(pipeline)
+        extension.crawler.engine = SimpleNamespace(scraper=SimpleNamespace(itemproc=itemproc))
+        extension.spider_opened(spider)
+
+        request = Request('http://example.com')
+        response = HtmlResponse(request.url, body=b'<html></html>', request=request)
+        extension.response_received(response, request, spider)
+        outputs = list(request.callback(response))
+        for item in outputs[:1]:
+            itemproc.methods['process_item'][0](item, spider)
+
+        next_request = outputs[1]
+        extension.response_received(response, next_request, spider)
+        # the same request can be seen twice, e.g. redirected
+        extension.response_received(response, next_request, spider)
+        next_request.callback(response)
+
+        extension.spider_closed(spider)
+        return itemproc, pipeline
+
+    def test_disabled_by_default(self):
+        with self.assertRaises(NotConfigured):
+            Profiler.from_crawler(get_crawler(_FakeSpider, {}))
+
+    def test_stages_in_stats(self):
+        extension, spider = self._extension()
+        self._crawl(extension, spider)
+
+        stats = extension.stats.get_stats()
+        self.assertEqual(stats['profile/callback/parse/count'], 1)
+        self.assertEqual(stats['profile/callback/parse_next/count'], 1)
+        self.assertEqual(stats['profile/validate_item/_Vessel/count'], 2)
+        self.assertEqual(stats['profile/pipeline/_FakePipeline/count'], 1)
+        self.assertGreaterEqual(stats['profile/callback/parse/p95_ms'], 0)
+        self.assertNotIn('profile/callback/parse/alloc_kb', stats)
+
+    def test_pipelines_restored_and_profiling_stopped(self):
+        extension, spider = self._extension()
+        itemproc, pipeline = self._crawl(extension, spider)
+
+        self.assertEqual(itemproc.methods['process_item'][0], pipeline.process_item)
+        self.assertIsNone(profiling.active())
+
+    def test_report_with_allocations(self):
+        output = os.path.join(self.root, 'profiles', '%(name)s.json')
+        extension, spider = self._extension(PROFILE_OUTPUT=output, PROFILE_TRACEMALLOC=True)
+        self._crawl(extension, spider)
+
+        with open(os.path.join(self.root, 'profiles', 'FakeProfiled.json')) as fd:
+            report = json.load(fd)
+        self.assertEqual(report['spider'], 'FakeProfiled')
+        self.assertEqual(report['stages']['callback/parse']['count'], 1)
+        self.assertTrue(report['top_allocations'])
+        self.assertIn('profile/callback/parse/alloc_kb', extension.stats.get_stats())
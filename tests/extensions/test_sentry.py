@@ -0,0 +1,103 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import logging
+from unittest import TestCase
+
+import sentry_sdk
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.extensions.sentry import MemoryTransport, SentryErrorTracker
+
+
+logger = logging.getLogger('kp_scrapers.spiders.fake')
+
+
+class _FakeSpider(Spider):
+    name = 'FakeTracked'
+
+
+def _raise(exc):
+    raise exc
+
+
+class SentryErrorTrackerTestCase(TestCase):
+    def _tracker(self, **settings):
+        settings.setdefault('SENTRY_DSN', 'https://key@sentry.example.com/1')
+        settings.setdefault('SENTRY_TRANSPORT', 'kp_scrapers.extensions.sentry.MemoryTransport')
+        crawler = get_crawler(_FakeSpider, settings_dict=settings)
+        self.spider = _FakeSpider()
+        tracker = SentryErrorTracker.from_crawler(crawler)
+        tracker.spider_opened(self.spider)
+        self.addCleanup(sentry_sdk.init)
+        return tracker
+
+    @property
+    def events(self):
+        transport = sentry_sdk.Hub.current.client.transport
+        self.assertIsInstance(transport, MemoryTransport)
+        sentry_sdk.flush()
+        return transport.events
+
+    def test_repeated_log_events_are_capped_per_fingerprint(self):
+        tracker = self._tracker(SENTRY_MAX_EVENTS_PER_FINGERPRINT=2)
+
+        for row in range(5):
+            logger.error('failed to parse row %s', row)
+        logger.error('no table found')
+
+        messages = [event['logentry']['message'] for event in self.events]
+        self.assertEqual(messages.count('failed to parse row %s'), 2)
+        self.assertIn('no table found', messages)
+        self.assertEqual(
+            self.events[0]['fingerprint'],
+            ['kp_scrapers.spiders.fake', 'failed to parse row %s', 'FakeTracked'],
+        )
+        self.assertEqual((tracker.governor.sent, tracker.governor.dropped), (3, 3))
+
+    def test_job_cap_and_sampling(self):
+        tracker = self._tracker(SENTRY_MAX_EVENTS=2, SENTRY_SAMPLE_RATE=0)
+
+        for message in ('first', 'first', 'second', 'third'):
+            logger.error(message)
+
+        # only first occurrences are sampled in, until the job cap
+        messages = [event['logentry']['message'] for event in self.events]
+        self.assertEqual(messages, ['first', 'second'])
+        self.assertEqual(tracker.governor.dropped, 2)
+
+    def test_exceptions_are_grouped_by_type_and_location(self):
+        tracker = self._tracker(SENTRY_MAX_EVENTS_PER_FINGERPRINT=1)
+
+        for value in ('a', 'b'):
+            try:
+                _raise(ValueError(value))
+            except ValueError:
+                sentry_sdk.capture_exception()
+
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0]['fingerprint'][0], 'ValueError')
+        self.assertEqual(tracker.governor.dropped, 1)
+
+    def test_summary_of_dropped_events_on_close(self):
+        tracker = self._tracker(SENTRY_MAX_EVENTS_PER_FINGERPRINT=1)
+        for _ in range(4):
+            logger.error('timeout on %s', 'http://example.com')
+
+        tracker.spider_closed(self.spider)
+
+        summary = self.events[-1]
+        self.assertEqual(summary['level'], 'warning')
+        self.assertIn('3 × kp_scrapers.spiders.fake | timeout on %s', summary['message'])
+        stats = tracker.stats
+        self.assertEqual(stats.get_value('sentry/events_sent'), 1)
+        self.assertEqual(stats.get_value('sentry/events_dropped'), 3)
+
+    def test_no_summary_without_dropped_events(self):
+        tracker = self._tracker()
+        logger.error('once')
+
+        tracker.spider_closed(self.spider)
+
+        self.assertEqual(len(self.events), 1)
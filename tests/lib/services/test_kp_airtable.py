@@ -0,0 +1,70 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import json
+import unittest
+
+from kp_scrapers.lib.services import kp_airtable
+from kp_scrapers.lib.utils import TokenBucket
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession(object):
+    def __init__(self, fail_on=()):
+        self.headers = {}
+        self.calls = []
+        self.fail_on = fail_on
+
+    def request(self, method, url, data):
+        records = json.loads(data)['records']
+        self.calls.append((method, url, records))
+        if len(self.calls) in self.fail_on:
+            return FakeResponse(422, {'error': {'type': 'INVALID_VALUE', 'message': 'nope'}})
+
+        return FakeResponse(
+            200, {'records': [dict(record, id=record.get('id', 'rec')) for record in records]}
+        )
+
+
+class AirtableWriterTestCase(unittest.TestCase):
+    def _writer(self, session):
+        return kp_airtable.AirtableWriter(
+            'Data Sourcing',
+            api_key='fake',
+            limiter=TokenBucket(rate=1000, sleep=lambda _: None),
+            session=session,
+        )
+
+    def test_create_in_batches(self):
+        session = FakeSession()
+        results = self._writer(session).create('Status', [{'Spider': i} for i in range(23)])
+
+        self.assertEqual([len(r.rows) for r in results], [10, 10, 3])
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(
+            [(method, url.rsplit('/', 1)[-1]) for method, url, _ in session.calls],
+            [('POST', 'Status')] * 3,
+        )
+        self.assertEqual(session.calls[0][2][0], {'fields': {'Spider': 0}})
+        self.assertEqual(session.headers['Authorization'], 'Bearer fake')
+
+    def test_update_reports_failed_batches(self):
+        session = FakeSession(fail_on=(1,))
+        rows = [({'Spider': i}, f'rec{i}') for i in range(12)]
+        results = self._writer(session).update('Status', rows)
+
+        self.assertEqual(len(results), 2)
+        self.assertIsInstance(results[0].error, kp_airtable.airtable.AirtableError)
+        self.assertEqual(results[0].records, [])
+        self.assertIsNone(results[1].error)
+        self.assertEqual(session.calls[1][0], 'PATCH')
+        self.assertEqual(session.calls[1][2][0], {'id': 'rec10', 'fields': {'Spider': 10}})
@@ -0,0 +1,138 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import datetime as dt
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import sqlalchemy as db
+
+from kp_scrapers.lib.services import kp_redshift
+from kp_scrapers.redshift_orm.loader_orm import CargoMovementStats, SpotCharterStats
+
+
+TABLES = [CargoMovementStats.__table__, SpotCharterStats.__table__]
+
+
+def _stats(job_id, datatype='portcall', **attributes):
+    return {
+        'warning_count': 1,
+        'error_count': 0,
+        'exception_count': 0,
+        'start_time': dt.datetime(2020, 1, 1, 10),
+        'finish_time': dt.datetime(2020, 1, 1, 11),
+        'total_items': 3,
+        'spider_attribute_stats': attributes or {'eta': 3, 'vessel.imo': 2},
+        'sh_spider_name': 'FakePort',
+        'sh_job_id': job_id,
+        'datatype': datatype,
+    }
+
+
+class MonitoringSinkTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.spill_path = os.path.join(self.tmp, 'spill.jsonl')
+
+    def _engine(self, path):
+        engine = db.create_engine('sqlite:///{}'.format(path))
+        schema = os.path.join(os.path.dirname(path), 'production.db')
+
+        # monitoring tables live in the `production` schema
+        @db.event.listens_for(engine, 'connect')
+        def attach(connection, record):
+            connection.execute("ATTACH DATABASE '{}' AS production".format(schema))
+
+        self.addCleanup(engine.dispose)
+        return engine
+
+    def _database(self):
+        engine = self._engine(os.path.join(self.tmp, 'monitoring.db'))
+        CargoMovementStats.metadata.create_all(engine, tables=TABLES)
+        return engine
+
+    def _rows(self, engine, table):
+        with engine.connect() as conn:
+            return conn.execute(db.select(table)).mappings().all()
+
+    def test_rows_are_mapped_to_the_table_of_the_datatype(self):
+        table, row = kp_redshift.to_row(_stats('1/2/3', datatype=['spotcharter'], charterer=4))
+
+        self.assertEqual(table, 'spot_charter_stats')
+        self.assertEqual(row['att_charterer_count'], 4)
+        self.assertEqual(row['datatype'], 'spotcharter')
+        self.assertIsNone(kp_redshift.to_row(_stats('1/2/3', datatype='vessel')))
+
+    def test_rows_are_inserted_in_bulk_once_buffer_is_full(self):
+        engine = self._database()
+        sink = kp_redshift.MonitoringSink(engine, self.spill_path, batch_size=2)
+
+        self.assertFalse(sink.add(_stats('1/2/3')))
+        self.assertFalse(sink.add(_stats('1/2/4', datatype='vessel')))
+        self.assertTrue(sink.add(_stats('1/2/5', datatype='spotcharter', charterer=1)))
+        self.assertEqual(sink.flush(), 2)
+
+        (movement,) = self._rows(engine, CargoMovementStats.__table__)
+        self.assertEqual(movement['sh_job_id'], '1/2/3')
+        self.assertEqual(movement['date_eta_count'], 3)
+        self.assertEqual(movement['total_item_count'], 3)
+        (charter,) = self._rows(engine, SpotCharterStats.__table__)
+        self.assertEqual(charter['att_charterer_count'], 1)
+
+    def test_rows_are_flushed_once_last_job_of_process_finishes(self):
+        sink = kp_redshift.MonitoringSink(self._database(), self.spill_path)
+        sink.started()
+        sink.started()
+        sink.started()
+
+        self.assertFalse(sink.finished(_stats('1/2/3')))
+        # uneventful runs are not buffered
+        self.assertFalse(sink.finished())
+        self.assertTrue(sink.finished(_stats('1/2/4')))
+        self.assertEqual(sink.flush(), 2)
+
+    def test_single_job_flushes_on_its_own(self):
+        sink = kp_redshift.MonitoringSink(self._database(), self.spill_path)
+        sink.started()
+
+        self.assertTrue(sink.finished(_stats('1/2/3')))
+
+    def test_rows_are_spilled_then_replayed(self):
+        unreachable = self._engine(os.path.join(self.tmp, 'missing', 'monitoring.db'))
+        sink = kp_redshift.MonitoringSink(unreachable, self.spill_path)
+        sink.add(_stats('1/2/3'))
+
+        self.assertEqual(sink.flush(), 0)
+        self.assertTrue(os.path.exists(self.spill_path))
+
+        # another process, once the database is back
+        engine = self._database()
+        sink = kp_redshift.MonitoringSink(engine, self.spill_path)
+        sink.add(_stats('1/2/4'))
+
+        self.assertEqual(sink.flush(), 2)
+        self.assertFalse(os.path.exists(self.spill_path))
+        rows = self._rows(engine, CargoMovementStats.__table__)
+        self.assertEqual(sorted(row['sh_job_id'] for row in rows), ['1/2/3', '1/2/4'])
+        self.assertIsInstance(rows[0]['sh_job_time'], dt.datetime)
+
+    def test_rejected_rows_do_not_block_later_uploads(self):
+        engine = self._database()
+        sink = kp_redshift.MonitoringSink(engine, self.spill_path)
+        sink.add(_stats('1/2/3'))
+        sink.flush()
+
+        sink.add(_stats('1/2/3'))
+        self.assertEqual(sink.flush(), 0)
+        sink.add(_stats('1/2/4'))
+
+        self.assertEqual(sink.flush(), 1)
+
+    def test_engines_are_shared(self):
+        url = 'sqlite:///{}'.format(os.path.join(self.tmp, 'shared.db'))
+        self.addCleanup(kp_redshift._engines.pop, url)
+
+        self.assertIs(kp_redshift.get_engine(url), kp_redshift.get_engine(url))
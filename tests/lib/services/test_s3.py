@@ -0,0 +1,82 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import gzip
+from io import BytesIO
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from kp_scrapers.lib.services import s3
+
+
+SETTINGS = {'AWS_ACCESS_KEY_ID': 'key', 'AWS_SECRET_ACCESS_KEY': 'secret'}
+
+
+def _body(data):
+    return StreamingBody(BytesIO(data), len(data))
+
+
+@patch('kp_scrapers.lib.services.s3.Settings', new=lambda: SETTINGS)
+class S3PoolTestCase(TestCase):
+    def setUp(self):
+        s3.reset()
+
+    def test_clients_are_shared_per_credentials_and_region(self):
+        self.assertIs(s3.client(), s3.client())
+        self.assertIsNot(s3.client(), s3.client(region_name='eu-west-1'))
+        self.assertIsNot(s3.client(), s3.client(config=dict(SETTINGS, AWS_ACCESS_KEY_ID='other')))
+
+    def test_resources_are_per_thread(self):
+        resources = []
+        thread = threading.Thread(target=lambda: resources.append(s3.resource()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(s3.resource(), s3.resource())
+        self.assertIsNot(s3.resource(), resources[0])
+
+
+class S3StreamingTestCase(TestCase):
+    def setUp(self):
+        s3.reset()
+        settings = patch('kp_scrapers.lib.services.s3.Settings', new=lambda: SETTINGS)
+        settings.start()
+        self.addCleanup(settings.stop)
+
+        self.stubber = Stubber(s3.client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def _expect(self, key, data, byte_range=None):
+        params = {'Bucket': 'bucket', 'Key': key}
+        if byte_range:
+            params['Range'] = byte_range
+        self.stubber.add_response('get_object', {'Body': _body(data)}, params)
+
+    def test_iter_lines(self):
+        self._expect('items.jl', b'{"a": 1}\n{"a": 2}\n')
+        self.assertEqual(list(s3.iter_lines('bucket', 'items.jl')), ['{"a": 1}', '{"a": 2}'])
+
+    def test_iter_lines_from_offset(self):
+        self._expect('items.jl', b'{"a": 2}\n', byte_range='bytes=9-')
+        self.assertEqual(list(s3.iter_lines('bucket', 'items.jl', start=9)), ['{"a": 2}'])
+
+    def test_iter_lines_uncompresses_gzip(self):
+        self._expect('items.jl.gz', gzip.compress(b'foo\nbar\n'))
+        self.assertEqual(list(s3.iter_lines('bucket', 'items.jl.gz')), ['foo', 'bar'])
+
+    def test_fetch_file_deserializes_gzip_lines(self):
+        self._expect('items.jl.gz', gzip.compress(b'{"a": 1}\n{"a": 2}\n'))
+        self.assertEqual(list(s3.fetch_file('bucket', 'items.jl.gz')), [{'a': 1}, {'a': 2}])
+
+    def test_fetch_file_is_seekable_unless_streamed(self):
+        self._expect('archive.zip', b'PK')
+        self._expect('archive.zip', b'PK')
+
+        self.assertEqual(next(s3.fetch_file('bucket', 'archive.zip')).seek(0), 0)
+        streamed = next(s3.fetch_file('bucket', 'archive.zip', stream=True))
+        self.assertIsInstance(streamed, StreamingBody)
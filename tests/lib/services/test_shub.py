@@ -0,0 +1,58 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import json
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from scrapy.settings import Settings
+
+from kp_scrapers.lib.services import shub
+
+
+class _FakeSpider(object):
+    custom_settings = {'DOWNLOAD_DELAY': '1'}
+    category_settings = {'DOWNLOAD_DELAY': '2', 'KP_DRIVE_ENABLED': False}
+    spider_settings = {'KP_DRIVE_ENABLED': 'True'}
+
+
+class GlobalSettingsTestCase(TestCase):
+    def setUp(self):
+        shub.refresh_settings()
+        self.addCleanup(shub.refresh_settings)
+
+        loader = patch.object(
+            shub, 'Settings', side_effect=lambda: Settings({'SLACK_CHANNEL': 'kp', 'RETRY': '3'})
+        )
+        self.loader = loader.start()
+        self.addCleanup(loader.stop)
+
+    def test_settings_are_resolved_once(self):
+        self.assertIs(shub.global_settings(), shub.global_settings())
+        self.assertEqual(self.loader.call_count, 1)
+
+    def test_settings_are_frozen(self):
+        with self.assertRaises(TypeError):
+            shub.global_settings().set('SLACK_CHANNEL', 'other')
+
+    @patch.dict(os.environ, {'SHUB_SETTINGS': '{}'})
+    def test_refresh_picks_up_environment(self):
+        self.assertEqual(shub.global_settings().get('SLACK_CHANNEL'), 'kp')
+
+        os.environ['SHUB_SETTINGS'] = json.dumps({'project_settings': {'SLACK_CHANNEL': 'shub'}})
+        self.assertEqual(shub.global_settings().get('SLACK_CHANNEL'), 'kp')
+        self.assertEqual(shub.global_settings(refresh=True).get('SLACK_CHANNEL'), 'shub')
+
+    def test_spider_settings_layer_spider_scopes(self):
+        settings = shub.spider_settings(_FakeSpider)
+
+        self.assertEqual(settings.getint('DOWNLOAD_DELAY'), 2)
+        self.assertTrue(settings.getbool('KP_DRIVE_ENABLED'))
+        self.assertEqual(settings.getint('RETRY'), 3)
+        self.assertIn('SLACK_CHANNEL', settings)
+        self.assertEqual(shub.global_settings().getint('DOWNLOAD_DELAY'), 0)
+
+    def test_spider_settings_accept_overrides(self):
+        self.assertEqual(shub.spider_settings({'RETRY': 5}).getint('RETRY'), 5)
+        self.assertEqual(self.loader.call_count, 1)
@@ -1,6 +1,7 @@
 from unittest import TestCase
 
 from scrapy.http import Request, Response
+from twisted.python.failure import Failure
 
 from kp_scrapers.lib.request import allow_inline_requests
 
@@ -28,10 +29,35 @@ class MockSpider:
     def parse_with_callback(self, response):
         yield Request('http://example/1', callback=self._noop)
 
+    @allow_inline_requests
+    def parse_batch(self, response):
+        pages = yield [Request('http://example/1'), Request('http://example/2')]
+        last = yield Request('http://example/3')
+        yield {'pages': pages + [last]}
+
+    @allow_inline_requests
+    def parse_empty_batch(self, response):
+        pages = yield []
+        yield {'pages': pages}
+
     def _noop(self, response):
         pass
 
 
+def _download(requests, order, fail=()):
+    """Complete pending requests in the given order, like a concurrent downloader would.
+    """
+    outputs = []
+    for index in order:
+        req = requests[index]
+        if req.url in fail:
+            result = req.errback(Failure(IOError('connection lost: ' + req.url)))
+        else:
+            result = req.callback(Response(req.url, request=req))
+        outputs.extend(result or [])
+    return outputs
+
+
 class InlineRequestsTestCase(TestCase):
     def test_inline_requests_without_callback(self):
         # given
@@ -59,3 +85,50 @@ class InlineRequestsTestCase(TestCase):
             str(context.exception),
             r'^Request contains callback <bound method MockSpider._noop of <(.+)>, not supported$',
         )
+
+    def test_batch_resumes_once_all_responses_completed(self):
+        # given
+        spider = MockSpider()
+        batch = list(spider.parse_batch(Response('http://example')))
+
+        # when
+        first = _download(batch, [1])
+        rest = _download(batch, [0])
+
+        # then
+        self.assertEqual([req.url for req in batch], ['http://example/1', 'http://example/2'])
+        self.assertEqual(first, [])
+        self.assertEqual([req.url for req in rest], ['http://example/3'])
+
+        # when
+        items = _download(rest, [0])
+
+        # then
+        self.assertEqual(
+            [resp.url for resp in items[0]['pages']],
+            ['http://example/1', 'http://example/2', 'http://example/3'],
+        )
+
+    def test_batch_returns_failures_in_place(self):
+        # given
+        spider = MockSpider()
+        batch = list(spider.parse_batch(Response('http://example')))
+
+        # when
+        rest = _download(batch, [0, 1], fail={'http://example/1'})
+        pages = _download(rest, [0])[0]['pages']
+
+        # then
+        self.assertIsInstance(pages[0], Failure)
+        self.assertEqual([resp.url for resp in pages[1:]], ['http://example/2', 'http://example/3'])
+        self.assertTrue(all(req.callback is None and req.errback is None for req in batch[1:]))
+
+    def test_empty_batch_resumes_right_away(self):
+        # given
+        spider = MockSpider()
+
+        # when
+        items = list(spider.parse_empty_batch(Response('http://example')))
+
+        # then
+        self.assertEqual(items, [{'pages': []}])
@@ -43,3 +43,39 @@ class UtilsTestCase(unittest.TestCase):
         # THEN
         sleep_mock.assert_called_once()
         self.assertEqual(res_list, test_list)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = utils.TokenBucket(rate=5, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_within_capacity_does_not_wait(self):
+        waits = [self.bucket.consume() for _ in range(5)]
+        self.assertEqual(sum(waits), 0)
+
+    def test_waits_instead_of_dropping(self):
+        calls = []
+
+        @self.bucket
+        def func(i):
+            calls.append(i)
+            return i
+
+        results = [func(i) for i in range(15)]
+
+        # every call went through, at the pace of the refill rate
+        self.assertEqual(results, list(range(15)))
+        self.assertEqual(calls, list(range(15)))
+        self.assertAlmostEqual(self.clock.now, 2.0)
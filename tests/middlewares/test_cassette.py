@@ -0,0 +1,102 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from scrapy import Request, Spider
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.middlewares.cassette import CassetteMiddleware
+
+
+class _FakeSpider(Spider):
+    name = 'FakeCassette'
+
+
+class CassetteMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def _middleware(self, mode):
+        crawler = get_crawler(
+            _FakeSpider, {'HISTORY_CASSETTE': mode, 'HISTORY_CASSETTE_DIR': self.root}
+        )
+        spider = _FakeSpider.from_crawler(crawler)
+        middleware = CassetteMiddleware.from_crawler(crawler)
+        middleware.spider_opened(spider)
+        return middleware, spider
+
+    def _record(self, *pairs):
+        middleware, spider = self._middleware('record')
+        for request, response in pairs:
+            self.assertIsNone(middleware.process_request(request, spider))
+            self.assertIs(middleware.process_response(request, response, spider), response)
+        middleware.spider_closed(spider)
+        return middleware.stats
+
+    def test_recorded_responses_are_replayed(self):
+        request = Request('http://example.com/page')
+        stats = self._record(
+            (
+                request,
+                HtmlResponse(
+                    'http://example.com/page',
+                    body=b'<p>hello</p>',
+                    headers={'Content-Type': 'text/html'},
+                ),
+            ),
+            (Request('http://example.com/data.xls'), Response('http://example.com/data.xls')),
+        )
+        self.assertEqual(stats.get_value('cassette/recorded'), 2)
+
+        middleware, spider = self._middleware('replay')
+        response = middleware.process_request(Request('http://example.com/page'), spider)
+
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual(response.css('p::text').get(), 'hello')
+        self.assertIn('historic', response.flags)
+        self.assertEqual(middleware.stats.get_value('cassette/hits'), 1)
+
+    def test_responses_are_stored_as_plain_data(self):
+        response = Response(
+            'http://example.com/moved',
+            status=203,
+            body=b'\x00binary',
+            headers={'Set-Cookie': ['a=1', 'b=2']},
+        )
+        self._record((Request('http://example.com/page'), response))
+
+        middleware, spider = self._middleware('replay')
+        replayed = middleware.process_request(Request('http://example.com/page'), spider)
+
+        self.assertEqual(replayed.url, 'http://example.com/moved')
+        self.assertEqual(replayed.status, 203)
+        self.assertEqual(replayed.body, b'\x00binary')
+        self.assertEqual(replayed.headers.getlist('Set-Cookie'), [b'a=1', b'b=2'])
+        db = sqlite3.connect(os.path.join(self.root, 'FakeCassette.cassette'))
+        self.addCleanup(db.close)
+        (headers,) = db.execute('SELECT headers FROM responses').fetchone()
+        self.assertEqual(json.loads(headers), {'Set-Cookie': ['a=1', 'b=2']})
+
+    def test_misses_never_reach_the_network(self):
+        self._record()
+        middleware, spider = self._middleware('replay')
+
+        with self.assertRaises(IgnoreRequest):
+            middleware.process_request(Request('http://example.com/unknown'), spider)
+        middleware.spider_closed(spider)
+
+        self.assertEqual(middleware.stats.get_value('cassette/misses'), 1)
+        self.assertEqual(middleware.misses, ['http://example.com/unknown'])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(NotConfigured):
+            self._middleware('rewind')
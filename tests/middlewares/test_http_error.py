@@ -0,0 +1,168 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from scrapy import Request, Spider
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.task import Clock
+
+from kp_scrapers.middlewares.http_error import (
+    _crawl,
+    _SpiderHTTPError,
+    DELAY_META,
+    HTTPErrorMiddleware,
+)
+
+
+class _FakeSpider(Spider):
+    name = 'FakeHTTPError'
+
+
+def _response(url, status, body=b'', headers=None, meta=None):
+    return Response(
+        url, status=status, body=body, headers=headers, request=Request(url, meta=meta or {})
+    )
+
+
+class HTTPErrorMiddlewareTestCase(TestCase):
+    def _middleware(self, **settings):
+        crawler = get_crawler(_FakeSpider, settings)
+        # requests scheduled by the engine, `crawl` has the signature of scrapy >= 2.10
+        self.crawled = []
+        crawler.engine = SimpleNamespace(close_spider=MagicMock(), crawl=self.crawled.append)
+        self.spider = _FakeSpider.from_crawler(crawler)
+        middleware = HTTPErrorMiddleware.from_crawler(crawler)
+        middleware.clock = Clock()
+        return middleware
+
+    def _retried(self, middleware, delay):
+        """Requests scheduled again by the engine once `delay` elapsed."""
+        middleware.clock.advance(delay)
+        return self.crawled
+
+    def _process(self, middleware, response):
+        """Run a response through the middleware like scrapy, return what reaches the spider."""
+        try:
+            middleware.process_spider_input(response, self.spider)
+        except _SpiderHTTPError as exception:
+            return middleware.process_spider_exception(response, exception, self.spider)
+        return response
+
+    def test_valid_responses_go_through(self):
+        middleware = self._middleware()
+        response = _response('http://example.com', 200)
+
+        self.assertIs(self._process(middleware, response), response)
+
+    def test_policies_by_host_and_status(self):
+        middleware = self._middleware(
+            HTTP_ERROR_POLICIES={'5xx': 'retry', 'static.example.com': 'continue'}
+        )
+
+        held = self._process(middleware, _response('http://api.example.com/a', 503))
+        tolerated = _response('http://static.example.com/b', 503)
+        dropped = self._process(middleware, _response('http://api.example.com/c', 404))
+
+        self.assertEqual(held, [])
+        retried = self._retried(middleware, 300)
+        self.assertEqual([request.url for request in retried], ['http://api.example.com/a'])
+        self.assertIs(self._process(middleware, tolerated), tolerated)
+        self.assertEqual(dropped, [])
+        self.assertEqual(middleware.stats.get_value('http_error/503'), 2)
+
+    def test_retry_honours_retry_after_then_gives_up(self):
+        middleware = self._middleware(
+            HTTP_ERROR_POLICIES={'429': 'retry'}, HTTP_ERROR_MAX_RETRIES=1
+        )
+
+        self._process(
+            middleware, _response('http://example.com', 429, headers={'Retry-After': '30'})
+        )
+        self.assertEqual(self._retried(middleware, 29), [])
+        retry, = self._retried(middleware, 1)
+        self.assertEqual(retry.meta[DELAY_META], 30)
+        self.assertTrue(retry.dont_filter)
+
+        again = _response('http://example.com', 429, meta=retry.meta)
+        self.assertEqual(self._process(middleware, again), [])
+        self.assertEqual(middleware.stats.get_value('http_error/retries_exhausted'), 1)
+
+    def test_retry_after_is_capped(self):
+        middleware = self._middleware(
+            HTTP_ERROR_POLICIES={'429': 'retry'}, HTTP_ERROR_BACKOFF_MAX=60
+        )
+
+        self._process(
+            middleware, _response('http://example.com', 429, headers={'Retry-After': '3600'})
+        )
+
+        retry, = self._retried(middleware, 60)
+        self.assertEqual(retry.meta[DELAY_META], 60)
+
+    def test_retries_of_requests_with_an_errback_are_held(self):
+        middleware = self._middleware(HTTP_ERROR_POLICIES={'503': 'retry'})
+        request = Request('http://example.com', errback=lambda failure: None)
+        response = Response(request.url, status=503, headers={'Retry-After': '5'}, request=request)
+
+        # scrapy hands the exception to the errback, `process_spider_exception` is skipped
+        with self.assertRaises(_SpiderHTTPError):
+            middleware.process_spider_input(response, self.spider)
+
+        retry, = self._retried(middleware, 5)
+        self.assertEqual(retry.url, 'http://example.com')
+        self.assertEqual(middleware.stats.get_value('http_error/retries'), 1)
+
+    def test_spider_is_kept_open_while_retries_are_held(self):
+        middleware = self._middleware(HTTP_ERROR_POLICIES={'429': 'retry'})
+        self._process(
+            middleware, _response('http://example.com', 429, headers={'Retry-After': '5'})
+        )
+
+        with self.assertRaises(DontCloseSpider):
+            middleware.spider_idle(self.spider)
+        self._retried(middleware, 5)
+        self.assertIsNone(middleware.spider_idle(self.spider))
+
+    def test_held_retries_are_dropped_on_close(self):
+        middleware = self._middleware(HTTP_ERROR_POLICIES={'429': 'retry'})
+        self._process(
+            middleware, _response('http://example.com', 429, headers={'Retry-After': '5'})
+        )
+
+        middleware.spider_closed(self.spider)
+
+        self.assertEqual(middleware.clock.getDelayedCalls(), [])
+        self.assertEqual(self._retried(middleware, 5), [])
+
+    def test_spider_closes_once_budget_exhausted(self):
+        middleware = self._middleware(HTTP_ERROR_BUDGET=1)
+
+        self._process(middleware, _response('http://example.com/1', 500))
+        middleware.crawler.engine.close_spider.assert_not_called()
+
+        self._process(middleware, _response('http://example.com/2', 500))
+        middleware.crawler.engine.close_spider.assert_called_once_with(self.spider, 'finished')
+
+    def test_logged_bodies_are_truncated_and_sampled(self):
+        middleware = self._middleware(HTTP_ERROR_BODY_LIMIT=10, HTTP_ERROR_BODY_SAMPLE_RATE=0)
+
+        with self.assertLogs('kp_scrapers.middlewares.http_error', 'ERROR') as logs:
+            for _ in range(2):
+                self._process(middleware, _response('http://example.com', 500, body=b'x' * 100))
+
+        bodies = [record.body for record in logs.records]
+        self.assertEqual(bodies, [b'xxxxxxxxxx... (100 bytes)', None])
+
+    def test_retries_are_scheduled_by_older_engines(self):
+        scheduled = []
+        engine = SimpleNamespace(crawl=lambda request, spider: scheduled.append((request, spider)))
+        request = Request('http://example.com')
+
+        _crawl(engine, request, 'spider')
+
+        self.assertEqual(scheduled, [(request, 'spider')])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from functools import partial
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.mixins.distribute import DivideAndConquerMixin
+from kp_scrapers.spiders.bases.persist_backends import LocalBackend
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
+
+
+UNIVERSE = [str(9000000 + index) for index in range(100)]
+
+
+class _FleetSpider(DivideAndConquerMixin, Spider):
+    name = 'FakeFleet'
+
+
+class DivideAndConquerTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        manager = partial(PersistDataManager, backend=LocalBackend(root))
+        for target in (
+            'kp_scrapers.spiders.bases.persist.PersistDataManager',
+            'kp_scrapers.mixins.distribute.PersistDataManager',
+        ):
+            patcher = patch(target, manager)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _job(self, **kwargs):
+        return _FleetSpider.from_crawler(get_crawler(_FleetSpider), **kwargs)
+
+    def _run(self, slice_size=30, reason='finished', **kwargs):
+        spider = self._job(**kwargs)
+        work = spider.divide_work(UNIVERSE, slice_size)
+        spider.complete_work(spider, reason)
+        return work
+
+    def test_consecutive_runs_cover_universe_then_start_over(self):
+        slices = [self._run() for _ in range(4)]
+
+        self.assertTrue(all(slices))
+        self.assertEqual(sorted(sum(slices, [])), UNIVERSE)
+        self.assertEqual(self._run(), slices[0])
+
+    def test_shards_are_disjoint(self):
+        shards = [self._run(slice_size=100, shard='{}/3'.format(index)) for index in range(3)]
+
+        self.assertTrue(all(shards))
+        self.assertEqual(sorted(sum(shards, [])), UNIVERSE)
+
+    def test_concurrent_jobs_claim_different_slices(self):
+        first, second = self._job(), self._job()
+
+        self.assertNotEqual(first.divide_work(UNIVERSE, 60), second.divide_work(UNIVERSE, 60))
+        self.assertEqual(self._job().divide_work(UNIVERSE, 60), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        crashed = self._job()
+        crashed.work_lease_ttl = -1
+        lost = crashed.divide_work(UNIVERSE, 60)
+
+        self.assertEqual(self._run(slice_size=60), lost)
+
+    def test_interrupted_run_releases_its_slice(self):
+        interrupted = self._run(reason='shutdown')
+
+        self.assertEqual(self._run(), interrupted)
+        self.assertNotEqual(self._run(), interrupted)
+
+    def test_progress_survives_restarts_and_universe_changes(self):
+        first = self._run()
+        self.assertNotEqual(self._run(), first)
+
+        spider = self._job()
+        changed = UNIVERSE[1:] + ['9999999']
+        work = spider.divide_work(changed, 30)
+        self.assertEqual(spider.crawler.stats.get_value('work/slices_done'), 2)
+        self.assertEqual(set(work) & set(first), set())
+
+    def test_failing_slice_is_given_up(self):
+        failing = [self._run(reason='shutdown') for _ in range(3)]
+        self.assertEqual(failing, [failing[0]] * 3)
+
+        spider = self._job()
+        with self.assertLogs('kp_scrapers.mixins.distribute', 'WARNING'):
+            self.assertNotEqual(spider.divide_work(UNIVERSE, 30), failing[0])
+        self.assertEqual(spider.crawler.stats.get_value('work/slices_done'), 1)
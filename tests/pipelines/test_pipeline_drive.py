@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, unicode_literals
+import os
+import shutil
+import tempfile
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
 from nose.tools import raises
 from scrapy.exceptions import NotConfigured
+from scrapy.exporters import CsvItemExporter
+from scrapy.statscollectors import StatsCollector
+from twisted.internet.defer import Deferred, maybeDeferred
 
+from kp_scrapers.pipelines.backends import drive as drive_backend
+from kp_scrapers.pipelines.backends.drive import DriveBackend, LocalSheetsService
 from kp_scrapers.pipelines.drive import DriveStorage
 
 
@@ -47,3 +56,171 @@ class DriveStorageTestCase(TestCase):
     @raises(NotConfigured)
     def test_empty_settings_are_invalid(self):
         DriveStorage(None)._validate_settings({})
+
+
+class _FlakySheetsService(LocalSheetsService):
+    """Fail the first `failures` appends."""
+
+    def __init__(self, failures):
+        super(_FlakySheetsService, self).__init__()
+        self.failures = failures
+
+    def append_sheet(self, file_id, rows, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('quota exceeded')
+        super(_FlakySheetsService, self).append_sheet(file_id, rows, **kwargs)
+
+
+class DriveBackendTestCase(TestCase):
+    def setUp(self):
+        drive_backend._SPIDER_DIRS.clear()
+        self.service = LocalSheetsService()
+        self.spider = _FakeSpider()
+
+    def _backend(self, **kwargs):
+        kwargs.setdefault('service', self.service)
+        return DriveBackend('root', self.spider, **kwargs)
+
+    def _export(self, backend, rows):
+        fd = backend.open(self.spider)
+        exporter = CsvItemExporter(fd)
+        exporter.start_exporting()
+        for row in rows:
+            exporter.export_item(row)
+        return fd, exporter
+
+    def test_spider_dir_is_resolved_once(self):
+        self._backend().open(self.spider)
+        self._backend().open(self.spider)
+        self.assertEqual(self.service.calls, ['list_children', 'create'])
+
+    def test_existing_spider_dir_is_reused(self):
+        existing = self.service.create(
+            'FakeSpider', DriveBackend.FOLDER_MIMETYPE, parents=['root']
+        )
+        backend = self._backend()
+        backend.open(self.spider)
+        self.assertEqual(backend.spider_dir, existing)
+
+    def test_rows_are_appended_in_batches(self):
+        backend = self._backend(batch_size=2)
+        fd, exporter = self._export(backend, [{'a': 1}, {'a': 2}])
+        self.assertTrue(backend.flush(fd))
+        # buffer is emptied and the exporter keeps writing to it
+        self.assertEqual(fd.getvalue(), b'')
+        exporter.export_item({'a': 3})
+        exporter.export_item({'a': 4})
+        exporter.finish_exporting()
+        sheet_id = backend.store(fd)
+
+        self.assertEqual(self.service.sheets[sheet_id], [['a'], ['1'], ['2'], ['3'], ['4']])
+        self.assertEqual(self.service.calls.count('create'), 2)
+        self.assertEqual(self.service.calls.count('append_sheet'), 3)
+        self.assertEqual(backend.rows_stored, 5)
+
+    def test_given_sheet_is_cleared_once(self):
+        self.service.sheets['given'] = [['stale']]
+        backend = self._backend()
+        fd, exporter = self._export(backend, [{'a': 1}])
+        backend.flush(fd, sheet_id='given')
+        exporter.export_item({'a': 2})
+        self.assertEqual(backend.store(fd, sheet_id='given'), 'given')
+        self.assertEqual(self.service.sheets['given'], [['a'], ['1'], ['2']])
+        self.assertEqual(self.service.calls.count('clear_sheet'), 1)
+
+    @patch('kp_scrapers.lib.utils.time.sleep')
+    def test_failed_batch_is_sent_with_next_flush(self, sleep):
+        self.service = _FlakySheetsService(failures=2)
+        backend = self._backend(tries=2)
+        fd, exporter = self._export(backend, [{'a': 1}])
+        self.assertFalse(backend.flush(fd))
+        exporter.export_item({'a': 2})
+        self.assertEqual(backend.store(fd), 'local-2')
+        self.assertEqual(self.service.sheets['local-2'], [['a'], ['1'], ['2']])
+        self.assertEqual(sleep.call_count, 1)
+
+    @patch('kp_scrapers.lib.utils.time.sleep')
+    def test_batch_retries_back_off(self, sleep):
+        self.service = _FlakySheetsService(failures=2)
+        backend = self._backend(tries=3)
+        fd, _ = self._export(backend, [{'a': 1}])
+        self.assertTrue(backend.flush(fd))
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2])
+
+    @patch('kp_scrapers.lib.utils.time.sleep')
+    def test_store_fails_loudly_when_rows_are_left(self, _):
+        self.service = _FlakySheetsService(failures=10)
+        backend = self._backend(tries=2)
+        fd, _ = self._export(backend, [{'a': 1}])
+        with self.assertRaises(RuntimeError):
+            backend.store(fd)
+
+    def test_no_sheet_without_items(self):
+        backend = self._backend()
+        fd, _ = self._export(backend, [])
+        self.assertIsNone(backend.store(fd))
+        self.assertEqual(self.service.sheets, {})
+
+
+class DriveStoragePipelineTestCase(TestCase):
+    def setUp(self):
+        drive_backend._SPIDER_DIRS.clear()
+        self.local_dir = tempfile.mkdtemp()
+        self.spider = _FakeSpider()
+        self.spider.settings = dict(
+            _drive_settings('True'), KP_DRIVE_LOCAL_DIR=self.local_dir, KP_DRIVE_BATCH_SIZE='2'
+        )
+        self.stats = StatsCollector(MagicMock())
+        # run batches in the test thread, the reactor is not running
+        patcher = patch('kp_scrapers.pipelines.drive.deferToThread', maybeDeferred)
+        self.to_thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.local_dir)
+
+    def _result(self, value):
+        """Result of a deferred that already fired, or the value itself."""
+        if not isinstance(value, Deferred):
+            return value
+        results = []
+        value.addBoth(results.append)
+        return results[0]
+
+    def test_items_are_streamed_during_the_crawl(self):
+        pipeline = DriveStorage(self.stats)
+        pipeline.spider_opened(self.spider)
+        for i in range(5):
+            pipeline.process_item({'a': i}, self.spider)
+        self.assertEqual(pipeline.storage.rows_stored, 5)
+
+        self._result(pipeline.spider_closed(self.spider))
+        self.assertTrue(self.spider.job_items_url.endswith('/local-2'))
+        with open(os.path.join(self.local_dir, 'local-2.csv')) as fd:
+            self.assertEqual(fd.read().split(), ['a', '0', '1', '2', '3', '4'])
+        self.assertEqual(self.stats.get_value('pipeline/drive/batches'), 2)
+        self.assertEqual(self.stats.get_value('pipeline/drive/rows_stored'), 6)
+        self.assertEqual(self.stats.get_value('pipeline/drive/items_stored'), 5)
+
+    def test_items_completing_a_batch_wait_for_it(self):
+        pipeline = DriveStorage(self.stats)
+        pipeline.spider_opened(self.spider)
+
+        first = pipeline.process_item({'a': 1}, self.spider)
+        second = pipeline.process_item({'a': 2}, self.spider)
+
+        self.assertEqual(first, {'a': 1})
+        self.assertIsInstance(second, Deferred)
+        self.assertEqual(self._result(second), {'a': 2})
+        self.assertEqual(pipeline.storage.rows_stored, 3)
+
+    def test_failed_batches_do_not_drop_items(self):
+        pipeline = DriveStorage(self.stats)
+        pipeline.spider_opened(self.spider)
+        pipeline.storage.drive.append_sheet = MagicMock(side_effect=IOError('quota exceeded'))
+        pipeline.storage._append = pipeline.storage.drive.append_sheet
+
+        pipeline.process_item({'a': 1}, self.spider)
+        self.assertEqual(self._result(pipeline.process_item({'a': 2}, self.spider)), {'a': 2})
+        self.assertEqual(self.stats.get_value('pipeline/drive/batches_failed'), 1)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import logging
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from scrapy import Spider
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.pipelines.fingerprint import (
+    FingerprintStore,
+    ItemFingerprint,
+    QuietLogFormatter,
+    UnchangedItem,
+)
+
+
+class _FakeSpider(Spider):
+    name = 'FakeLineUp'
+
+
+def _item(eta='2020-01-01', **extra):
+    item = {'vessel': {'name': 'Vaiselle'}, 'eta': eta, 'kp_uuid': str(time.time())}
+    item.update(extra)
+    return item
+
+
+class ItemFingerprintTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _run(self, items, reason='finished', **settings):
+        """Run the pipeline over items, return those emitted and the stats."""
+        settings = dict({'FINGERPRINT_ENABLED': True, 'FINGERPRINT_DIR': self.tmp}, **settings)
+        crawler = get_crawler(_FakeSpider, settings_dict=settings)
+        spider = _FakeSpider()
+        pipeline = ItemFingerprint.from_crawler(crawler)
+        crawler.stats.open_spider(spider)
+
+        pipeline.spider_opened(spider)
+        emitted = []
+        for item in items:
+            try:
+                emitted.append(pipeline.process_item(item, spider))
+            except DropItem:
+                pass
+        pipeline.spider_closed(spider, reason)
+        return emitted, crawler.stats.get_stats()
+
+    def test_disabled_by_default(self):
+        with self.assertRaises(NotConfigured):
+            ItemFingerprint.from_crawler(get_crawler(_FakeSpider))
+
+    def test_unchanged_items_are_dropped_on_next_run(self):
+        self._run([_item(), _item('2020-01-02')])
+
+        emitted, stats = self._run([_item(), _item('2020-01-03')])
+
+        self.assertEqual([item['eta'] for item in emitted], ['2020-01-03'])
+        self.assertEqual(stats['pipeline/fingerprint/hits'], 1)
+        self.assertEqual(stats['pipeline/fingerprint/hit_ratio'], 0.5)
+        self.assertEqual(stats['pipeline/fingerprint/stored'], 3)
+
+    def test_repeated_items_of_a_run_are_dropped(self):
+        emitted, _ = self._run([_item(), _item()])
+
+        self.assertEqual(len(emitted), 1)
+
+    def test_unchanged_items_are_tagged(self):
+        self._run([_item()])
+
+        emitted, _ = self._run([_item(), _item('2020-01-02')], FINGERPRINT_MODE='tag')
+
+        self.assertEqual([item.get('kp_unchanged') for item in emitted], [True, None])
+
+    def test_force_emits_every_item(self):
+        self._run([_item()])
+
+        emitted, stats = self._run([_item()], FINGERPRINT_FORCE=True)
+
+        self.assertEqual(len(emitted), 1)
+        self.assertEqual(stats['pipeline/fingerprint/hits'], 1)
+
+    def test_ignored_fields(self):
+        ignore = {'FINGERPRINT_IGNORE_FIELDS': 'reported_date'}
+        self._run([_item(reported_date='2020-01-01')], **ignore)
+
+        emitted, _ = self._run([_item(reported_date='2020-01-02')], **ignore)
+
+        self.assertEqual(emitted, [])
+
+    def test_failed_runs_are_not_recorded(self):
+        self._run([_item()], reason='shutdown')
+
+        emitted, _ = self._run([_item()])
+
+        self.assertEqual(len(emitted), 1)
+
+    def test_old_fingerprints_are_pruned(self):
+        store = FingerprintStore(os.path.join(self.tmp, 'FakeLineUp.sqlite'))
+        store.record(['old', 'recent'], time.time() - 10 * 24 * 3600)
+        store.record(['recent'], time.time())
+        store.close()
+
+        _, stats = self._run([], FINGERPRINT_TTL_DAYS=5)
+
+        self.assertEqual(stats['pipeline/fingerprint/pruned'], 1)
+        self.assertEqual(stats['pipeline/fingerprint/stored'], 1)
+
+    def test_unchanged_items_are_logged_at_debug_level(self):
+        spider = _FakeSpider.from_crawler(get_crawler(_FakeSpider))
+        formatter = QuietLogFormatter()
+
+        unchanged = formatter.dropped({}, UnchangedItem('unchanged'), None, spider)
+        dropped = formatter.dropped({}, DropItem('invalid'), None, spider)
+
+        self.assertEqual(unchanged['level'], logging.DEBUG)
+        self.assertEqual(dropped['level'], logging.WARNING)
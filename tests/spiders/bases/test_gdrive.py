@@ -0,0 +1,142 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import StatsCollector
+from twisted.internet.defer import Deferred, maybeDeferred
+
+from kp_scrapers.lib.services.gdrive import FolderCache, GDriveService
+from kp_scrapers.spiders.bases.gdrive import GDriveSpider
+
+
+class _State(dict):
+    def save(self):
+        self.saved = dict(self)
+
+
+class _FakeService(GDriveService):
+    """Drive service serving files from memory, without credentials."""
+
+    def __init__(self, files):
+        self.files = files
+        self.queries = []
+        self.lookups = 0
+        self.tagged = []
+        self._local = threading.local()
+        self.credentials = MagicMock()
+
+    def list_children(self, folder_id, type_=None, name=None, mimes=None, query=None):
+        if type_ == 'GDriveFolder':
+            self.lookups += 1
+            return [{'id': '{}/{}'.format(folder_id, name)}]
+        self.queries.append(query)
+        return list(self.files)
+
+    def fetch_file_content(self, item, http=None):
+        return item['content']
+
+    def tag_file(self, file_id, tags):
+        self.tagged.append(file_id)
+
+
+class _FakeGDriveSpider(GDriveSpider):
+    name = 'FakeGDrive'
+    mime_types = ['text/plain']
+
+    def parse_file_content(self, file_content):
+        yield {'content': file_content}
+
+
+def _file(id_, modified):
+    return {'id': id_, 'content': id_.encode() * 10, 'modifiedTime': modified}
+
+
+@patch('kp_scrapers.spiders.bases.gdrive.validate_settings', new=MagicMock())
+@patch('kp_scrapers.spiders.bases.gdrive.Settings', new=lambda: {'GOOGLE_DRIVE_BASE_FOLDER_ID': 0})
+class GDriveSpiderTestCase(TestCase):
+    def setUp(self):
+        self.state = _State()
+        # run Drive calls in the test thread, the reactor is not running
+        patcher = patch('kp_scrapers.spiders.bases.gdrive.deferToThread', maybeDeferred)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _spider(self, files, **kwargs):
+        with patch('kp_scrapers.spiders.bases.gdrive.GDriveService'), patch(
+            'kp_scrapers.spiders.bases.gdrive.PersistDataManager', return_value=self.state
+        ):
+            spider = _FakeGDriveSpider(path='a/b', **kwargs)
+        spider.service = _FakeService(files)
+        spider.settings = Settings({'GDRIVE_DOWNLOAD_WORKERS': 2})
+        spider.crawler = MagicMock(stats=StatsCollector(MagicMock()))
+        return spider
+
+    def _parse(self, spider):
+        """Items of the deferred returned by the callback."""
+        parsing = spider.parse(None)
+        self.assertIsInstance(parsing, Deferred)
+        results = []
+        parsing.addBoth(results.append)
+        return results[0]
+
+    def test_files_are_parsed_and_tagged(self):
+        files = [_file(str(i), '2020-01-0{}T00:00:00.000Z'.format(i)) for i in range(1, 6)]
+        spider = self._spider(files)
+        items = self._parse(spider)
+
+        self.assertEqual(sorted(item['content'] for item in items), [f['content'] for f in files])
+        self.assertEqual(sorted(spider.service.tagged), ['1', '2', '3', '4', '5'])
+        stats = spider.crawler.stats
+        self.assertEqual(stats.get_value('gdrive/files'), 5)
+        self.assertEqual(stats.get_value('gdrive/bytes'), 50)
+        self.assertGreater(stats.get_value('gdrive/bytes_per_second'), 0)
+        self.assertEqual(self.state.saved['last_modified'], '2020-01-05T00:00:00.000Z')
+
+    def test_next_run_reuses_folder_and_skips_old_files(self):
+        self._parse(self._spider([_file('1', '2020-01-05T00:00:00.000Z')]))
+
+        spider = self._spider([])
+        self._parse(spider)
+        self.assertEqual(spider.service.lookups, 0)
+        self.assertIn('modifiedTime > "2020-01-04T00:00:00.000000Z"', spider.service.queries[0])
+
+    def test_forced_run_ignores_last_modified(self):
+        self.state['last_modified'] = '2020-01-05T00:00:00.000Z'
+        spider = self._spider([], force='true')
+        self._parse(spider)
+        self.assertNotIn('modifiedTime', spider.service.queries[0])
+
+
+class FolderCacheTestCase(TestCase):
+    def test_entries_are_keyed_by_root(self):
+        cache = FolderCache({}, ttl=60)
+        cache.set('root', 'a', 'id-a')
+        self.assertEqual(cache.get('root', 'a'), 'id-a')
+        self.assertIsNone(cache.get('other', 'a'))
+
+
+class FetchFilesTestCase(TestCase):
+    def test_downloads_are_bounded(self):
+        service = _FakeService([])
+        in_flight, peak, lock = [0], [0], threading.Lock()
+
+        def fetch(item, http=None):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return item['content']
+
+        service.fetch_file_content = fetch
+        files = [_file(str(i), '') for i in range(20)]
+        fetched = dict((gfile['id'], body) for gfile, body in service.fetch_files(files, 3))
+
+        self.assertEqual(len(fetched), 20)
+        self.assertLessEqual(peak[0], 3)
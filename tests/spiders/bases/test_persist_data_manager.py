@@ -0,0 +1,127 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import gzip
+from io import BytesIO
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from kp_scrapers.lib.services import s3
+from kp_scrapers.spiders.bases.persist_backends import LocalBackend, S3Backend
+from kp_scrapers.spiders.bases.persist_data_manager import PersistDataManager
+
+
+SETTINGS = {'AWS_ACCESS_KEY_ID': 'key', 'AWS_SECRET_ACCESS_KEY': 'secret'}
+
+
+class PersistDataManagerTestCase(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.backend = LocalBackend(self.root)
+
+    def _manager(self, **kwargs):
+        kwargs.setdefault('compression', 'gzip')
+        return PersistDataManager('FakeSpider', backend=self.backend, **kwargs)
+
+    def test_save_compressed_and_reload(self):
+        state = self._manager()
+        state['cursor'] = 42
+        state.save()
+
+        self.assertEqual(os.listdir(self.root), ['FakeSpider.json.gz'])
+        with gzip.open(os.path.join(self.root, 'FakeSpider.json.gz')) as fd:
+            self.assertEqual(json.load(fd), {'cursor': 42})
+        self.assertEqual(self._manager(), {'cursor': 42})
+
+    def test_migrate_legacy_json_state(self):
+        with open(os.path.join(self.root, 'FakeSpider.json'), 'w') as fd:
+            json.dump({'spider_exec': '2020-01-01 00:00:00'}, fd)
+
+        state = self._manager()
+        self.assertEqual(state['spider_exec'], '2020-01-01 00:00:00')
+        state.save()
+
+        self.assertEqual(os.listdir(self.root), ['FakeSpider.json.gz'])
+
+    def test_failed_write_keeps_previous_state(self):
+        state = self._manager()
+        state['cursor'] = 1
+        state.save()
+
+        state['cursor'] = 2
+        with patch('os.fsync', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                state.save()
+
+        self.assertEqual(self._manager(), {'cursor': 1})
+        # no temporary file left behind
+        self.assertEqual(os.listdir(self.root), ['FakeSpider.json.gz'])
+
+    def test_prune_expired_keys(self):
+        state = self._manager(ttl_days=1)
+        state.update(old=1, spider_exec='2020-01-01 00:00:00')
+        state['recent'] = 2
+        state._touched['old'] -= 2 * 86400
+        state._touched['spider_exec'] -= 2 * 86400
+        state.save()
+
+        reloaded = self._manager(ttl_days=1)
+        self.assertEqual(reloaded, {'recent': 2, 'spider_exec': '2020-01-01 00:00:00'})
+        self.assertLess(reloaded._touched['recent'], time.time() + 1)
+
+    def test_clean_file(self):
+        state = self._manager()
+        state['cursor'] = 1
+        state.save()
+
+        state.clean_file()
+
+        self.assertEqual(state, {})
+        self.assertEqual(os.listdir(self.root), [])
+
+
+class S3BackendTestCase(TestCase):
+    def setUp(self):
+        s3.reset()
+        settings = patch('kp_scrapers.lib.services.s3.Settings', new=lambda: SETTINGS)
+        settings.start()
+        self.addCleanup(settings.stop)
+
+        self.stubber = Stubber(s3.client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def test_missing_state(self):
+        self.stubber.add_client_error(
+            'get_object',
+            service_error_code='NoSuchKey',
+            expected_params={'Bucket': 'bucket', 'Key': 'state/FakeSpider.json.gz'},
+        )
+
+        self.assertIsNone(S3Backend('bucket', 'state/').read('FakeSpider.json.gz'))
+
+    def test_read_and_write(self):
+        data = gzip.compress(b'{"cursor":1}')
+        self.stubber.add_response(
+            'put_object', {}, {'Bucket': 'bucket', 'Key': 'FakeSpider.json.gz', 'Body': data}
+        )
+        self.stubber.add_response(
+            'get_object',
+            {'Body': StreamingBody(BytesIO(data), len(data))},
+            {'Bucket': 'bucket', 'Key': 'FakeSpider.json.gz'},
+        )
+
+        backend = S3Backend('bucket')
+        backend.write('FakeSpider.json.gz', data)
+
+        self.assertEqual(backend.read('FakeSpider.json.gz'), data)
+        self.stubber.assert_no_pending_responses()
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import, unicode_literals
+import io
+import json
+import time
 import unittest
+from unittest.mock import patch
+
+from scrapy import Request
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
 
 from kp_scrapers.spiders.contracts import bill_of_lading
+from kp_scrapers.spiders.contracts.bill_of_lading import spider
 
 
 class BOLUtilsTestCase(unittest.TestCase):
@@ -24,3 +33,73 @@ class BOLSpiderTestCase(unittest.TestCase):
         dd_tags = self.spider.category_settings.get('DATADOG_CUSTOM_TAGS')
         self.assertTrue('category:contract' in dd_tags)
         self.assertEqual(self.spider.category(), 'contract')
+
+
+class BOLCsvTestCase(unittest.TestCase):
+    def test_iter_csv_rows_maps_header_once(self):
+        body = io.BytesIO(b'number,Vessel Name\r\n1,ATLANTIC\r\n\r\n2,"PACIFIC, II"\r\n')
+        rows = list(spider.iter_csv_rows(body, provider_name='BillOfLading'))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            rows[0], {'NUMBER': '1', 'VESSEL NAME': 'ATLANTIC', 'provider_name': 'BillOfLading'}
+        )
+        self.assertEqual(rows[1]['VESSEL NAME'], 'PACIFIC, II')
+
+    def test_iter_csv_rows_empty_export(self):
+        self.assertEqual(list(spider.iter_csv_rows(io.BytesIO(b''))), [])
+
+
+class BOLStatusPollingTestCase(unittest.TestCase):
+    def setUp(self):
+        crawler = get_crawler(spider.ImportGeniusBolSpider)
+        crawler.stats.open_spider(None)
+        self.spider = spider.ImportGeniusBolSpider.from_crawler(
+            crawler, user='user', password='secret'
+        )
+        self.spider.sid, self.spider.pid = 'sid', 'pid'
+        self.spider.status_deadline = time.time() + spider.STATUS_POLL_DEADLINE
+
+        patcher = patch.object(spider, 'deferLater')
+        self.defer_later = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _status(self, percent, attempt):
+        request = Request('https://example.com/status', meta={'attempt': attempt})
+        body = json.dumps({'percent': percent})
+        return TextResponse(request.url, body=body, encoding='utf-8', request=request)
+
+    def _scheduled(self):
+        """Delay and requests of the poll scheduled on the reactor."""
+        _, delay, poll = self.defer_later.call_args[0]
+        return delay, poll()
+
+    def test_csv_is_downloaded_once_ready(self):
+        (request,) = self.spider.on_status_result(self._status('100', 3))
+
+        self.assertIs(request.callback.__func__, spider.ImportGeniusBolSpider.parse_csv)
+        self.assertEqual(request.meta['download_maxsize'], spider.CSV_MAXSIZE)
+        self.defer_later.assert_not_called()
+
+    def test_status_is_polled_again_without_blocking(self):
+        result = self.spider.on_status_result(self._status('40', 3))
+
+        self.assertIs(result, self.defer_later.return_value)
+        delay, (request,) = self._scheduled()
+        self.assertEqual(delay, 16)
+        self.assertEqual(request.meta['attempt'], 4)
+        self.assertTrue(request.dont_filter)
+        self.assertEqual(self.spider.crawler.stats.get_value('bol/status_polls'), 1)
+
+    def test_backoff_is_capped(self):
+        self.spider.on_status_result(self._status('40', 10))
+
+        delay, _ = self._scheduled()
+        self.assertEqual(delay, spider.STATUS_POLL_MAX_DELAY)
+
+    def test_polling_stops_at_deadline(self):
+        self.spider.status_deadline = time.time() + 10
+
+        with self.assertLogs(self.spider.logger.logger, 'ERROR'):
+            self.assertEqual(self.spider.on_status_result(self._status('40', 3)), [])
+        self.defer_later.assert_not_called()
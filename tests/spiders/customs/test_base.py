@@ -0,0 +1,66 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from unittest import TestCase
+
+from kp_scrapers.spiders.customs.base import CustomsBaseSpider, ProductCodeIndex
+
+
+class FakeCustomsSpider(CustomsBaseSpider):
+    name = 'FakeCustoms'
+
+    def commodity_mapping(self):
+        return {
+            'lng': {'271111': None},
+            'lpg': {'271112': 'propane', '271113': 'butane', '2711': 'lpg'},
+            'oil': {'270900': None},
+        }
+
+
+class ProductCodeIndexTestCase(TestCase):
+    def test_longest_code_wins(self):
+        index = ProductCodeIndex(['2711', '271112'])
+        self.assertEqual(index.match('271112000'), '271112')
+        self.assertEqual(index.match('271119000'), '2711')
+
+    def test_leftmost_code_wins(self):
+        index = ProductCodeIndex(['2709', '2711'])
+        self.assertEqual(index.match('2711 / 2709'), '2711')
+
+    def test_no_match(self):
+        self.assertIsNone(ProductCodeIndex(['2711']).match('27 11'))
+        self.assertIsNone(ProductCodeIndex([]).match('2711'))
+
+
+class CustomsBaseSpiderTestCase(TestCase):
+    def test_products_are_computed_once(self):
+        spider = FakeCustomsSpider(commodity='lng lpg')
+        self.assertIs(spider.products, spider.products)
+        self.assertEqual(
+            spider.products,
+            {
+                '271111': {None: ['lng']},
+                '271112': {'propane': ['lpg']},
+                '271113': {'butane': ['lpg']},
+                '2711': {'lpg': ['lpg']},
+            },
+        )
+
+    def test_get_product(self):
+        spider = FakeCustomsSpider(commodity='lng lpg')
+        self.assertEqual(spider.get_product('HS271113 Butane'), '271113')
+        self.assertEqual(spider.get_product('HS271119 Other'), '2711')
+        self.assertIsNone(spider.get_product('HS270900 Crude'))
+
+    def test_get_subcommodities(self):
+        spider = FakeCustomsSpider(commodity='lpg')
+        self.assertEqual(spider.get_subcommodities('271112'), {'propane': 'lpg'})
+
+        # returned mapping is a copy of the cached one
+        spider.get_subcommodities('271112')['butane'] = 'lpg'
+        self.assertEqual(spider.get_subcommodities('271112'), {'propane': 'lpg'})
+
+    def test_get_subcommodities_unknown_product(self):
+        spider = FakeCustomsSpider(commodity='lng')
+        with self.assertRaises(KeyError):
+            spider.get_subcommodities('270900')
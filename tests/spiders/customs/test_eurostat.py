@@ -0,0 +1,132 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import requests
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.spiders.customs.eurostat import EurostatCustomsSpider
+from tests._helpers.mocks import fixtures_path
+
+
+with open(fixtures_path('customs', 'eurostat.html'), 'rb') as fd:
+    PAGE = fd.read()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """Serve the Eurostat fixture, honouring `If-None-Match` when etags are on."""
+
+    etag = '"v1"'
+    requests_count = 0
+
+    def do_POST(self):
+        type(self).requests_count += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.etag and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        # session details change on every page, data doesn't
+        body = PAGE.replace(b'SESSION_ID', str(self.requests_count).encode())
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Date(date):
+    @classmethod
+    def today(cls):
+        # bookmarks only cover 2014-2016
+        return date(2016, 3, 15)
+
+
+class _State(dict):
+    def save(self):
+        pass
+
+
+class EurostatIncrementalTestCase(TestCase):
+    def setUp(self):
+        _FixtureHandler.etag = '"v1"'
+        self.server = HTTPServer(('127.0.0.1', 0), _FixtureHandler)
+        self.url = 'http://127.0.0.1:{}/nui/show.do'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.state = _State()
+        for target, value in (
+            ('kp_scrapers.spiders.customs.eurostat.date', _Date),
+            ('kp_scrapers.spiders.customs.base.PersistDataManager', lambda *_: self.state),
+        ):
+            patcher = patch(target, new=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fetch(self, request):
+        request = request.replace(url=self.url)
+        headers = {k.decode(): v[0].decode() for k, v in request.headers.items()}
+        res = requests.post(request.url, data=request.body, headers=headers)
+        return HtmlResponse(
+            url=request.url,
+            status=res.status_code,
+            headers=dict(res.headers),
+            body=res.content,
+            request=request,
+        )
+
+    def _crawl(self, **kwargs):
+        crawler = get_crawler(EurostatCustomsSpider)
+        spider = EurostatCustomsSpider.from_crawler(
+            crawler, commodity='lng', months_look_back='2', **kwargs
+        )
+        items = []
+        for request in spider.post(None):
+            items.extend(spider.parse_values(self._fetch(request)))
+        spider.save_datasets(spider)
+        return spider, items
+
+    def test_first_run_parses_everything(self):
+        spider, items = self._crawl()
+        # current month plus 2 before, 2 flows, 3 non-empty reporter/partner pairs each
+        self.assertEqual(len(items), 18)
+        self.assertEqual(len(self.state), 6)
+        self.assertEqual(spider.crawler.stats.get_value('customs/datasets/changed'), 6)
+        self.assertEqual(spider.crawler.stats.get_value('customs/datasets/hit_rate'), 0)
+
+        item = next(i for i in items if i['source_country'] == 'QATAR')
+        self.assertEqual(item['country_name'], 'FRANCE')
+        self.assertEqual((item['raw_price'], item['raw_weight']), ('1200', '3400'))
+
+    def test_unmodified_datasets_are_skipped(self):
+        self._crawl()
+        spider, items = self._crawl()
+        self.assertEqual(items, [])
+        self.assertEqual(spider.crawler.stats.get_value('customs/datasets/hit_rate'), 1)
+
+    def test_unchanged_data_is_skipped_without_etags(self):
+        _FixtureHandler.etag = None
+        self._crawl()
+        spider, items = self._crawl()
+        self.assertEqual(items, [])
+        self.assertEqual(spider.crawler.stats.get_value('customs/datasets/unchanged'), 6)
+
+    def test_forced_run_parses_everything(self):
+        self._crawl()
+        _, items = self._crawl(force='true')
+        self.assertEqual(len(items), 18)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+from unittest import TestCase
+from unittest.mock import patch
+
+from scrapy.exceptions import CloseSpider
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.spiders.registries.equasis import login
+from kp_scrapers.spiders.registries.equasis.spider import EquasisSpider
+
+
+USERS = [{'login': 'user-{}'.format(index), 'password': 'secret'} for index in range(4)]
+
+BLOCKED_PAGE = b'<div id="warning"><p>Your account has been blocked</p></div>'
+
+
+class _FakeState(dict):
+    saves = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+
+    def save(self):
+        self.saves += 1
+
+
+def _page(request, body=b'<html></html>'):
+    return HtmlResponse(request.url, body=body, request=request)
+
+
+class EquasisSessionsTestCase(TestCase):
+    def setUp(self):
+        for target, value in (
+            ('kp_scrapers.spiders.bases.persist.PersistDataManager', _FakeState),
+            ('kp_scrapers.spiders.registries.equasis.constants.DEV_USERS', USERS),
+            # a stub for the parser, pages are empty
+            (
+                'kp_scrapers.spiders.registries.equasis.parser.parse_vessel_details',
+                lambda selector, **kwargs: {'url': selector.url},
+            ),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _spider(self, **kwargs):
+        kwargs.setdefault('test', 1)
+        crawler = get_crawler(EquasisSpider)
+        return EquasisSpider.from_crawler(crawler, **kwargs)
+
+    def _login(self, request):
+        """Answer a login request, return the first vessel request."""
+        return request.callback(_page(request))
+
+    def _parse(self, request, body=b'<html></html>'):
+        output = list(request.callback(_page(request, body)))
+        items = [each for each in output if isinstance(each, dict)]
+        requests = [each for each in output if isinstance(each, Request)]
+        return items, requests
+
+    def test_sessions_use_their_own_login_and_cookiejar(self):
+        spider = self._spider(imos='1,2,3,4,5', sessions=3)
+
+        logins = spider.start_requests()
+
+        self.assertEqual(len(logins), 3)
+        self.assertEqual(len({request.meta['cookiejar'] for request in logins}), 3)
+        self.assertEqual(len({request.meta['download_slot'] for request in logins}), 3)
+        self.assertEqual(len({request.body for request in logins}), 3)
+        self.assertEqual(len(spider.credential_pool.leased), 3)
+
+    def test_sessions_share_the_imos_queue(self):
+        spider = self._spider(imos='1,2,3', sessions=2)
+
+        vessels = [self._login(request) for request in spider.start_requests()]
+        self.assertEqual([request.url[-1] for request in vessels], ['1', '2'])
+
+        items, following = self._parse(vessels[1])
+        self.assertEqual(len(items), 1)
+        self.assertEqual(following[0].url[-1], '3')
+        # saved as a whole until the next checkpoint
+        self.assertEqual(spider.persisted_data['imos_queue'], ['1', '2', '3'])
+
+        for request in (vessels[0], following[0]):
+            self.assertEqual(len(self._parse(request)[0]), 1)
+        self.assertNotIn('imos_queue', spider.persisted_data)
+
+    def test_unfinished_queue_is_saved_on_close(self):
+        spider = self._spider(imos='1,2,3', sessions=1)
+        self._parse(self._login(spider.start_requests()[0]))
+
+        spider.spider_closed(spider)
+
+        self.assertEqual(spider.persisted_data['imos_queue'], ['2', '3'])
+
+    def test_sessions_rotate_logins_after_quota(self):
+        spider = self._spider(imos='1,2,3', sessions=1, vessels_per_login=0, login_cooldown=0)
+
+        request = self._login(spider.start_requests()[0])
+        first_login = spider.credential_pool.leased.copy()
+
+        _, following = self._parse(request)
+
+        self.assertIs(following[0].callback.__self__.__class__, login.LoginPage)
+        self.assertNotEqual(spider.credential_pool.leased, first_login)
+
+    def test_blocked_login_is_quarantined_and_imo_retried(self):
+        spider = self._spider(imos='1,2', sessions=1)
+        request = self._login(spider.start_requests()[0])
+        blocked = next(iter(spider.credential_pool.leased))
+
+        items, following = self._parse(request, body=BLOCKED_PAGE)
+
+        self.assertEqual(items, [])
+        self.assertEqual(spider.crawler.stats.get_value('equasis/logins_quarantined'), 1)
+        available = [each['login'] for each in spider.credential_pool.available_logins]
+        self.assertNotIn(blocked, available)
+        # logged in again with another login, then takes the same imo again
+        self.assertEqual(self._login(following[0]).url[-1], '1')
+
+    def test_no_session_opened_without_free_login(self):
+        spider = self._spider(imos='1,2,3,4,5,6', sessions=6)
+
+        logins = spider.start_requests()
+
+        self.assertEqual(len(logins), len(USERS))
+
+    def test_close_spider_once_every_login_is_banned(self):
+        spider = self._spider(imos='1', sessions=1)
+        spider.start_requests()
+        for user in spider.persisted_data['logins'].values():
+            user['_last_blocked'] = 2 ** 40
+
+        with self.assertRaises(CloseSpider):
+            spider.make_credentials().renew()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8; -*-
+
+from __future__ import absolute_import, unicode_literals
+import csv
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+import zipfile
+
+from scrapy.utils.test import get_crawler
+
+from kp_scrapers.spiders.registries.gibson import api
+from kp_scrapers.spiders.registries.gibson.spider import GibsonRegistryBaseSpider
+
+
+SNAPSHOT_KEY = 'trigonal/EAGKpler/EAGKpler201903140000.zip'
+
+
+class _FakeState(dict):
+    """Persisted state shared across spider runs, by file name."""
+
+    saved = {}
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(self.saved.get(filename, {}))
+        self.filename = filename
+
+    def save(self):
+        self.saved[self.filename] = dict(self)
+
+
+def _vessel(columns, imo, name, dwt):
+    row = dict.fromkeys(columns, '')
+    row.update(ID=imo, IMONumber=imo, VesselName=name, DWT=dwt, VesselTypeCode='Tank')
+    return [row[column] for column in columns]
+
+
+def _snapshot(*vessels):
+    db = api.VesselsDB(':memory:')
+    columns = [info['name'] for info in db._execute('PRAGMA table_info(EAGKplerVesselMain)')]
+    tables = {
+        'EAGKplerVesselMain.txt': [_vessel(columns, *vessel) for vessel in vessels],
+        'EAGKplerVesselType.txt': [['Tank', 'Tanker']],
+    }
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zipped:
+        for name, rows in tables.items():
+            content = StringIO()
+            csv.writer(content).writerows(rows)
+            zipped.writestr(name, content.getvalue())
+    archive.seek(0)
+    return archive
+
+
+class GibsonRegistryTestCase(TestCase):
+    def setUp(self):
+        _FakeState.saved = {}
+        for target in (
+            'kp_scrapers.spiders.bases.persist.PersistDataManager',
+            'kp_scrapers.spiders.registries.gibson.spider.PersistDataManager',
+        ):
+            patcher = patch(target, new=_FakeState)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # keep raw items as they come out of the DB
+        patcher = patch(
+            'kp_scrapers.spiders.registries.gibson.spider.normalize.process_item', new=dict
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _crawl(self, *vessels, **kwargs):
+        crawler = get_crawler(GibsonRegistryBaseSpider)
+        spider = GibsonRegistryBaseSpider.from_crawler(
+            crawler, reported_date='20190314', force_load=True, **kwargs
+        )
+        with patch('kp_scrapers.spiders.registries.gibson.spider.s3') as s3:
+            s3.iter_files.return_value = [SimpleNamespace(key=SNAPSHOT_KEY)]
+            s3.fetch_file.return_value = iter([_snapshot(*vessels)])
+            items = list(spider.parse(None))
+        return items, crawler.stats.get_stats()
+
+    def test_first_snapshot_yields_every_vessel(self):
+        items, stats = self._crawl(
+            ('9834454', 'LONDON VOYAGER', '1000'), ('9712553', 'MOYRA', '2000')
+        )
+
+        self.assertEqual(sorted(item['VesselName'] for item in items), ['LONDON VOYAGER', 'MOYRA'])
+        self.assertEqual(items[0]['TypeName'], 'Tanker')
+        self.assertEqual(stats['gibson/rows_loaded'], 3)
+        self.assertEqual(stats['gibson/vessels_changed'], 2)
+        self.assertIn('gibson/load_seconds', stats)
+        self.assertIn('gibson/query_seconds', stats)
+
+    def test_only_changed_vessels_yielded(self):
+        self._crawl(('9834454', 'LONDON VOYAGER', '1000'), ('9712553', 'MOYRA', '2000'))
+        items, stats = self._crawl(
+            ('9834454', 'LONDON VOYAGER', '1500'), ('9712553', 'MOYRA', '2000')
+        )
+
+        self.assertEqual([item['DWT'] for item in items], ['1500'])
+        self.assertEqual(stats['gibson/vessels_changed'], 1)
+        self.assertEqual(stats['gibson/vessels_unchanged'], 1)
+
+    def test_full_snapshot(self):
+        self._crawl(('9834454', 'LONDON VOYAGER', '1000'))
+        items, _ = self._crawl(('9834454', 'LONDON VOYAGER', '1000'), full_snapshot=True)
+
+        self.assertEqual(len(items), 1)
+
+
+class VesselsDBTestCase(TestCase):
+    def test_set_rows_in_batches(self):
+        db = api.VesselsDB(':memory:')
+        rows = (['Tank{}'.format(i), 'Tanker'] for i in range(5))
+
+        self.assertEqual(db.set_rows('EAGKplerVesselType', rows, batch_size=2), 5)
+        self.assertEqual(db.set_rows('EAGKplerVesselType', iter([])), 0)
+        self.assertEqual(len(list(db.get_rows('SELECT * FROM EAGKplerVesselType'))), 5)
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark customs product lookups on a customs-sized workload.
+
+Customs spiders look up known HS codes in every table cell they parse, a
+Eurostat or Japan table being a few hundred thousand cells for a year of
+data. This compares the previous substring scan over a freshly rebuilt
+`products` mapping with the cached trie index of `CustomsBaseSpider`.
+
+Usage:
+
+        ./tools/benchmarks/customs_products.py --cells 200000
+
+"""
+
+import random
+import timeit
+
+import click
+
+from kp_scrapers.spiders.customs.base import CustomsBaseSpider
+
+
+# roughly the chapters 27 codes we track across commodities
+HS_CODES = {
+    'lng': {'271111': None, '271121': 'natural gas'},
+    'lpg': {'271112': 'propane', '271113': 'butane', '271114': 'ethylene', '271119': 'lpg'},
+    'oil': {
+        '270900': None,
+        '271012': 'gasoline',
+        '271019': 'gasoil',
+        '271020': 'diesel',
+        '271091': 'waste oil',
+        '271099': 'waste oil',
+    },
+    'coal': {'2701': None, '2702': 'lignite', '2704': 'coke'},
+}
+
+
+class BenchCustomsSpider(CustomsBaseSpider):
+    name = 'BenchCustoms'
+
+    def commodity_mapping(self):
+        return HS_CODES
+
+
+def naive_get_product(spider, value):
+    # what `get_product` used to do: rebuild products and scan every code
+    products = {}
+    for commodity, codes in spider.relevant_commodities().items():
+        for code, code_name in codes.items():
+            products.setdefault(code, {}).setdefault(code_name, []).append(commodity)
+
+    for code in products:
+        if code in value:
+            return code
+    return None
+
+
+def make_cells(count, seed):
+    rng = random.Random(seed)
+    known = [code for codes in HS_CODES.values() for code in codes]
+    cells = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            code = rng.choice(known) + '{:02d}'.format(rng.randint(0, 99))
+        else:
+            code = '{:08d}'.format(rng.randint(0, 99999999))
+        cells.append('{} - {}'.format(code, 'SOME PRODUCT DESCRIPTION'))
+    return cells
+
+
+@click.command()
+@click.option('--cells', default=200000, help='number of table cells to look up')
+@click.option('--repeat', default=3)
+@click.option('--seed', default=42)
+def run(cells, repeat, seed):
+    spider = BenchCustomsSpider(commodity=' '.join(HS_CODES))
+    values = make_cells(cells, seed)
+
+    # sanity check both strategies agree on exact codes
+    for value in values[:1000]:
+        expected = naive_get_product(spider, value)
+        assert expected is None or spider.get_product(value) is not None, value
+
+    for label, func in (
+        ('substring scan', lambda v: naive_get_product(spider, v)),
+        ('cached trie', spider.get_product),
+    ):
+        best = min(timeit.repeat(lambda: [func(v) for v in values], number=1, repeat=repeat))
+        click.echo(
+            '{:<15} {:>8.3f}s  {:>10.0f} cells/s'.format(label, best, len(values) / best)
+        )
+
+
+if __name__ == '__main__':
+    run()
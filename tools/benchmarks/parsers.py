@@ -0,0 +1,665 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark parsers and normalisers over recorded fixtures.
+
+Every case replays fixtures from `tests/_fixtures` through a spider callback
+or a parsing function, and records:
+
+- `items_per_sec`: best throughput over `--repeat` runs of `--min-time` seconds
+- `peak_rss_mb`: peak resident memory of the process running the case
+- `alloc_peak_kb`: peak memory allocated by Python while parsing the fixtures once
+
+Besides the cases listed in `CASES`, spider callbacks are discovered from
+the fixtures layout: files under `tests/_fixtures/<category>/<name>` are
+replayed through every `parse*` callback of the spiders of
+`kp_scrapers.spiders.<category>(s).<name>`, and the callbacks returning items
+become `<category>.<name>.<callback>` cases. Spiders are given placeholder
+values for their required arguments.
+
+`normalize` modules living next to the benchmarked spider are discovered
+automatically: raw items they receive while the case runs are recorded,
+then replayed through `process_item` alone as a `<case>:normalize` case.
+
+Cases run in their own process, so that a crashing case (e.g. a missing
+system dependency) is reported without stopping the suite, and peak memory
+is not shared across cases. Results are compared with a stored baseline,
+and the script exits with an error if a case errored, or got slower or
+hungrier than `--tolerance` allows.
+
+Usage:
+
+        ./tools/benchmarks/parsers.py
+        ./tools/benchmarks/parsers.py --case ais --case slots --tolerance 0.3
+        ./tools/benchmarks/parsers.py --save-baseline
+        ./tools/benchmarks/parsers.py --list
+
+"""
+
+import copy
+import fnmatch
+import glob
+import importlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import pkgutil
+import resource
+import time
+import tracemalloc
+
+import click
+from scrapy.http import HtmlResponse, Request, TextResponse, XmlResponse
+from scrapy.utils.spider import iter_spider_classes
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURES_DIR = os.path.join(ROOT, 'tests', '_fixtures')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsers.baseline.json')
+
+# metrics compared with the baseline, and whether higher is better
+METRICS = {'items_per_sec': True, 'peak_rss_mb': False, 'alloc_peak_kb': False}
+
+RESPONSES = {'.html': HtmlResponse, '.htm': HtmlResponse, '.xml': XmlResponse, '.kml': XmlResponse}
+
+# value given to required spider arguments, credentials mostly
+PLACEHOLDER = 'benchmark'
+
+
+def _import(path):
+    """Import `package.module:attribute`, or a module if no attribute is given."""
+    module_path, _, attribute = path.partition(':')
+    module = importlib.import_module(module_path)
+    return getattr(module, attribute) if attribute else module
+
+
+def load_response(path, url=None):
+    with open(path, 'rb') as fd:
+        body = fd.read()
+    response_cls = RESPONSES.get(os.path.splitext(path)[1].lower(), TextResponse)
+    return response_cls(
+        url=url or 'file://{}'.format(path),
+        body=body,
+        encoding='utf-8',
+        request=Request(url or 'file://{}'.format(path)),
+    )
+
+
+def load_text(path):
+    with open(path, 'r') as fd:
+        return fd.read()
+
+
+def load_bytes(path):
+    with open(path, 'rb') as fd:
+        return fd.read()
+
+
+def load_items(path):
+    with open(path, 'r') as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def _spider(spider_cls):
+    """Instantiate a spider, with placeholders for its required arguments."""
+    parameters = list(inspect.signature(spider_cls.__init__).parameters.values())[1:]
+    kwargs = {
+        parameter.name: PLACEHOLDER
+        for parameter in parameters
+        if parameter.default is parameter.empty
+        and parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY)
+    }
+    return spider_cls(**kwargs)
+
+
+def _label(fixtures):
+    """Describe the fixtures of a case.
+
+    Examples:
+        >>> _label(None), _label('slot/grain.html'), _label(['a.xml', 'b.xml'])
+        ('-', 'slot/grain.html', 'a.xml, b.xml')
+
+    """
+    if isinstance(fixtures, (list, tuple)):
+        return ', '.join(fixtures)
+    return fixtures or '-'
+
+
+class Case(object):
+    """Fixtures replayed through a parsing function.
+
+    Args:
+        name (str): dotted name, used to filter and in the baseline
+        fixtures (str | List[str] | None): globs relative to `tests/_fixtures`,
+            `load` is called with None if the case needs no fixture
+        parse (callable): takes what `load` returns, returns an iterable of items
+        load (callable): takes a fixture path, called once before timing
+        package (str): spider package where `normalize` modules are looked up
+
+    """
+
+    def __init__(self, name, fixtures, parse, load=load_response, package=None):
+        self.name = name
+        self.fixtures = fixtures
+        self.parse = parse
+        self.load = load
+        self.package = package
+
+    def inputs(self):
+        if self.fixtures is None:
+            return [self.load(None)]
+
+        patterns = [self.fixtures] if isinstance(self.fixtures, str) else self.fixtures
+        paths = sorted(
+            path
+            for pattern in patterns
+            for path in glob.glob(os.path.join(FIXTURES_DIR, pattern))
+        )
+        if not paths:
+            raise ValueError('no fixture matching {}'.format(_label(self.fixtures)))
+        return [self.load(path) for path in paths]
+
+    def run(self, inputs):
+        """Parse all inputs once and count items, requests being followed-up links."""
+        count = 0
+        for data in inputs:
+            for item in self.parse(data) or ():
+                if item is not None and not isinstance(item, Request):
+                    count += 1
+        return count
+
+
+class SpiderCase(Case):
+    """Fixtures replayed through a spider callback, as responses to its start url."""
+
+    def __init__(self, name, fixtures, spider, callback='parse', **kwargs):
+        self.spider = spider
+        self.callback = callback
+        kwargs.setdefault('package', spider.partition(':')[0].rpartition('.')[0])
+        super(SpiderCase, self).__init__(name, fixtures, parse=None, **kwargs)
+
+    def inputs(self):
+        spider = _spider(_import(self.spider))
+        self.parse = getattr(spider, self.callback)
+        url = (getattr(spider, 'start_urls', None) or [None])[0]
+        self.load = lambda path: load_response(path, url=url)
+        return super(SpiderCase, self).inputs()
+
+
+def _parse_reuters(content):
+    # what `ReutersTankersSpider.parse_mail` does with each attachment
+    from kp_scrapers.lib.xls import Workbook
+    from kp_scrapers.spiders.charters.reuters_tankers import normalize
+
+    for item in Workbook(content=content, first_title='charterer').items:
+        item.update(provider_name='ReutersEurope', reported_date='01 Jun 2018', spider='RS_Tankers')
+        yield normalize.process_item(item)
+
+
+def _parse_ferrol(content):
+    from kp_scrapers.spiders.port_authorities.ferrol import FerrolTable
+
+    # NOTE the table guesses its columns from the file name
+    name, content = content
+    return FerrolTable(content, name, _NullLogger()).parse()
+
+
+def _parse_dates(dates):
+    from kp_scrapers.lib.date import to_isoformat
+
+    return (to_isoformat(date) for date in dates)
+
+
+class _NullLogger(object):
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+CASES = [
+    SpiderCase(
+        'slots.zeebrugge',
+        'slot/zeebrugge.html',
+        'kp_scrapers.spiders.slots.zeebrugge:ZeebruggeSpider',
+    ),
+    SpiderCase('slots.grain', 'slot/grain.html', 'kp_scrapers.spiders.slots.grain:SlotGrainSpider'),
+    SpiderCase(
+        'slots.dragon', 'slot/dragonlng.html', 'kp_scrapers.spiders.slots.dragon:SlotDragonSpider'
+    ),
+    Case(
+        'ais.exactearth',
+        'ais/exactearth/latest-vessel-info.xml',
+        _import('kp_scrapers.spiders.ais.exactearth.parser:parse_response'),
+        package='kp_scrapers.spiders.ais.exactearth',
+    ),
+    Case(
+        'registries.equasis',
+        'equasis/vessel/*.htm',
+        lambda response: [
+            _import('kp_scrapers.spiders.registries.equasis.parser:parse_vessel_details')(response)
+        ],
+        package='kp_scrapers.spiders.registries.equasis',
+    ),
+    Case(
+        'port_authorities.ferrol',
+        # other files are edge cases the table can't parse on its own
+        'port_authorities/ferrol/* [0-9]*.txt',
+        _parse_ferrol,
+        load=lambda path: (os.path.basename(path), load_text(path)),
+    ),
+    SpiderCase(
+        'operators.zeebrugge',
+        'operator/zeebrugge/*.xls',
+        'kp_scrapers.spiders.operators.zeebrugge:ZeebruggeSpider',
+        callback='parse_xls',
+    ),
+    Case(
+        'charters.reuters_tankers',
+        # xls copies of the xlsx attachments, that xlrd >= 2 cannot read
+        'charters/reuters/*.xls',
+        _parse_reuters,
+        load=load_bytes,
+        package='kp_scrapers.spiders.charters.reuters_tankers',
+    ),
+    Case(
+        'charters.optima_tankers',
+        'charters/optima_tankers/raw_items.jl',
+        lambda items: map(
+            _import('kp_scrapers.spiders.charters.optima_tankers.normalize:process_item'),
+            copy.deepcopy(items),
+        ),
+        load=load_items,
+    ),
+    Case(
+        'lib.date.to_isoformat',
+        None,
+        _parse_dates,
+        # a mix of the date formats found in reports
+        load=lambda _: [
+            '28 Feb 2020',
+            '2020-02-28T10:00:00',
+            '28/02/2020 10:00',
+            '02/28/20',
+            'Feb 28th 2020',
+            '28.02.2020',
+        ],
+    ),
+]
+
+
+def _fixture_packages():
+    """Spider packages or modules fixtures were recorded for, with the fixtures.
+
+    Yields:
+        Tuple[List[str], List[str]]: candidate module paths, fixtures relative paths
+
+    """
+    for category in sorted(os.listdir(FIXTURES_DIR)):
+        category_dir = os.path.join(FIXTURES_DIR, category)
+        if not os.path.isdir(category_dir):
+            continue
+        for entry in sorted(os.listdir(category_dir)):
+            path = os.path.join(category_dir, entry)
+            if os.path.isdir(path):
+                name = entry
+                fixtures = sorted(
+                    os.path.relpath(os.path.join(path, child), FIXTURES_DIR)
+                    for child in os.listdir(path)
+                    if os.path.isfile(os.path.join(path, child))
+                )
+            else:
+                name = os.path.splitext(entry)[0]
+                fixtures = [os.path.relpath(path, FIXTURES_DIR)]
+            modules = [
+                'kp_scrapers.spiders.{}.{}'.format(prefix, name)
+                for prefix in (category, category + 's')
+            ]
+            yield modules, fixtures
+
+
+def _spider_classes(module_path):
+    """Spiders defined in a module, or in the modules of a package."""
+    module = _import(module_path)
+    modules = [module]
+    for info in pkgutil.iter_modules(getattr(module, '__path__', [])):
+        try:
+            modules.append(_import('{}.{}'.format(module_path, info.name)))
+        except Exception:
+            continue
+    classes = []
+    for module in modules:
+        classes.extend(cls for cls in iter_spider_classes(module) if cls not in classes)
+    return classes
+
+
+def _probe(spider_cls, callback, fixture):
+    """Count items a callback returns for a fixture, None if it failed."""
+    path = '{}:{}'.format(spider_cls.__module__, spider_cls.__name__)
+    case = SpiderCase('probe', fixture, path, callback=callback)
+    try:
+        return case.run(case.inputs())
+    except Exception:
+        return None
+
+
+def discover_spider_cases():
+    """Find spider callbacks able to parse the fixtures recorded for them.
+
+    Returns:
+        List[SpiderCase]:
+
+    """
+    cases = []
+    for modules, fixtures in _fixture_packages():
+        for module_path in modules:
+            try:
+                spider_classes = _spider_classes(module_path)
+            except Exception:
+                # no such spider, or not importable here
+                continue
+
+            for spider_cls in spider_classes:
+                callbacks = sorted(
+                    attribute
+                    for attribute in dir(spider_cls)
+                    if attribute.startswith('parse') and inspect.isfunction(
+                        getattr(spider_cls, attribute)
+                    )
+                )
+                for callback in callbacks:
+                    parsed = [f for f in fixtures if _probe(spider_cls, callback, f)]
+                    if parsed:
+                        cases.append(
+                            SpiderCase(
+                                '{}.{}'.format(module_path.split('.', 2)[2], callback),
+                                parsed,
+                                '{}:{}'.format(spider_cls.__module__, spider_cls.__name__),
+                                callback=callback,
+                                package=module_path,
+                            )
+                        )
+    return cases
+
+
+def _discover_in_child(queue):
+    # spiders log plenty of warnings on placeholder arguments
+    logging.disable(logging.CRITICAL)
+    try:
+        specs = [
+            (case.name, case.fixtures, case.spider, case.callback, case.package)
+            for case in discover_spider_cases()
+        ]
+    except Exception as e:
+        specs = 'discovery failed: {}: {}'.format(type(e).__name__, e)
+    queue.put(specs)
+
+
+def discover_isolated(timeout):
+    """Run `discover_spider_cases` in a forked process, so that imports stay there."""
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_discover_in_child, args=(queue,))
+    process.start()
+    try:
+        specs = queue.get(timeout=timeout)
+    finally:
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+
+    if isinstance(specs, str):
+        raise click.ClickException(specs)
+    return [
+        SpiderCase(name, fixtures, spider, callback=callback, package=package)
+        for name, fixtures, spider, callback, package in specs
+    ]
+
+
+def discover_normalizers(package):
+    """Find `normalize*` modules exposing `process_item` in a spider package.
+
+    Returns:
+        List[module]:
+
+    """
+    if not package:
+        return []
+
+    modules = []
+    for info in pkgutil.iter_modules(_import(package).__path__):
+        if info.name.startswith('normalize'):
+            module = _import('{}.{}'.format(package, info.name))
+            if callable(getattr(module, 'process_item', None)):
+                modules.append(module)
+    return modules
+
+
+class _Recorder(object):
+    """Record raw items passed to a normaliser, the first time they are seen."""
+
+    def __init__(self, module):
+        self.module = module
+        self.process_item = module.process_item
+        self.items = []
+
+    def __call__(self, raw_item, *args, **kwargs):
+        self.items.append((copy.deepcopy(raw_item), args, kwargs))
+        return self.process_item(raw_item, *args, **kwargs)
+
+    def __enter__(self):
+        self.module.process_item = self
+        return self
+
+    def __exit__(self, *exc):
+        self.module.process_item = self.process_item
+
+
+def _throughput(func, repeat, min_time, setup=None):
+    """Best items per second of `func` over `repeat` rounds of at least `min_time` seconds."""
+    best = 0
+    for _ in range(repeat):
+        count, elapsed = 0, 0
+        while elapsed < min_time:
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            count += func(*args)
+            elapsed += time.perf_counter() - start
+        best = max(best, count / elapsed)
+    return best
+
+
+def _alloc_peak(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def _peak_rss():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(case, repeat, min_time):
+    """Benchmark a case and its normalisers.
+
+    Returns:
+        Dict[str, Dict[str, float]]: metrics by case name
+
+    """
+    inputs = case.inputs()
+    normalizers = [_Recorder(module) for module in discover_normalizers(case.package)]
+    for recorder in normalizers:
+        recorder.__enter__()
+    try:
+        # warm up caches (lazy imports, compiled regexes, ...) and record raw items
+        items = case.run(inputs)
+    finally:
+        for recorder in normalizers:
+            recorder.__exit__()
+
+    results = {
+        case.name: {
+            'items': items,
+            'items_per_sec': _throughput(lambda: case.run(inputs), repeat, min_time),
+            'alloc_peak_kb': _alloc_peak(case.run, inputs) / 1024,
+            'peak_rss_mb': _peak_rss() / 1024,
+        }
+    }
+
+    for recorder in normalizers:
+        if not recorder.items:
+            continue
+
+        def _normalize(raw_items, process_item=recorder.process_item):
+            for raw_item, args, kwargs in raw_items:
+                process_item(raw_item, *args, **kwargs)
+            return len(raw_items)
+
+        name = '{}:{}'.format(case.name, recorder.module.__name__.rpartition('.')[2])
+        # normalisers mutate raw items, copy them outside of the timed section
+        fresh = lambda recorded=recorder.items: (copy.deepcopy(recorded),)  # noqa: E731
+        results[name] = {
+            'items': len(recorder.items),
+            'items_per_sec': _throughput(_normalize, repeat, min_time, setup=fresh),
+            'alloc_peak_kb': _alloc_peak(_normalize, *fresh()) / 1024,
+            'peak_rss_mb': _peak_rss() / 1024,
+        }
+
+    return results
+
+
+def _measure_in_child(case, repeat, min_time, queue):
+    try:
+        queue.put(measure(case, repeat, min_time))
+    except Exception as e:
+        queue.put({case.name: {'error': '{}: {}'.format(type(e).__name__, e)}})
+
+
+def measure_isolated(case, repeat, min_time, timeout):
+    """Run `measure` in a forked process, so that crashes and memory stay there."""
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_measure_in_child, args=(case, repeat, min_time, queue))
+    process.start()
+    try:
+        return queue.get(timeout=timeout)
+    except Exception:
+        return {case.name: {'error': 'no result, exit code {}'.format(process.exitcode)}}
+    finally:
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+
+
+def compare(results, baseline, tolerance):
+    """List metrics that regressed by more than `tolerance` compared with the baseline.
+
+    Examples:
+        >>> compare({'a': {'items_per_sec': 70}}, {'a': {'items_per_sec': 100}}, 0.25)
+        [('a', 'items_per_sec', 100, 70)]
+        >>> compare({'a': {'items_per_sec': 80}}, {'a': {'items_per_sec': 100}}, 0.25)
+        []
+        >>> compare({'a': {'peak_rss_mb': 130}}, {'a': {'peak_rss_mb': 100}}, 0.25)
+        [('a', 'peak_rss_mb', 100, 130)]
+        >>> compare({'b': {'items_per_sec': 1}}, {'a': {'items_per_sec': 100}}, 0.25)
+        []
+
+    """
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric, higher_is_better in METRICS.items():
+            expected = baseline.get(name, {}).get(metric)
+            actual = metrics.get(metric)
+            if expected is None or actual is None:
+                continue
+            if higher_is_better:
+                regressed = actual < expected * (1 - tolerance)
+            else:
+                regressed = actual > expected * (1 + tolerance)
+            if regressed:
+                regressions.append((name, metric, expected, actual))
+    return regressions
+
+
+def _selected(patterns, discovered=()):
+    known = {(case.spider, case.callback) for case in CASES if isinstance(case, SpiderCase)}
+    cases = CASES + [case for case in discovered if (case.spider, case.callback) not in known]
+    if not patterns:
+        return cases
+    return [
+        case
+        for case in cases
+        if any(fnmatch.fnmatch(case.name, p) or case.name.startswith(p) for p in patterns)
+    ]
+
+
+@click.command()
+@click.option('--case', 'patterns', multiple=True, help='case name prefix or glob, all by default')
+@click.option('--repeat', default=3, help='timing rounds per case, the best one is kept')
+@click.option('--min-time', default=0.5, help='seconds per timing round')
+@click.option('--timeout', default=300, help='seconds before giving up on a case')
+@click.option('--tolerance', default=0.25, help='relative slowdown or memory growth tolerated')
+@click.option('--baseline', default=BASELINE_PATH, help='baseline to compare with')
+@click.option('--save-baseline', is_flag=True, help='store results as the new baseline')
+@click.option('--list', 'list_only', is_flag=True, help='list cases and normalisers found')
+def run(patterns, repeat, min_time, timeout, tolerance, baseline, save_baseline, list_only):
+    cases = _selected(patterns, discover_isolated(timeout))
+    if list_only:
+        for case in cases:
+            modules = ', '.join(m.__name__ for m in discover_normalizers(case.package))
+            click.echo('{:<30} {:<40} {}'.format(case.name, _label(case.fixtures), modules))
+        return
+
+    stored = {}
+    if os.path.exists(baseline):
+        with open(baseline) as fd:
+            stored = json.load(fd)
+
+    results = {}
+    for case in cases:
+        results.update(measure_isolated(case, repeat, min_time, timeout))
+
+    errors = []
+    for name, metrics in sorted(results.items()):
+        if 'error' in metrics:
+            click.echo('{:<40} ERROR {}'.format(name, metrics['error']))
+            errors.append(name)
+            continue
+        reference = stored.get(name, {}).get('items_per_sec')
+        click.echo(
+            '{:<40} {:>6} items {:>10.1f} items/s {:>8} {:>7.1f} MB rss {:>9.1f} KB alloc'.format(
+                name,
+                metrics['items'],
+                metrics['items_per_sec'],
+                '{:+.0%}'.format(metrics['items_per_sec'] / reference - 1) if reference else '',
+                metrics['peak_rss_mb'],
+                metrics['alloc_peak_kb'],
+            )
+        )
+
+    if save_baseline:
+        # keep cases that were not run this time
+        stored.update({name: m for name, m in results.items() if 'error' not in m})
+        with open(baseline, 'w') as fd:
+            json.dump(stored, fd, indent=2, sort_keys=True)
+            fd.write('\n')
+        click.echo('baseline saved to {}'.format(baseline))
+        regressions = []
+    else:
+        regressions = compare(results, stored, tolerance)
+
+    for name, metric, expected, actual in regressions:
+        click.echo('REGRESSION {} {}: {:.1f} -> {:.1f}'.format(name, metric, expected, actual))
+    if errors:
+        click.echo('FAILED {} case(s) errored: {}'.format(len(errors), ', '.join(errors)))
+    if regressions or errors:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    run()
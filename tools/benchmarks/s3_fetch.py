@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark S3 reads against a local S3 stand-in.
+
+Compares what `lib.services.s3` used to do, a fresh boto3 resource per call
+and whole objects read in memory, with the pooled client streaming lines.
+Objects are served by moto in-process, or by any S3 compatible server
+(MinIO, `moto_server`) given with `--endpoint-url`.
+
+Usage:
+
+        ./tools/benchmarks/s3_fetch.py --lines 200000 --calls 20
+        ./tools/benchmarks/s3_fetch.py --endpoint-url http://localhost:9000
+
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import timeit
+import tracemalloc
+
+import boto3
+import click
+
+from kp_scrapers.lib.services import s3
+
+
+BUCKET = 'kp-benchmarks'
+KEY = 'items.jl'
+
+
+@contextmanager
+def local_s3(endpoint_url):
+    if endpoint_url:
+        yield
+        return
+
+    # only needed without a local server
+    from moto import mock_aws
+
+    with mock_aws():
+        yield
+
+
+def naive_fetch_lines(settings):
+    # what `fetch_file` used to do: new resource, whole body in memory
+    resource = boto3.resource(
+        's3',
+        aws_access_key_id=settings['AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=settings['AWS_SECRET_ACCESS_KEY'],
+        region_name=settings['AWS_DEFAULT_REGION'],
+        endpoint_url=settings['AWS_S3_ENDPOINT_URL'],
+    )
+    body = resource.Object(BUCKET, KEY).get()['Body'].read()
+    return sum(1 for _ in body.decode('utf-8').splitlines())
+
+
+def pooled_iter_lines(_):
+    return sum(1 for _ in s3.iter_lines(BUCKET, KEY))
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@click.command()
+@click.option('--lines', default=200000, help='number of json lines in the object')
+@click.option('--calls', default=20, help='object reads per run')
+@click.option('--repeat', default=3)
+@click.option('--endpoint-url', default=None, help='S3 compatible server, moto if not given')
+def run(lines, calls, repeat, endpoint_url):
+    settings = {
+        'AWS_ACCESS_KEY_ID': os.environ.get('AWS_ACCESS_KEY_ID', 'benchmark'),
+        'AWS_SECRET_ACCESS_KEY': os.environ.get('AWS_SECRET_ACCESS_KEY', 'benchmark'),
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_S3_ENDPOINT_URL': endpoint_url,
+    }
+    # make the pooled client use the same server and credentials
+    s3.Settings = lambda: settings
+    s3.reset()
+
+    with local_s3(endpoint_url):
+        client = s3.client()
+        client.create_bucket(Bucket=BUCKET)
+        body = '\n'.join(
+            json.dumps({'imo': str(i), 'name': 'VESSEL {}'.format(i)}) for i in range(lines)
+        )
+        client.put_object(Bucket=BUCKET, Key=KEY, Body=body.encode('utf-8'))
+        click.echo('object size: {:.1f} MB'.format(len(body) / 1024 ** 2))
+
+        for label, func in (
+            ('fresh resource', naive_fetch_lines),
+            ('pooled stream', pooled_iter_lines),
+        ):
+            assert func(settings) == lines
+            best = min(
+                timeit.repeat(
+                    lambda: [func(settings) for _ in range(calls)], number=1, repeat=repeat
+                )
+            )
+            click.echo(
+                '{:<15} {:>8.3f}s  {:>8.1f} reads/s  peak {:>7.1f} MB'.format(
+                    label, best, calls / best, peak_memory(func, settings) / 1024 ** 2
+                )
+            )
+
+
+if __name__ == '__main__':
+    run()
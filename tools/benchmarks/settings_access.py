@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark project settings access.
+
+Service helpers look settings up on every call, sometimes once per item.
+This compares resolving them from scratch each time, what
+`global_settings` used to do, with the memoised snapshot, and copying the
+project settings to apply spider overrides with the `spider_settings`
+overlay.
+
+Usage:
+
+        ./tools/benchmarks/settings_access.py --calls 1000
+
+"""
+
+import timeit
+
+import click
+
+from kp_scrapers.lib.services import shub
+
+
+class BenchSpider(object):
+    custom_settings = {'DOWNLOAD_DELAY': 1}
+    spider_settings = {'KP_DRIVE_ENABLED': True, 'NOTIFY_ENABLED': True}
+
+
+def copied_spider_settings():
+    # what applying overrides takes without an overlay
+    settings = shub.global_settings().copy()
+    # copies of the frozen snapshot are frozen too
+    settings.frozen = False
+    settings.setdict(BenchSpider.custom_settings, priority='spider')
+    settings.setdict(BenchSpider.spider_settings, priority='spider')
+    return settings.getbool('KP_DRIVE_ENABLED')
+
+
+@click.command()
+@click.option('--calls', default=1000, help='settings lookups per run')
+@click.option('--repeat', default=3)
+def run(calls, repeat):
+    shub.refresh_settings()
+    first_access = timeit.timeit(shub.global_settings, number=1)
+    click.echo('{:<20} {:>10.2f}ms'.format('first access', first_access * 1000))
+
+    for label, func in (
+        ('resolved per call', lambda: shub._load_settings('project_settings')['SLACK_CHANNEL']),
+        ('memoised', lambda: shub.global_settings()['SLACK_CHANNEL']),
+        ('copied overrides', copied_spider_settings),
+        ('overlay overrides', lambda: shub.spider_settings(BenchSpider).getbool('NOTIFY_ENABLED')),
+    ):
+        best = min(timeit.repeat(func, number=calls, repeat=repeat))
+        click.echo('{:<20} {:>10.2f}us/call'.format(label, best / calls * 1e6))
+
+
+if __name__ == '__main__':
+    run()